@@ -12,12 +12,20 @@ import itertools
 import difflib
 import math
 import time
+import random
 import datetime
+import multiprocessing
 import models.clockmanager
 import models.project
 import models.supseq
+import models.annealing
+import models.lowerbound
+import models.phrasepool
+import models.firmware
+import models.powersim
 import models.clockface
 import models.virtualclock
+import models.facerenderer
 
 
 __author__ = "Mac Ryan"
@@ -79,6 +87,8 @@ class Core(object):
 
         # Initialise attributes
         self.vclock = None
+        self.cface = None
+        self.phrase_pool = None  # phrases of the current clock, see below
 
         # The debug mode of using the class is command-line only...
         if debug == True:
@@ -100,51 +110,81 @@ class Core(object):
             triplet = "(%d, %.1f, %d)" % triplet
         return triplet
 
-    def _get_alternatives(self, phrases, position):
+    def _shuffle(self, items, rng=None):
+        '''
+        Return the items of an unordered collection (set, dict keys...) as
+        a list. The order is that of the iteration, unless a random.Random
+        "rng" is given: then the items are sorted and shuffled with it, so
+        that the ties of the heuristic are broken reproducibly by its seed.
+        '''
+        if rng == None:
+            return list(items)
+        items = sorted(items)
+        rng.shuffle(items)
+        return items
+
+    def _get_multi_start_report(self, results):
+        '''
+        Return a human-readable summary of the outcomes of
+        multi_start_sequence, "results" being a list of tuples (chars, seed,
+        sequence as dictionary).
+        '''
+        costs = sorted([r[0] for r in results])
+        best_cost, best_seed = min([r[:2] for r in results])
+        mean = float(sum(costs)) / len(costs)
+        deviation = math.sqrt(sum([(c - mean) ** 2 for c in costs]) /
+                              len(costs))
+        text = 'Runs: %d\n' % len(costs)
+        text += 'Chars (min, avg, max): (%d, %.1f, %d)\n' % (costs[0], mean,
+                                                             costs[-1])
+        text += 'Standard deviation: %.1f chars\n' % deviation
+        text += 'Best: %d chars with seed %d\n' % (best_cost, best_seed)
+        return text
+
+    def _get_alternatives(self, pool, phrases, position):
         '''
-        Return an ordered list of all the different unique words (sorted) that
-        are present in "phrases" at position "position".
+        Return an ordered list of all the different unique words (sorted
+        alphabetically) that are present in "phrases" at position "position".
+        - phrases: list of tuples of word ids of "pool"
         '''
-        return sorted(set([phrase[position] for phrase in phrases]))
+        return sorted(set([phrase[position] for phrase in phrases]),
+                      key=lambda word_id: pool.vocabulary[word_id])
 
     def _get_combination_number(self, pool_size, sample_size):
         '''
         Return the number of sample_size big combinations without repetition
         that can be formed from a pool of pool_size).
         '''
+        if sample_size > pool_size:
+            return 0
         f = lambda x: math.factorial(x)
         return f(pool_size)/(f(sample_size)*f(pool_size - sample_size))
 
-    def _get_orphans(self, phrases, families):
+    def _get_orphans(self, phrases, families, rng=None):
         '''
         Return the list of phrases which are not present in the family tree.
         (phrases is list, and families is list of lists)
+        - rng: random.Random shuffling the result (see _shuffle)
         '''
-        phrases = list(set(phrases))  #ensure no duplicates
-        for family in families:
-            for phrase in family:
-                try:
-                    phrases.remove(phrase)
-                except ValueError:  #in case phrase is not there...
-                    pass
-        return phrases
+        members = set(itertools.chain(*families))
+        return self._shuffle([phrase for phrase in set(phrases)
+                              if phrase not in members], rng)
 
-    def _get_isomorphic_families(self, phrases, callback=None):
+    def _get_isomorphic_families(self, phrases, callback=None, rng=None):
         '''
         Group together isomorphic sequences. That means that sentence A can
         be transformed in sentence B by applying the same opcodes needed to
         transform B into A. Return a list of lists.
+        - phrases: list of tuples of word ids (words are "atomic", which
+          prevents the analysis to get to char-based level)
         - callback is the function to invoke to update progress data in GUI
+        - rng: random.Random breaking the ties (see _shuffle)
         '''
         # The following is a property taht can be changed by the stop button
         # in the modal popup and that will halt the procedure.
         self.halt_heuristic = False
         # Make sure phrases are unique
-        phrases = list(set(phrases))
-        # We need to transform sentences into lists of words to make words
-        # "atomic" (i.e. to prevent the analysis to get to char-based level)
-        for i, phrase in enumerate(phrases):
-            phrases[i] = tuple(phrase.split())
+        phrases = self._shuffle(set(phrases), rng)
         # Progress monitor variables
         total = self._get_combination_number(len(phrases), 2)
         counter = 0
@@ -175,7 +215,7 @@ class Core(object):
         # Then eliminate multiple memberships of phrases to different families
         # by giving priorities to families with higher ratio and within those
         # with the same ratio, to those with higher number of members)
-        priority = [k for k in families]
+        priority = self._shuffle(families, rng)
         priority.sort(key=lambda x: len(families[x]), reverse=True) #fam. size
         priority.sort(key=lambda x: x[0], reverse=True) #affinity
         assigned_phrases = set()
@@ -183,14 +223,15 @@ class Core(object):
             families[key] = families[key].difference(assigned_phrases)
             assigned_phrases = assigned_phrases.union(families[key])
         # Beautify the output removing keys and empty or single member sets.
-        families = [tuple([' '.join(phrase) for phrase in family])
-                  for k, family in families.items() if len(family) > 1]
-        return families
+        families = [tuple(self._shuffle(family, rng))
+                    for k, family in families.items() if len(family) > 1]
+        return self._shuffle(families, rng)
 
-    def _get_isomorphic_supersequence(self, phrases):
+    def _get_isomorphic_supersequence(self, pool, phrases):
         '''
         Return the Shortest Common Supersequence between isomorphic phrases.
-        Atomic words.
+        Atomic words: phrases (and the returned supersequence) are tuples of
+        word ids of "pool".
         '''
         # The key of this passage is to insert variable words in the common
         # root in an ordered way. Because of the nature of the program, it is
@@ -198,31 +239,33 @@ class Core(object):
         # numbers. Creating supersequences where inserted numbers follow the
         # same pattern maximise the similitude between supersequences of
         # different families.
-        phrases = [tuple(phrase.split()) for phrase in phrases]
-        analyser = difflib.SequenceMatcher(None, phrases[0], phrases[1])
-        mblocks = analyser.get_matching_blocks()[:-1]
-        equal_positions = []
-        for i, j, l in mblocks:
-            for n in range(i, i+l):
-                equal_positions.append(n)
+        phrases = list(phrases)
+        # Isomorphic phrases have the same length: the common root is made
+        # of the positions with the same word in all of them (the matching
+        # blocks of a SequenceMatcher can pair words at different positions,
+        # depending on the order of the phrases)
+        equal_positions = [n for n in range(len(phrases[0]))
+                           if len(set([p[n] for p in phrases])) == 1]
         supersequence = []
         cursor = 0
         while cursor < len(phrases[0]):
             if cursor in equal_positions:
                 supersequence.append(phrases[0][cursor])
             else:
-                for alternative in self._get_alternatives(phrases, cursor):
+                for alternative in self._get_alternatives(pool, phrases,
+                                                          cursor):
                     supersequence.append(alternative)
             cursor += 1
-        return ' '.join(supersequence)
+        return tuple(supersequence)
 
-    def _merge_closest_match(self, phrases):
+    def _merge_closest_match(self, phrases, rng=None):
         '''
-        Modify in place phrases, merging the two most similar phrases in it.
+        Return phrases (tuples of word ids), with the two most similar of
+        them merged together.
+        - rng: random.Random breaking the ties (see _shuffle)
         '''
         # Make sure phrases are unique
-        phrases = list(set(phrases))
-        phrases = [phrase.split() for phrase in phrases]
+        phrases = [list(phrase) for phrase in self._shuffle(set(phrases), rng)]
         analyser = difflib.SequenceMatcher()
         # Find the closest pair
         closest = None
@@ -255,7 +298,7 @@ class Core(object):
         # "Closest" lists have been modified in place (within phrases list)
         # so we keep one and eliminate the other.
         phrases.remove(closest[2])
-        return [' '.join(phrase) for phrase in phrases]
+        return [tuple(phrase) for phrase in phrases]
 
     def _get_multiple_words(self, sequence):
         '''
@@ -279,10 +322,11 @@ class Core(object):
 
     def get_current_time(self):
         '''
-        Return a tuple in the form (hours, minutes) using system clock.
+        Return a tuple in the form (hours, minutes, seconds) using system
+        clock.
         '''
         now = datetime.datetime.now()
-        return (now.hour, now.minute)
+        return (now.hour, now.minute, now.second)
 
     def process_project_settings(self, settings):
         '''
@@ -293,6 +337,9 @@ class Core(object):
             if k in self.project.PRJ_STTNGS_PHRASES:
                 args = (prs['clock'], prs['resolution'], prs['approx_method'])
                 self.clock = self.clock_manager.get_clock_instance(*args)
+                self.phrase_pool = None
+                # Sequences loaded from disk regenerate their pool lazily
+                self.project.phrases_factory = self.get_phrase_pool
 
     def on_project_updated(self, widget, data=None):
         '''
@@ -305,24 +352,34 @@ class Core(object):
             return
         # If there is a project
         print('obvious')
+        # Settings first, as the clock is needed to process the sequence
+        if 'project_settings' in data:
+            self.process_project_settings(data['project_settings'])
         for k, v in data.items():
-            if k == 'project_settings':
-                self.process_project_settings(v)
-            elif k == 'supersequence' and self.vclock:
+            if k == 'supersequence' and self.vclock:
                 print('less obvious')
-                self.vclock = self.generate_vclock(self.vclock.drawing_area)
+                self.generate_vclock(self.vclock.drawing_area)
+
+    def get_phrase_pool(self):
+        '''
+        Return the PhrasePool of all the phrases of the current clock (it is
+        generated on the first call).
+        '''
+        if self.phrase_pool == None:
+            self.phrase_pool = models.phrasepool.PhrasePool.from_clock(
+                                                                    self.clock)
+        return self.phrase_pool
 
     def get_phrases_analysis(self):
         '''
         Returns an analysis of the complete set of time sentences.
         '''
         stats = []
-        phrase_list = self.clock.get_phrases_dump()
-        phrase_set = set(phrase_list)
-        word_set = set(' '.join(phrase_list).split())
+        phrase_set = set(self.clock.iter_unique_phrases())
+        word_set = set(' '.join(phrase_set).split())
 
         stats.append(("SENTENCES", ''))
-        n_phrases = len(phrase_list)
+        n_phrases = self.clock.get_frames_per_day()
         stats.append(("Number of sentences", n_phrases))
         n_unique_phrases = len(phrase_set)
         stats.append(("Number of unique sentences", n_unique_phrases))
@@ -349,6 +406,18 @@ class Core(object):
         stats.append(("Minimum board size (X, Y, extra cells)",
                       approx_board_size))
 
+        stats.append(("LOWER BOUND", ''))
+        bound = self.get_lower_bound()
+        stats.append(("Supersequence elements", bound.elements))
+        stats.append(("Supersequence chars", bound.chars))
+        stats.append(("Board size for the bound (X, Y, extra cells)",
+                      bound.get_panel_size()))
+        if self.project.supersequence:
+            chars = models.annealing.get_cost(self.project.supersequence)
+            stats.append(("Current supersequence chars", chars))
+            stats.append(("Gap to the lower bound (percent)",
+                          '%.1f' % bound.get_gap(chars)))
+
         # Generate text data
         text = ''
         col_width = max(map(len, [t for t, v in stats])) + 7
@@ -369,22 +438,62 @@ class Core(object):
         text += '\n' + textwrap.fill(textwrap.dedent(disclaimer), col_width)
         return text
 
+    def verify_firmware_table(self):
+        '''
+        Check the firmware table of the supersequence (see
+        SuperSequence.set_led_strings) against all the phrases of the clock.
+        Return a human-readable report.
+        '''
+        sequence = self.project.supersequence
+        if sequence == None or sequence.firmware_table == None:
+            return 'No firmware table to verify.\n'
+        frames = list(models.firmware.iter_clock_frames(self.clock))
+        mismatches = models.firmware.verify(sequence.firmware_table, sequence,
+                                            frames)
+        return models.firmware.get_verification_report(mismatches,
+                                                       len(frames))
+
+    def export_power_simulation(self, destination):
+        '''
+        Simulate the power needs of the clockface for all the frames of the
+        day, write the values of each frame as CSV to the "destination" file
+        and return a human-readable report.
+        '''
+        sequence = self.project.supersequence
+        if sequence == None or sequence.firmware_table == None:
+            return 'No firmware table to simulate.\n'
+        simulation = models.powersim.PowerSimulation(sequence,
+                    models.powersim.get_table_frames(sequence.firmware_table),
+                    sequence.led_specs)
+        file_ = open(destination, 'wb')
+        try:
+            simulation.write_csv(file_)
+        finally:
+            file_.close()
+        return simulation.get_report()
+
     def get_minimum_panel_size(self, chars):
         '''
         Return the closest panel size to a perfect square needed to contain
         chars. (Does NOT consider the need for non-truncating words)
         '''
-        root = int(math.sqrt(chars))
-        if root**2 >= chars:
-            x, y = root
-        elif (root+1)*root >= chars:
-            x, y = root+1, root
+        return models.lowerbound.get_panel_size(chars)
+
+    def get_lower_bound(self, phrases=None):
+        '''
+        Return the lower bounds on the supersequence (see the lowerbound
+        module) of the phrases (default: all the phrases of the current
+        clock).
+        - phrases: PhrasePool or list of strings
+        '''
+        if phrases == None:
+            pool = self.get_phrase_pool()
         else:
-            x, y = root+1, root+1
-        extra_cells = x*y-chars
-        return x, y, extra_cells
+            pool = models.phrasepool.as_pool(phrases)
+        return models.lowerbound.LowerBound(pool)
 
-    def get_sequence(self, phrases=None, force_rerun=False, callback=None):
+    def get_sequence(self, phrases=None, force_rerun=False, callback=None,
+                     seed=None):
         '''
         Return a common supersequence to all the phrases.
         The generation of the supersequence is done heuristically and there
@@ -392,7 +501,11 @@ class Core(object):
         If no phrases are passed as parameters, all the phrases for the
         currently active clock module will be used (so the supersequence
         will be able to display the entire day on the clock).
+        - phrases: PhrasePool or list of strings
         - callback is the function to invoke to update progress data in GUI
+        - seed: seed of the tie-breaks of the heuristic (default: ties are
+          broken by the iteration order of sets and dictionaries), see
+          multi_start_sequence
         See my own question on StackOverflow:
         http://stackoverflow.com/questions/5784945
         '''
@@ -400,10 +513,28 @@ class Core(object):
         # told so!
         if self.project.supersequence and force_rerun == False:
             return self.project.supersequence
-        # No phrases means... all phrases!!!
+        # No phrases means... all phrases!!! (repetitions are useless here)
         if phrases == None:
-            phrases = self.clock.get_phrases_dump()
-        original_phrases = phrases
+            pool = self.get_phrase_pool()
+        else:
+            pool = models.phrasepool.as_pool(phrases)
+        rng = random.Random(seed) if seed != None else None
+        sequence = self._build_sequence(pool, callback, rng)
+        if sequence == -1:
+            return -1
+        self.project.supersequence = sequence
+        self.project.broadcast_change()
+        # DONE!
+        return self.project.supersequence
+
+    def _build_sequence(self, pool, callback=None, rng=None):
+        '''
+        Run the heuristic of get_sequence and return the supersequence of
+        the PhrasePool "pool" (or -1 if halted by the user).
+        - rng: random.Random breaking the ties (see _shuffle)
+        '''
+        # All the stages work on tuples of word ids
+        phrases = [tuple(phrase) for phrase in pool.phrases]
         # If ran without GUI, create a sinkhole callback:
         if callback == None:
             callback = lambda **kwargs: None
@@ -416,15 +547,16 @@ class Core(object):
             pass_counter += 1
             callback(phase='Isomorphic grouping, pass %d' % pass_counter,
                      bar = 0)
-            families = self._get_isomorphic_families(phrases, callback)
+            families = self._get_isomorphic_families(phrases, callback, rng)
             if families == -1:
                 return -1
             if len(families) == 0:
                 break
-            orphans = self._get_orphans(phrases, families)
+            orphans = self._get_orphans(phrases, families, rng)
             supseqs = []
             for family in families:
-                supseqs.append(self._get_isomorphic_supersequence(family))
+                supseqs.append(self._get_isomorphic_supersequence(pool,
+                                                                  family))
             phrases = supseqs + orphans
         # SHRINKING BY SIMILARITY
         # Keep on merging the two most similar sentences in the pool until
@@ -432,47 +564,113 @@ class Core(object):
         callback(phase='Shrink by similarity', time='Not much...')
         while len(phrases) > 1:
             callback()  # pulse the bar
-            phrases = self._merge_closest_match(phrases)
+            phrases = self._merge_closest_match(phrases, rng)
         # COARSE REDUNDANCY OPTIMISATION
         callback(phase='Coarse redundancy loop', time='Short!')
         sequence = phrases[0]
         while True:
             callback()
-            new_sequence = self.coarse_redundancy_filter(sequence,
-                                                         original_phrases)
+            new_sequence = self.coarse_redundancy_filter(sequence, pool)
             if len(new_sequence) < len(sequence):
                 sequence = new_sequence
             else:
                 break
         # FINE REDUNDANCY OPTIMISATION
         callback(phase='Fine redundancy loop', time='This is the last step!')
-        self.project.supersequence = \
-            models.supseq.SuperSequence(sequence, original_phrases)
-        self.project.supersequence.eliminate_redundancies(callback)
+        sequence = models.supseq.SuperSequence(pool.join(sequence), pool)
+        sequence.eliminate_redundancies(callback)
+        return sequence
+
+    def multi_start_sequence(self, runs=None, processes=None, first_seed=0,
+                             phrases=None):
+        '''
+        Run the heuristic of get_sequence "runs" times (default: number of
+        CPUs), with the seeds from "first_seed" on, in a pool of "processes"
+        workers. The shortest supersequence (in chars) becomes the one of
+        the project: get_sequence(seed=<winning seed>) reproduces it.
+        The runs stop early if one reaches the lower bound on the chars.
+        Return a human-readable report of the outcomes.
+        - phrases: PhrasePool or list of strings (default: all the phrases
+          of the current clock)
+        '''
+        if phrases == None:
+            pool = self.get_phrase_pool()
+        else:
+            pool = models.phrasepool.as_pool(phrases)
+        if runs == None:
+            runs = multiprocessing.cpu_count()
+        bound = self.get_lower_bound(pool)
+        jobs = [(pool, seed) for seed in range(first_seed, first_seed + runs)]
+        results = []
+        workers = None
+        if runs == 1 or processes == 1:
+            outcomes = itertools.imap(_run_heuristic, jobs)
+        else:
+            workers = multiprocessing.Pool(processes)
+            outcomes = workers.imap(_run_heuristic, jobs)
+        try:
+            for result in outcomes:
+                results.append(result)
+                if result[0] <= bound.chars:
+                    break
+        finally:
+            if workers:
+                workers.terminate()
+                workers.join()
+        # Ties go to the lowest seed
+        cost, seed, best = min(results, key=lambda r: r[:2])
+        sequence = models.supseq.SuperSequence.from_dict(best, pool)
+        sequence.cols = getattr(self.project.supersequence, 'cols', None)
+        self.project.supersequence = sequence
         self.project.broadcast_change()
-        # DONE!
-        return self.project.supersequence
-
-    def coarse_redundancy_filter(self, sequence, phrases):
+        return self._get_multi_start_report(results) + \
+               bound.get_report(cost)
+
+    def optimise_sequence(self, time_limit=10.0, chains=None, processes=None,
+                          seed=0):
+        '''
+        Keep shortening the supersequence by simulated annealing (see the
+        annealing module), running "chains" independent chains in a pool of
+        "processes" workers for "time_limit" seconds. The supersequence is
+        replaced if a shorter one is found. Return a human-readable report
+        of the improvements.
+        '''
+        sequence = self.project.supersequence
+        if sequence == None:
+            return 'No supersequence to optimise.\n'
+        bound = self.get_lower_bound(sequence.sanity_pool)
+        best, curve = models.annealing.anneal(sequence, time_limit, chains,
+                                              processes, seed,
+                                              target=bound.chars)
+        if curve[-1][1] < models.annealing.get_cost(sequence):
+            best.cols = sequence.cols
+            self.project.supersequence = best
+            self.project.broadcast_change()
+        return models.annealing.get_curve_report(curve) + \
+               bound.get_report(curve[-1][1])
+
+    def coarse_redundancy_filter(self, sequence, pool):
         '''
         Remove unused items from the sequence. Return the filtered sequence.
         This is a sub-perfect signal-to-noise filter, whose only purpose is to
         quickly eliminate obvious redundant elements. The fine work of
         taking away ALL redundant elements is done by fine_redundancy_filter().
+        - sequence: tuple of word ids of "pool"
+        - pool: PhrasePool of the phrases the sequence must display
         '''
-        sequence = sequence.split()
+        sequence = list(sequence)
         used_words_indexes = set([])
-        for phrase in phrases:
+        for phrase in pool.phrases:
             cursor = 0
-            for word in phrase.split():
-                cursor += sequence[cursor:].index(word)
+            for word in phrase:
+                cursor = sequence.index(word, cursor)
                 used_words_indexes.add(cursor)
                 cursor += 1  #exclude last matched word from following search
         # Scan the entire sequence backwards = range(len, -1, -1)
         for index in [i for i in range(len(sequence)-1, -1, -1)
                       if i not in used_words_indexes]:
             sequence.pop(index)
-        return ' '.join(sequence)
+        return tuple(sequence)
 
     def show_clockface(self, clockface_image, col_num_adjustment,
                        stats_callback):
@@ -481,6 +679,8 @@ class Core(object):
         '''
         # Preliminary dimensional calculations
         seq = self.get_sequence()
+        if self.cface:
+            self.cface.history.detach()
         # Go!
         self.cface = models.clockface.ClockFace(seq, clockface_image,
                                          col_num_adjustment,
@@ -510,6 +710,12 @@ class Core(object):
             self.cface.change_prepended_spaces(+1)
         elif unichr(kv) in ('s', 'S'):
             self.cface.change_prepended_spaces(-1)
+        elif unichr(kv) in ('z', 'Z', 'y', 'Y'):
+            undo = unichr(kv) in ('z', 'Z')
+            first = self.cface.undo() if undo else self.cface.redo()
+            if first != None:
+                self.cface.display(from_index=first)
+            return True
         else:
             return False
         self.cface.display()
@@ -522,6 +728,72 @@ class Core(object):
         vclock_data = self.cface.get_char_sequence()
         vclock_data['drawing_area'] = drawing_area
         self.vclock = models.virtualclock.VirtualClock(**vclock_data)
+        self.lit_cells_cache = {}
+
+    def update_vclock_time(self, hours, minutes, seconds=0):
+        '''
+        Light on the virtual clock the cells displaying the given time.
+        Only the cells that change state get redrawn.
+        '''
+        if not self.vclock:
+            return
+        phrase = self.clock.get_time_phrase(hours, minutes, seconds)
+        if phrase not in self.lit_cells_cache:
+            self.lit_cells_cache[phrase] = self.cface.get_lit_cells(phrase)
+        self.vclock.set_lit_cells(self.lit_cells_cache[phrase])
+
+    def get_day_frames(self):
+        '''
+        Return a list of tuples (name, lit_cells) for every time of the day
+        the clock can display (as many as its resolution allows), where "name"
+        is the time in the form HHMM (HHMMSS for clocks displaying seconds)
+        and "lit_cells" the cells of the clockface to be lit to display it.
+        '''
+        cells_by_phrase = {}
+        frames = []
+        for time in self.clock.iter_times():
+            phrase = self.clock.get_time_phrase(*time)
+            if phrase not in cells_by_phrase:
+                cells_by_phrase[phrase] = self.cface.get_lit_cells(phrase)
+            frames.append((self.clock.format_time(*time, separator=''),
+                           cells_by_phrase[phrase]))
+        return frames
+
+    def export_day_frames(self, destination, sprite_sheet=False,
+                          pixel_dimension=None, processes=None,
+                          callback=None):
+        '''
+        Export an image of the virtual clock for every time of the day it can
+        display, either as a PNG sequence in the "destination" directory or as
+        a single sprite sheet (one row per hour, or per minute for clocks
+        displaying seconds) in the "destination" file.
+        The style is the one of the current virtual clock. Rendering is split
+        across a pool of "processes" workers (default: one per CPU).
+        '''
+        vclock_renderer = self.vclock.renderer
+        renderer = models.facerenderer.FaceRenderer(vclock_renderer.chars,
+                            (vclock_renderer.cols, vclock_renderer.rows),
+                            pixel_dimension or vclock_renderer.pixel_dimension,
+                            **vclock_renderer.get_style())
+        frames_per_hour = self.clock.get_frames_per_day() / 24
+        sheet_cols = frames_per_hour if frames_per_hour <= 60 else 60
+        return models.facerenderer.export_frames(renderer,
+                            self.get_day_frames(), destination,
+                            sprite_sheet=sprite_sheet, sheet_cols=sheet_cols,
+                            processes=processes, callback=callback)
+
+def _run_heuristic(job):
+    '''
+    Run the heuristic of get_sequence in a worker process. "job" is a tuple
+    (pool, seed). Return a tuple (chars, seed, sequence as a dictionary).
+    '''
+    pool, seed = job
+    # The stages of the heuristic use no state of the instance (no project,
+    # no GUI): there's no need to initialise it
+    core = Core.__new__(Core)
+    sequence = core._build_sequence(pool, rng=random.Random(seed))
+    return models.annealing.get_cost(sequence), seed, sequence.to_dict()
+
 
 def run_as_script():
     '''Run this code if the file is executed as script.'''
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+'''
+Glyphcache.py - Cache glyph metrics and pre-rendered glyphs for cairo.
+
+Cairo "toy" text API is slow: selecting a font face and measuring a letter
+every time the letter is drawn is most of the cost of painting a clockface.
+This module keeps two caches:
+- metrics: the text extents of a char at unit font size, per
+  (font face, slant, weight, char).
+- glyphs: an alpha-only (A8) surface with the char already rendered at a
+  given pixel scale, per (font face, slant, weight, char, scale).
+Glyphs are stored as masks, so the same glyph can be painted in any colour.
+'''
+
+import math
+import cairo
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+class GlyphCache(object):
+
+    '''
+    Cache of char metrics and pre-rendered glyph masks.
+    '''
+
+    # Glyph masks are padded to avoid clipping antialiased borders
+    PADDING = 1
+    # Resizing a window generates glyphs at many scales: past this number
+    # of glyphs the cache is flushed
+    MAX_GLYPHS = 4096
+
+    def __init__(self):
+        self.metrics = {}
+        self.glyphs = {}
+        # A tiny scratch surface, just to have a context to measure text with
+        self.__scratch = cairo.Context(cairo.ImageSurface(cairo.FORMAT_A8,
+                                                          1, 1))
+
+    def __select_font(self, cr, font_face, slant, weight):
+        cr.select_font_face(font_face, slant, weight)
+
+    def get_metrics(self, font_face, slant, weight, char):
+        '''
+        Return a tuple (xbearing, ybearing, width, height, xadvance, yadvance)
+        for "char" at font size 1.0.
+        '''
+        key = (font_face, slant, weight, char)
+        try:
+            return self.metrics[key]
+        except KeyError:
+            pass
+        cr = self.__scratch
+        self.__select_font(cr, font_face, slant, weight)
+        cr.set_font_size(1.0)
+        self.metrics[key] = cr.text_extents(char)
+        return self.metrics[key]
+
+    def get_font_extents(self, font_face, slant, weight):
+        '''
+        Return a tuple (ascent, descent, height, max_x_adv, max_y_adv) for
+        the font at font size 1.0.
+        '''
+        key = (font_face, slant, weight, None)
+        try:
+            return self.metrics[key]
+        except KeyError:
+            pass
+        cr = self.__scratch
+        self.__select_font(cr, font_face, slant, weight)
+        cr.set_font_size(1.0)
+        self.metrics[key] = cr.font_extents()
+        return self.metrics[key]
+
+    def get_glyph(self, font_face, slant, weight, char, scale):
+        '''
+        Return a tuple (mask, x_offset, y_offset) where "mask" is an A8
+        surface with the char rendered with a font matrix scaled by
+        "scale" (a tuple (x_scale, y_scale) in pixels), and the offsets are
+        the position of the top-left corner of the mask relative to the
+        baseline origin of the char.
+        '''
+        scale = tuple([round(s, 2) for s in scale])
+        key = (font_face, slant, weight, char, scale)
+        try:
+            return self.glyphs[key]
+        except KeyError:
+            pass
+        if len(self.glyphs) >= self.MAX_GLYPHS:
+            self.clear(glyphs_only=True)
+        xb, yb, w, h = [v * s for v, s in
+                        zip(self.get_metrics(font_face, slant, weight,
+                                             char)[:4], scale * 2)]
+        pad = self.PADDING
+        width = int(math.ceil(w)) + 2 * pad + 1
+        height = int(math.ceil(h)) + 2 * pad + 1
+        mask = cairo.ImageSurface(cairo.FORMAT_A8, width, height)
+        cr = cairo.Context(mask)
+        self.__select_font(cr, font_face, slant, weight)
+        cr.set_font_matrix(cairo.Matrix(xx=scale[0], yy=scale[1]))
+        x_offset = int(math.floor(xb)) - pad
+        y_offset = int(math.floor(yb)) - pad
+        cr.move_to(-x_offset, -y_offset)
+        cr.show_text(char)
+        mask.flush()
+        self.glyphs[key] = (mask, x_offset, y_offset)
+        return self.glyphs[key]
+
+    def clear(self, glyphs_only=False):
+        '''
+        Empty the cache. Metrics are scale-independent, so it is normally
+        enough to drop the glyphs only (e.g. on resizing).
+        '''
+        self.glyphs = {}
+        if not glyphs_only:
+            self.metrics = {}
+
+
+# Shared cache, so that all the clocks in a process reuse the same glyphs
+shared = GlyphCache()
@@ -9,6 +9,7 @@ numbers).
 '''
 
 import gtk
+import gobject
 import controllers.core
 import views.gui
 
@@ -20,6 +21,8 @@ __email__ = "quasipedia@gmail.com"
 __status__ = "Development"
 
 if __name__ == '__main__':
+    # Autosave snapshots are written by a background thread
+    gobject.threads_init()
     views.gui.Gui()
 #    controllers.core.Core()
     gtk.main()
\ No newline at end of file
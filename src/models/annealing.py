@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Simulated annealing of a supersequence, to keep shortening it after the
+heuristic of Core.get_sequence.
+
+A chain starts from a sane sequence and applies random moves that keep it
+sane:
+- shift: move an element anywhere within its feasible range (see
+  SuperSequence.get_feasible_range), cost unchanged
+- remove: drop an element the sequence can do without
+- merge: merge an element into an adjacent one containing its word
+- insert: add a copy of a word somewhere, making the sequence longer
+
+Only inserts make the sequence longer: they are accepted with a probability
+that decreases with the temperature, and let the chain get out of the local
+minima where no element can be removed. The cost (the number of chars of
+the stripped words) is updated with the change of each move, never
+recomputed.
+
+Independent chains, with different seeds, run in a pool of processes. Each
+chain stops when the time budget is over or when its best sequence hasn't
+improved for a while, and returns its best sequence and the times at which
+it improved.
+'''
+
+import math
+import time
+import random
+import multiprocessing
+import models.supseq as supseq
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+# Initial temperature: an insert of a word this long (in chars) is accepted
+# with probability 1/e at the beginning of the annealing
+TEMPERATURE = 3.0
+# Fraction of the time budget without improvements after which a chain is
+# considered converged, and stops
+PATIENCE = 0.5
+# Relative frequencies of the moves
+MOVES = (('shift', 6), ('remove', 2), ('merge', 1), ('insert', 1))
+
+
+def get_cost(sequence):
+    '''
+    Return the cost of a sequence: the number of chars of its words.
+    '''
+    return sum([el.get_word_length('both') for el in sequence])
+
+
+class AnnealingChain(object):
+
+    '''
+    A chain of random moves, starting from a copy of a sane sequence.
+    '''
+
+    def __init__(self, sequence, seed, temperature=TEMPERATURE):
+        '''
+        - sequence: the starting sequence (it is not modified)
+        - seed: seed of the random moves
+        - temperature: initial temperature
+        '''
+        self.sequence = supseq.SuperSequence.from_dict(sequence.to_dict(),
+                                                       sequence.sanity_pool)
+        self.random = random.Random(seed)
+        self.temperature = temperature
+        self.words = sorted(set([el.word.strip() for el in sequence]))
+        self.moves = []
+        for move, weight in MOVES:
+            self.moves.extend([getattr(self, '_' + move)] * weight)
+        self.cost = get_cost(self.sequence)
+        self.best_cost = self.cost
+        self.best = self.sequence.to_dict()
+
+    def _shift(self, temperature):
+        pos = self.random.randrange(len(self.sequence))
+        lo, hi = self.sequence.get_feasible_range(pos)
+        if lo < hi:
+            self.sequence.shift_element_to_position(pos,
+                            self.random.randint(lo, hi), only_if_sane=False)
+        return 0
+
+    def _remove(self, temperature):
+        pos = self.random.randrange(len(self.sequence))
+        if not self.sequence.can_remove(pos):
+            return 0
+        return -self.sequence.pop(pos).get_word_length('both')
+
+    def _merge(self, temperature):
+        pos = self.random.randrange(len(self.sequence))
+        small = self.sequence[pos]
+        word = small.word.strip()
+        for other in (pos - 1, pos + 1):
+            if not 0 <= other < len(self.sequence):
+                continue
+            large = self.sequence[other].word.strip()
+            if word != large and word in large and \
+               self.sequence.merge_elements(self.sequence[other], small):
+                return -len(word)
+        return 0
+
+    def _insert(self, temperature):
+        word = self.random.choice(self.words)
+        if temperature <= 0:
+            return 0
+        if self.random.random() >= math.exp(-len(word) / float(temperature)):
+            return 0
+        self.sequence.insert_element(
+                        self.random.randint(0, len(self.sequence)), word)
+        return len(word)
+
+    def run(self, time_limit, patience=None, target=None):
+        '''
+        Apply random moves for "time_limit" seconds (or until the best
+        sequence hasn't improved for "patience" seconds, or its cost is down
+        to "target"), cooling down linearly. Return the list of the
+        improvements of the best sequence, as tuples (seconds, cost),
+        starting with the initial cost.
+        '''
+        start = last_improvement = time.time()
+        curve = [(0.0, self.best_cost)]
+        while target == None or self.best_cost > target:
+            now = time.time()
+            if now - start >= time_limit:
+                break
+            if patience != None and now - last_improvement >= patience:
+                break
+            temperature = self.temperature * (1 - (now - start) / time_limit)
+            self.cost += self.random.choice(self.moves)(temperature)
+            if self.cost < self.best_cost:
+                self.best_cost = self.cost
+                self.best = self.sequence.to_dict()
+                last_improvement = time.time()
+                curve.append((last_improvement - start, self.cost))
+        return curve
+
+
+def _run_chain(job):
+    '''
+    Run an annealing chain in a worker process. "job" is a tuple
+    (sequence, seed, temperature, time_limit, patience, target). Return a
+    tuple (best cost, best sequence as a dictionary, improvement curve).
+    '''
+    sequence, seed, temperature, time_limit, patience, target = job
+    chain = AnnealingChain(sequence, seed, temperature)
+    curve = chain.run(time_limit, patience, target)
+    return chain.best_cost, chain.best, curve
+
+def merge_curves(curves):
+    '''
+    Return the improvements of the best sequence across several chains
+    running at the same time.
+    '''
+    merged = []
+    for seconds, cost in sorted([p for curve in curves for p in curve]):
+        if not merged or cost < merged[-1][1]:
+            merged.append((seconds, cost))
+    return merged
+
+def get_curve_report(curve):
+    '''
+    Return a human-readable improvement curve.
+    '''
+    text = ''
+    for seconds, cost in curve:
+        text += '%7.2f s: %d chars\n' % (seconds, cost)
+    text += 'Improvement: %d chars\n' % (curve[0][1] - curve[-1][1])
+    return text
+
+def anneal(sequence, time_limit=10.0, chains=None, processes=None, seed=0,
+           temperature=TEMPERATURE, patience=None, target=None):
+    '''
+    Run independent annealing chains on a sane sequence and return a tuple
+    (best sequence, improvement curve). The best sequence is a new
+    SuperSequence (the given one is not modified).
+    - time_limit: seconds each chain runs for
+    - chains: number of chains (default: number of CPUs)
+    - processes: number of worker processes (default: number of CPUs)
+    - seed: seed of the first chain (chain "n" uses seed+n)
+    - temperature: initial temperature
+    - patience: seconds without improvements after which a chain stops
+      (default: PATIENCE of the time budget)
+    - target: cost at which a chain stops, e.g. a lower bound (see the
+      lowerbound module)
+    '''
+    if chains == None:
+        chains = multiprocessing.cpu_count()
+    if patience == None:
+        patience = PATIENCE * time_limit
+    jobs = [(sequence, seed + i, temperature, time_limit, patience, target)
+            for i in range(chains)]
+    if chains == 1 or processes == 1:
+        results = map(_run_chain, jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_run_chain, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    best_cost, best, curve = min(results, key=lambda r: r[0])
+    best_sequence = supseq.SuperSequence.from_dict(best, sequence.sanity_pool)
+    return best_sequence, merge_curves([r[2] for r in results])
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
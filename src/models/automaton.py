@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Aho-Corasick automaton over a set of words.
+
+The automaton finds all the words of the set contained in a text with a
+single scan of the text, whatever the number of words in the set. It is used
+to find which words of a supersequence are substrings of other words (see
+SuperSequence.get_containing_pairs) without comparing every pair of them.
+'''
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+class WordAutomaton(object):
+
+    '''
+    Automaton matching a list of words. Words are addressed by their index
+    in the list given to the constructor.
+    '''
+
+    def __init__(self, words):
+        '''
+        - words: list of (non-empty) strings to look for
+        '''
+        self.words = list(words)
+        self.goto = [{}]  # {char:next state}, indexed by state
+        self.fail = [0]  # state to fall back to on a mismatch
+        self.output = [[]]  # indexes of the words ending in each state
+        for index, word in enumerate(self.words):
+            self.__add(index, word)
+        self.__link()
+
+    def __add(self, index, word):
+        '''
+        Add a word to the trie of the automaton.
+        '''
+        state = 0
+        for char in word:
+            try:
+                state = self.goto[state][char]
+            except KeyError:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+                state = len(self.goto) - 1
+        self.output[state].append(index)
+
+    def __link(self):
+        '''
+        Set the failure links (breadth first), and merge in the output of
+        each state the output of the state it fails to.
+        '''
+        queue = self.goto[0].values()
+        while queue:
+            next_queue = []
+            for state in queue:
+                for char, child in self.goto[state].items():
+                    fallback = self.fail[state]
+                    while fallback and char not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[child] = self.goto[fallback].get(char, 0)
+                    self.output[child] = self.output[child] + \
+                                         self.output[self.fail[child]]
+                    next_queue.append(child)
+            queue = next_queue
+
+    def find(self, text):
+        '''
+        Return the set of indexes of the words contained in "text".
+        '''
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            found.update(self.output[state])
+        return found
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
@@ -4,7 +4,8 @@
 Ancestor for clock plugins.
 
 All clock plugins should subclass from baseclock.Clock and should provide
-at least the "__build_time_phrase" method.
+either a "grammar" (a compiled models.grammar.Grammar, see that module for
+the rule format) or the "__build_time_phrase" method.
 '''
 
 __author__ = "Mac Ryan"
@@ -15,16 +16,43 @@ __email__ = "quasipedia@gmail.com"
 __status__ = "Development"
 
 
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def get_resolution_seconds(resolution):
+    '''
+    Return a clock resolution in seconds. Resolutions are given in minutes,
+    or as strings like "15s" for resolutions in seconds.
+    '''
+    if isinstance(resolution, basestring) and resolution.endswith('s'):
+        return int(resolution[:-1])
+    return int(resolution * 60)
+
+
 class Clock(object):
 
+    # Declarative plugins set this to an instance of models.grammar.Grammar
+    grammar = None
+    # The smallest time difference (in seconds) phrases can express. Plugins
+    # with a granularity finer than a minute get "seconds" passed to their
+    # "__build_time_phrase" method too.
+    __granularity__ = 60
+
     def __init__(self, resolution, approx_method):
         self.resolution = resolution
         self.approx_method = approx_method
+        # Times are approximated to a multiple of "step" seconds. There is no
+        # point in a step finer than what the phrases can express.
+        self.step = max(get_resolution_seconds(resolution),
+                        self.__granularity__)
 
-    def __build_time_phrase(self, hours, minutes):
+    def __build_time_phrase(self, hours, minutes, seconds=0):
         '''
-        Placeholder method that should ALWAYS be overridden by clock modules.
+        Look up the phrase in the grammar of the clock. Clock modules without
+        a grammar should ALWAYS override this method.
         '''
+        if self.grammar != None:
+            return self.grammar.get_phrase(hours, minutes, seconds)
         return 'ERROR: No module installed'
 
     def _word_select(self, key, choices):
@@ -39,38 +67,81 @@ class Clock(object):
                 return value
         raise Exception("Key out of range: " + str(key))
 
-    def approximate(self, hours, minutes):
+    def approximate(self, hours, minutes, seconds=0):
         '''
-        Return a tuple (hours, minutes) of the input time according
-        to the approximation method "method" applied with a given "resolution"
-        in minutes.
+        Return a tuple (hours, minutes, seconds) of the input time according
+        to the approximation method "method" applied with the resolution of
+        the clock.
         '''
-        input = hours*60 + minutes
-        res = self.resolution
+        input = hours*3600 + minutes*60 + seconds
+        res = self.step
         if self.approx_method == 'closest':
             output = int(round(input/float(res)) * res)
         if self.approx_method == 'last':
             output = input/res * res
-        return (output/60, output%60)
+        return (output/3600, output%3600/60, output%60)
+
+    def get_time_phrase(self, hours, minutes, seconds=0):
+        hours, minutes, seconds = self.approximate(hours, minutes, seconds)
+        if self.__granularity__ < 60:
+            return self.__build_time_phrase(hours, minutes, seconds)
+        return self.__build_time_phrase(hours, minutes)
+
+    def get_frames_per_day(self):
+        '''
+        Return the number of different times the clock can display in a day.
+        '''
+        return SECONDS_PER_DAY / self.step
+
+    def iter_times(self):
+        '''
+        Iterate over the times the clock can display in a day, as tuples
+        (hours, minutes, seconds).
+        '''
+        for time in xrange(0, SECONDS_PER_DAY, self.step):
+            yield (time/3600, time%3600/60, time%60)
+
+    def format_time(self, hours, minutes, seconds=0, separator=':'):
+        '''
+        Return a time as HH:MM (or HH:MM:SS if the clock displays seconds).
+        '''
+        fields = [hours, minutes]
+        if self.step % 60:
+            fields.append(seconds)
+        return separator.join([str(f).zfill(2) for f in fields])
 
-    def get_time_phrase(self, hours, minutes):
-        return self.__build_time_phrase(*self.approximate(hours, minutes))
+    def iter_unique_phrases(self):
+        '''
+        Iterate over the phrases of a day, skipping repetitions. Phrases are
+        generated while iterating, so that the phrases of clocks with a fine
+        resolution never need to be all in memory at the same time.
+        '''
+        seen = set()
+        for time in self.iter_times():
+            phrase = self.get_time_phrase(*time)
+            if phrase not in seen:
+                seen.add(phrase)
+                yield phrase
+
+    def get_unique_phrases(self):
+        '''
+        Return the list of the different phrases of a day.
+        '''
+        return list(self.iter_unique_phrases())
 
     def get_phrases_dump(self, with_numbers=False):
         '''
-        Generate the dump of all the time phrases in a day (1440 for a minute-
-        accurate clock). If 'with_numbers' is True, prepend a numeric
-        representation of the time in the form HH:MM.
+        Generate the dump of all the time phrases in a day (one per time the
+        clock can display, e.g. 1440 for a minute-accurate clock). If
+        'with_numbers' is True, prepend a numeric representation of the time
+        in the form HH:MM (HH:MM:SS for clocks displaying seconds).
         '''
         phrases = []
-        # Generate phrases
-        for h in range(24):
-            for m in range(60):
-                phrase = ''
-                if with_numbers == True:
-                    phrase += str(h).zfill(2) + ':' + str(m).zfill(2) + '  '
-                phrases.append(phrase + self.get_time_phrase(h, m))
-        # Check for uniqueness
+        for time in self.iter_times():
+            phrase = ''
+            if with_numbers == True:
+                phrase += self.format_time(*time) + '  '
+            phrases.append(phrase + self.get_time_phrase(*time))
         return phrases
 
 
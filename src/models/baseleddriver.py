@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Ancestor for led driver plugins.
+
+A led driver pushes frames to the hardware of the clock. A frame is the set
+of the led strings (channels) that are lit, given as a bitmask (bit "n" set
+if channel "n" is lit) or as a list of channels.
+
+All led driver plugins should subclass from baseleddriver.Driver and provide
+the "encode_frame" method, returning the bytes to send to the device for a
+frame. Writes are batched and double-buffered: frames are encoded in a back
+buffer while the front one is written to the device by a background thread,
+and the two are swapped every "batch_size" frames.
+
+The device is anything that can be opened as a file: a serial port, a
+pseudo-terminal (see os.openpty) or a plain file standing in for the
+hardware.
+'''
+
+import time
+import threading
+import models.firmware as firmware
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+def get_mask(frame):
+    '''
+    Return a frame as a bitmask (frames can also be given as a list of
+    channels).
+    '''
+    if isinstance(frame, (int, long)):
+        return frame
+    return firmware.get_mask(frame)
+
+
+class Driver(object):
+
+    # Number of frames sent to the device with a single write
+    BATCH_SIZE = 16
+
+    def __init__(self, device, channels, batch_size=None):
+        '''
+        - device: file name of the device
+        - channels: number of channels of the driver, i.e. the highest
+          channel number in use + 1, or the list of the channel numbers of
+          the led strings (see LedStrings.get_channels)
+        - batch_size: frames per write (default: BATCH_SIZE)
+        '''
+        if not isinstance(channels, (int, long)):
+            channels = max(channels) + 1
+        self.device = device
+        self.channels = channels
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.brightness = 1.0
+        self.__file = None
+        self.__back = []  # encoded frames waiting to be written
+        self.__writer = None  # thread writing the front buffer
+        self.__error = None  # exception raised by the last write
+        self.__cache = {}  # {mask:encoded frame}
+
+    def encode_frame(self, mask):
+        '''
+        Return the bytes to send to the device to display the frame "mask".
+        Driver modules should ALWAYS override this method.
+        '''
+        raise NotImplementedError('Led driver modules must implement '
+                                  '"encode_frame"')
+
+    def open(self):
+        '''
+        Open the device.
+        '''
+        self.__file = open(self.device, 'wb', 0)
+
+    def push_frame(self, frame):
+        '''
+        Queue a frame for display. Frames are written to the device in
+        batches: call "flush" to write the frames queued so far.
+        '''
+        mask = get_mask(frame)
+        try:
+            data = self.__cache[mask]
+        except KeyError:
+            data = self.__cache[mask] = self.encode_frame(mask)
+        self.__back.append(data)
+        if len(self.__back) >= self.batch_size:
+            self.flush()
+
+    def set_brightness(self, brightness):
+        '''
+        Set the brightness (0.0 to 1.0) of the frames pushed from now on.
+        '''
+        self.brightness = min(max(brightness, 0.0), 1.0)
+        self.__cache = {}
+
+    def flush(self):
+        '''
+        Start writing the queued frames in the background (after the
+        previous batch has been written).
+        '''
+        if not self.__back:
+            return
+        if self.__file == None:
+            raise BaseException('Led driver device "%s" is not open' %
+                                self.device)
+        front, self.__back = ''.join(self.__back), []
+        self.wait()
+        self.__writer = threading.Thread(target=self.__write, args=(front,))
+        self.__writer.daemon = True
+        self.__writer.start()
+
+    def __write(self, data):
+        # Exceptions are raised by "wait", in the thread using the driver
+        try:
+            self.__file.write(data)
+            self.__file.flush()
+        except Exception as error:
+            self.__error = error
+
+    def wait(self):
+        '''
+        Block until the batch being written (if any) is on the device, and
+        raise the exception of the write if it failed.
+        '''
+        if self.__writer != None:
+            self.__writer.join()
+            self.__writer = None
+        if self.__error != None:
+            error, self.__error = self.__error, None
+            raise error
+
+    def close(self):
+        '''
+        Write the queued frames and close the device.
+        '''
+        if self.__file == None:
+            return
+        try:
+            self.flush()
+            self.wait()
+        finally:
+            self.__file.close()
+            self.__file = None
+
+
+def benchmark(driver, frames_number=1000, frames=None):
+    '''
+    Push "frames_number" full frames through an open driver and return a
+    dictionary with the throughput ('frames_per_second', 'bytes_per_second')
+    and the total 'seconds' and 'bytes'.
+    - frames: the frames to cycle through (default: all channels lit, then
+      every other channel, alternating)
+    '''
+    if frames == None:
+        all_on = (1 << driver.channels) - 1
+        every_other = int('01' * driver.channels, 2) & all_on
+        frames = [all_on, every_other]
+    sizes = [len(driver.encode_frame(get_mask(f))) for f in frames]
+    start = time.time()
+    for i in xrange(frames_number):
+        driver.push_frame(frames[i % len(frames)])
+    driver.flush()
+    driver.wait()
+    seconds = max(time.time() - start, 1e-9)
+    total = sum([sizes[i % len(frames)] for i in xrange(frames_number)])
+    return {'seconds':seconds,
+            'bytes':total,
+            'frames_per_second':frames_number / seconds,
+            'bytes_per_second':total / seconds}
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
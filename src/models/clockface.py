@@ -13,6 +13,7 @@ import libs.svg as svg
 import rsvg
 import math
 import cairo
+import models.history as history
 
 __author__ = "Mac Ryan"
 __copyright__ = "Copyright 2011, Mac Ryan"
@@ -108,6 +109,7 @@ class ClockFace(object):
         self.max_screen_size = (800, 800)  #Max image size on screen in pixels
         self.adjust_display_params()
         self.col_num_adjustment.set_value(self.cols)
+        self.history = history.History(sequence)
         self.scene = svg.Scene('clockface', width=self.max_screen_size[0],
                                             height=self.max_screen_size[1])
         # Selection variables
@@ -146,7 +148,8 @@ class ClockFace(object):
         '''
         length = self.sequence.get_char_length()
         if cols == None:
-            cols = int(math.ceil(math.sqrt(length)))
+            cols = self.sequence.cols or int(math.ceil(math.sqrt(length)))
+        self.sequence.set_cols(cols)
         self.cols = cols
         self.rows = length/cols + 1
         self.text_size = min(self.max_screen_size[0]/(self.cols+2),
@@ -209,12 +212,24 @@ class ClockFace(object):
         stats['optimisation'] = "%d%%" % percentage
         return stats
 
-    def arrange_sequence(self):
+    def arrange_sequence(self, from_index=0):
         '''
         Distribute tiles on the clockface without exceeding the clockface size.
+        - from_index: position of the first element that needs to be arranged
+          again (elements before it are already in place).
         '''
         cursor = [0, 0]  #insertion point of the tile in the matrix
-        for i, element in enumerate(self.sequence):
+        start = 0
+        # Restart from the row of the element preceding the first changed one
+        # (its autospacing might change too)
+        if from_index > 0 and self.sequence[from_index-1].tile != None:
+            start = from_index-1
+            row = self.sequence[start].tile.matrix_y
+            while start > 0 and self.sequence[start-1].tile.matrix_y == row:
+                start -= 1
+            cursor = [0, row]
+        for i in range(start, len(self.sequence)):
+            element = self.sequence[i]
             if cursor[0] + element.get_word_length(strip='both') > self.cols:
                 cursor[0] = 0
                 cursor[1] += 1
@@ -264,6 +279,7 @@ class ClockFace(object):
         '''
         if not self._check_movement_limits(direction):
             return False
+        self.history.checkpoint()
         if self.sequence.shift_element(self.selected_el_index, direction):
             self.selected_el_index += +1 if direction == 'right' else -1
 
@@ -272,11 +288,39 @@ class ClockFace(object):
         Change the number of a word prepended spaces.
         '''
         el = self.sequence[self.selected_el_index]
-        num_spaces = len(el.word[:len(el.word)-len(el.word.lstrip())])
-        if amount == +1 and len(el.word.strip()) < self.cols:
-            el.word = ' ' + el.word
-        elif amount == -1 and num_spaces > 0:
-            el.word = el.word[1:]
+        if amount == +1 and len(el.word.strip()) >= self.cols:
+            return
+        self.history.checkpoint()
+        self.sequence.pad_element(el, amount)
+
+    def __apply_history_step(self, step):
+        '''
+        Undo or redo a step of the history. Return the lowest position of the
+        sequence that needs to be laid out again, or None if nothing changed.
+        '''
+        first = step()
+        if first == None:
+            return None
+        if self.sequence.cols != self.cols:
+            self.adjust_display_params(self.sequence.cols)
+            self.col_num_adjustment.set_value(self.cols)
+            first = 0
+        # The previously selected tile needs to be redrawn too
+        first = min(first, self.selected_el_index)
+        self.selected_el_index = min(first, len(self.sequence)-1)
+        return first
+
+    def undo(self):
+        '''
+        Undo the last change. See "__apply_history_step".
+        '''
+        return self.__apply_history_step(self.history.undo)
+
+    def redo(self):
+        '''
+        Redo the last undone change. See "__apply_history_step".
+        '''
+        return self.__apply_history_step(self.history.redo)
 
     def bin_pack(self, heur_callback=None):
         '''
@@ -294,6 +338,7 @@ class ClockFace(object):
         # in turn offer better flexibility.
         if heur_callback:
             heur_callback(phase='Bin packing', time='---', bar=0)
+        self.history.checkpoint()
         self.halt_heuristic = False
         callback = lambda : self.display(force_update=True)
         cursor = 0
@@ -319,13 +364,14 @@ class ClockFace(object):
         # Horizontal
         self.scene.add(svg.Line((min_x, max_y), (max_x+self.text_size, max_y)))
 
-    def display(self, force_update=False):
+    def display(self, force_update=False, from_index=0):
         '''
         Display the clockface.
         - force_update: force gtk to refresh the screen immediately (without
           leaving the gtk main loop to finish it's signal handling).
+        - from_index: see "arrange_sequence".
         '''
-        self.arrange_sequence()
+        self.arrange_sequence(from_index)
         self.scene.items = []
         self.draw_margins()
         for elem in self.sequence:
@@ -364,6 +410,20 @@ class ClockFace(object):
                       'size':(cols, rows)}
         return cface_data
 
+    def get_lit_cells(self, phrase):
+        '''
+        Return the list of the indexes of the cells (in the char sequence
+        returned by "get_char_sequence") that are lit to display "phrase".
+        '''
+        cols = self.get_matrix_footprint()[0]
+        cells = []
+        for el, offset, length in self.sequence.get_phrase_elements(phrase):
+            leading_spaces = len(el.word) - len(el.word.lstrip())
+            first = el.tile.matrix_y*cols + el.tile.matrix_x + \
+                    leading_spaces + offset
+            cells.extend(range(first, first+length))
+        return cells
+
 def run_as_script():
     '''Run this code if the file is executed as script.'''
     print('Module executed as script!')
@@ -2,12 +2,15 @@
 # -*- coding: utf-8  -*-
 '''
 Convenience methods for managing the clock modules.
+
+Clock modules are discovered as any other plugin (see the pluginmanager
+module): they are looked for in the "plugins/clocks" directory of Chasy and
+in the "chasy.clocks" entry point group, and imported only when a clock is
+actually needed (see ClockManager.get_clock_instance).
 '''
 
-import glob
-import sys
 import os.path
-
+import models.pluginmanager as pluginmanager
 
 __author__ = "Mac Ryan"
 __copyright__ = "Copyright 2011, Mac Ryan"
@@ -17,7 +20,18 @@ __email__ = "quasipedia@gmail.com"
 __status__ = "Development"
 
 
-class ClockManager(object):
+# Package and directory of the clock modules shipped with Chasy
+PLUGIN_PACKAGE = 'plugins.clocks'
+PLUGIN_DIR = os.path.join(pluginmanager.PLUGINS_ROOT, 'clocks')
+# Entry point group for third-party clock modules
+ENTRY_POINT_GROUP = 'chasy.clocks'
+# Cache of the information on the modules
+CACHE_FNAME = os.path.join(pluginmanager.CACHE_DIR, 'clock_modules.json')
+# Special strings read from the clock class (__xxxx__)
+SPECIAL_STRINGS = ('module_name', 'language', 'authors', 'description')
+
+
+class ClockManager(pluginmanager.PluginManager):
 
     '''
     Expose convenience methods for managing clock modules.
@@ -26,36 +40,25 @@ class ClockManager(object):
     human-readable name [defined within the module itself by __module_name__].
     '''
 
-    def __init__(self):
-        '''
-        Imports all available clock modules and organise a human-readable
-        list of them in the form {'human_name':imported_module_object}
-        '''
-        self.modules = {}
-        for module_name in glob.glob("plugins/clocks/*.py"):
-            module_name = os.path.split(module_name)[1][:-3]
-            if module_name != '__init__':
-                module_name = 'plugins.clocks.' + module_name
-                print(module_name)
-                __import__(module_name)
-                imported = sys.modules[module_name]
-                human_name = getattr(imported, 'Clock').__module_name__
-                self.modules[human_name] = imported
-
-    def _get_module_specialstring(self, module_name, property_name):
+    PLUGIN_PACKAGE = PLUGIN_PACKAGE
+    ENTRY_POINT_GROUP = ENTRY_POINT_GROUP
+    CLASS_NAME = 'Clock'
+    SPECIAL_STRINGS = SPECIAL_STRINGS
+
+    def __init__(self, cache_fname=CACHE_FNAME, plugin_dir=PLUGIN_DIR):
         '''
-        Return the any of the special strings (__xxxx__) from a given module.
+        - cache_fname: the on-disk cache (None to disable it)
+        - plugin_dir: the directory with the modules of PLUGIN_PACKAGE
         '''
-        tmp = getattr(self.modules[module_name], 'Clock')
-        return getattr(tmp, '__'+property_name+'__')
+        pluginmanager.PluginManager.__init__(self, cache_fname, plugin_dir)
 
     def get_all_languages(self):
         '''
         Return an ordered list of all the languages used in the modules.
         '''
         languages = []
-        for module in self.modules.values():
-            languages.append(getattr(module, 'Clock').__language__)
+        for info in self.modules.values():
+            languages.append(info['language'])
         return sorted(list(set(languages)))
 
     def get_all_module_names(self, language=None):
@@ -71,16 +74,11 @@ class ClockManager(object):
 
     def get_clock_instance(self, module_name, resolution, approx_method):
         '''
-        Return a clock instance from module "module_name"
-        '''
-        return self.modules[module_name].Clock(resolution, approx_method)
-
-    def get_module_description(self, module_name):
-        '''
-        Return the description of the module as given by its author.
+        Return a clock instance from module "module_name" (the module is
+        imported on the first call).
         '''
-        raw = self._get_module_specialstring(module_name, 'description')
-        return ' '.join(raw.split())
+        class_ = self.get_plugin_class(module_name)
+        return class_(resolution, approx_method)
 
 
 def run_as_script():
@@ -88,4 +86,4 @@ def run_as_script():
     print('Module executed as script!')
 
 if __name__ == '__main__':
-    run_as_script()
\ No newline at end of file
+    run_as_script()
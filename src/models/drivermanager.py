@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Convenience methods for managing the led driver modules.
+
+Led driver modules are discovered as any other plugin (see the
+pluginmanager module): they are looked for in the "plugins/leddrivers"
+directory of Chasy and in the "chasy.leddrivers" entry point group, and
+imported only when a driver is actually needed.
+'''
+
+import os.path
+import models.pluginmanager as pluginmanager
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+# Package and directory of the driver modules shipped with Chasy
+PLUGIN_PACKAGE = 'plugins.leddrivers'
+PLUGIN_DIR = os.path.join(pluginmanager.PLUGINS_ROOT, 'leddrivers')
+# Entry point group for third-party driver modules
+ENTRY_POINT_GROUP = 'chasy.leddrivers'
+# Cache of the information on the modules
+CACHE_FNAME = os.path.join(pluginmanager.CACHE_DIR, 'driver_modules.json')
+
+
+class DriverManager(pluginmanager.PluginManager):
+
+    '''
+    Expose convenience methods for managing led driver modules.
+    '''
+
+    PLUGIN_PACKAGE = PLUGIN_PACKAGE
+    ENTRY_POINT_GROUP = ENTRY_POINT_GROUP
+    CLASS_NAME = 'Driver'
+
+    def __init__(self, cache_fname=CACHE_FNAME, plugin_dir=PLUGIN_DIR):
+        '''
+        - cache_fname: the on-disk cache (None to disable it)
+        - plugin_dir: the directory with the modules of PLUGIN_PACKAGE
+        '''
+        pluginmanager.PluginManager.__init__(self, cache_fname, plugin_dir)
+
+    def get_driver_instance(self, module_name, device, channels, **options):
+        '''
+        Return a (not yet opened) driver from module "module_name", for
+        "channels" led strings on "device". Other options are passed to the
+        driver.
+        '''
+        class_ = self.get_plugin_class(module_name)
+        return class_(device, channels, **options)
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
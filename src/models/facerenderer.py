@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Headless renderer of clockfaces.
+
+The renderer only depends on cairo (no GTK), so it can be instantiated as many
+times as needed and used outside the GUI, for example in worker processes
+that export images of the clock for every minute of the day.
+
+Drawing is done by compositing two cached layers: one with all the letters
+unlit, one with all the letters lit. A frame is the unlit layer with the
+rectangles of the lit cells copied over from the lit layer.
+'''
+
+import cairo
+import os
+import math
+import itertools
+import multiprocessing
+import StringIO
+import libs.glyphcache as glyphcache
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+class FaceRenderer(object):
+
+    '''
+    Render a clockface of "chars" arranged in a matrix of "size" (cols, rows).
+    Colours are (r, g, b) tuples in the 0.0-1.0 range.
+    '''
+
+    default_style = {'font_face':'Courier New',
+                     'charspace':1.0,
+                     'borderspace':1.0,
+                     'case':None,
+                     'italic':False,
+                     'bold':False,
+                     'bkg_color':(0.0, 0.0, 0.0),
+                     'unlit_color':(0.53, 0.53, 0.53),
+                     'lit_color':(1.0, 1.0, 1.0)}
+
+    # Which of the style colours is used for the letters of each layer
+    LAYERS = {'unlit':'unlit_color', 'lit':'lit_color'}
+
+    def __init__(self, chars, size, pixel_dimension=400, **kwargs):
+        self.chars = unicode(chars)
+        self.cols, self.rows = size
+        for k, v in self.default_style.items():
+            setattr(self, k, kwargs.get(k, v))
+        self.layers = {}
+        self.layer_signatures = {}
+        self.set_pixel_dimension(pixel_dimension)
+
+    def set_style(self, **kwargs):
+        '''
+        Change any of the style parameters (see "default_style").
+        '''
+        for k in kwargs:
+            if k not in self.default_style:
+                raise BaseException('Unknown style parameter: %s' % k)
+            setattr(self, k, kwargs[k])
+
+    def get_style(self):
+        '''
+        Return a dictionary with the current style parameters.
+        '''
+        return dict([(k, getattr(self, k)) for k in self.default_style])
+
+    def set_pixel_dimension(self, pixel_dimension):
+        '''
+        Size the clockface so that its longest side is "pixel_dimension".
+        '''
+        self.pixel_dimension = pixel_dimension
+        scaling = float(pixel_dimension)/max(self.cols, self.rows)
+        self.size_x = int(self.cols*scaling)
+        self.size_y = int(self.rows*scaling)
+
+    def get_font_params(self):
+        '''
+        Return a tuple (font_face, slant, weight) for the current style.
+        '''
+        slant = cairo.FONT_SLANT_ITALIC if \
+                            self.italic else cairo.FONT_SLANT_NORMAL
+        weight = cairo.FONT_WEIGHT_BOLD if \
+                            self.bold else cairo.FONT_WEIGHT_NORMAL
+        return (self.font_face, slant, weight)
+
+    def get_em_params(self):
+        '''
+        Return a tuple (ems_in_matrix_unit, ems_in_border, em_x, em_y) where
+        em_x and em_y are the size of one char, in fraction of the surface.
+        '''
+        ems_in_matrix_unit = 1.0+self.charspace
+        ems_in_border = self.borderspace
+        em_x = 1/(ems_in_border*2+ems_in_matrix_unit*(self.cols-1)+1)
+        em_y = 1/(ems_in_border*2+ems_in_matrix_unit*(self.rows-1)+1)
+        return (ems_in_matrix_unit, ems_in_border, em_x, em_y)
+
+    def get_cased_letters(self):
+        '''
+        Return the letters of the clockface with the case enforced.
+        '''
+        if self.case == 'lower':
+            return self.chars.lower()
+        elif self.case == 'upper':
+            return self.chars.upper()
+        return self.chars
+
+    def get_cell_rect(self, index):
+        '''
+        Return the rectangle (x, y, width, height) in pixels of the cell at
+        position "index" of the clockface. Cells tile the face: each one
+        extends half a charspace around its letter.
+        '''
+        matrix_unit, border, em_x, em_y = self.get_em_params()
+        cx, cy = index % self.cols, index / self.cols
+        scale_x, scale_y = self.size_x*em_x, self.size_y*em_y
+        x0 = int((border + cx*matrix_unit - self.charspace/2) * scale_x)
+        y0 = int((border + cy*matrix_unit - self.charspace/2) * scale_y)
+        x1 = int((border + (cx+1)*matrix_unit - self.charspace/2) * scale_x)
+        y1 = int((border + (cy+1)*matrix_unit - self.charspace/2) * scale_y)
+        return (max(x0, 0), max(y0, 0), x1-max(x0, 0)+1, y1-max(y0, 0)+1)
+
+    def __get_layer_signature(self, layer):
+        '''
+        Return a tuple uniquely identifying the look of a layer.
+        '''
+        return (self.chars, self.cols, self.rows, self.size_x, self.size_y,
+                self.get_font_params(), self.case, self.charspace,
+                self.borderspace, tuple(self.bkg_color),
+                tuple(getattr(self, self.LAYERS[layer])))
+
+    def __render_layer(self, layer):
+        '''
+        Composite a layer (background colour and all the letters in the
+        layer colour) into an image surface, using the cached glyphs.
+        '''
+        cache = glyphcache.shared
+        font = self.get_font_params()
+        matrix_unit, border, em_x, em_y = self.get_em_params()
+        # Pixel size of one em, horizontally and vertically
+        scale = (self.size_x*em_x, self.size_y*em_y)
+        fascent, fdescent, fheight, fxadv, fyadv = \
+                                            cache.get_font_extents(*font)
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24,
+                                     max(self.size_x, 1), max(self.size_y, 1))
+        cr = cairo.Context(surface)
+        cr.set_source_rgb(*self.bkg_color)
+        cr.paint()
+        cr.set_source_rgb(*getattr(self, self.LAYERS[layer]))
+        for i, letter in enumerate(self.get_cased_letters()):
+            cx, cy = i % self.cols, i / self.cols
+            xbearing, ybearing, width, height, xadv, yadv = \
+                                        cache.get_metrics(*(font + (letter,)))
+            # Baseline origin of the letter, in ems...
+            x = border + cx*matrix_unit + 0.5 - xbearing - width / 2
+            y = border + cy*matrix_unit + 0.5 - fdescent + fheight / 2
+            # ...and in pixels
+            mask, x_off, y_off = cache.get_glyph(*(font + (letter, scale)))
+            cr.mask_surface(mask, int(round(x*scale[0])) + x_off,
+                                  int(round(y*scale[1])) + y_off)
+        surface.flush()
+        return surface
+
+    def get_layer(self, layer):
+        '''
+        Return the cached layer ('unlit' or 'lit'), regenerating it only if
+        any of the parameters affecting its look has changed.
+        '''
+        signature = self.__get_layer_signature(layer)
+        if self.layer_signatures.get(layer) != signature:
+            self.layers[layer] = self.__render_layer(layer)
+            self.layer_signatures[layer] = signature
+        return self.layers[layer]
+
+    def paint(self, cr, lit_cells=(), area=None):
+        '''
+        Paint the clockface on the cairo context "cr" by blitting the cached
+        layers. Only the cells in "lit_cells" are painted lit. If "area"
+        (x, y, width, height) is given, painting is clipped to it.
+        '''
+        if area:
+            cr.rectangle(*area)
+            cr.clip()
+        cr.set_source_surface(self.get_layer('unlit'), 0, 0)
+        cr.paint()
+        if lit_cells:
+            cr.set_source_surface(self.get_layer('lit'), 0, 0)
+            for cell in lit_cells:
+                cr.rectangle(*self.get_cell_rect(cell))
+            cr.fill()
+
+    def draw_vector(self, cr, lit_cells=()):
+        '''
+        Draw the clockface on the cairo context "cr" as vector graphics (used
+        for vector output formats, where blitting bitmaps is inappropriate).
+        '''
+        cache = glyphcache.shared
+        font = self.get_font_params()
+        lit_cells = set(lit_cells)
+        # NORMALISATION
+        cr.scale(self.size_x, self.size_y)
+        # EM [one char size, in percentage of normalised surface]
+        ems_in_matrix_unit, ems_in_border, em_x, em_y = self.get_em_params()
+        # BACKGROUND
+        cr.save()
+        cr.set_source_rgb(*self.bkg_color)
+        cr.rectangle(0, 0, 1, 1)
+        cr.fill()
+        cr.restore()
+        # FONT SETTINGS
+        cr.select_font_face(*font)
+        # LETTER OUTPUT
+        cr.scale(em_x, em_y)  #normalisation to em = 1.0
+        cr.set_font_size(1.0)
+        fascent, fdescent, fheight, fxadvance, fyadvance = \
+                                                cache.get_font_extents(*font)
+        cr.translate(ems_in_border, ems_in_border)
+        for i, letter in enumerate(self.get_cased_letters()):
+            cx, cy = i % self.cols, i / self.cols
+            color = self.lit_color if i in lit_cells else self.unlit_color
+            cr.set_source_rgb(*color)
+            xbearing, ybearing, width, height, xadvance, yadvance = \
+                                        cache.get_metrics(*(font + (letter,)))
+            cr.move_to(cx*ems_in_matrix_unit + 0.5 - xbearing - width / 2,
+                       cy*ems_in_matrix_unit + 0.5 - fdescent + fheight / 2)
+            cr.show_text(letter)
+
+    def render_frame(self, lit_cells=()):
+        '''
+        Return an image surface with the clockface and "lit_cells" lit.
+        '''
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24,
+                                     max(self.size_x, 1), max(self.size_y, 1))
+        self.paint(cairo.Context(surface), lit_cells)
+        surface.flush()
+        return surface
+
+    def get_assets(self):
+        '''
+        Return a picklable dictionary with all that is needed to rebuild the
+        renderer in another process, including the already rendered layers
+        (as PNG data), so that they don't need to be rendered again.
+        '''
+        assets = {'chars':self.chars,
+                  'size':(self.cols, self.rows),
+                  'pixel_dimension':self.pixel_dimension,
+                  'style':self.get_style(),
+                  'layers':{}}
+        for layer in self.LAYERS:
+            buffer = StringIO.StringIO()
+            self.get_layer(layer).write_to_png(buffer)
+            assets['layers'][layer] = buffer.getvalue()
+        return assets
+
+    @classmethod
+    def from_assets(cls, assets):
+        '''
+        Return a renderer rebuilt from the output of "get_assets()".
+        '''
+        renderer = cls(assets['chars'], assets['size'],
+                       assets['pixel_dimension'], **assets['style'])
+        for layer, data in assets['layers'].items():
+            surface = cairo.ImageSurface.create_from_png(
+                                                    StringIO.StringIO(data))
+            renderer.layers[layer] = surface
+            renderer.layer_signatures[layer] = \
+                            renderer.__get_layer_signature(layer)
+        return renderer
+
+
+# The renderer of a worker process of the export pool
+_worker_renderer = None
+
+def _init_worker(assets):
+    '''
+    Initialise a worker of the export pool with the shared assets.
+    '''
+    global _worker_renderer
+    _worker_renderer = FaceRenderer.from_assets(assets)
+
+def _render_to_files(job):
+    '''
+    Render a chunk of frames to PNG files. "job" is a tuple
+    (directory, [(name, lit_cells), ...]). Return the number of frames.
+    '''
+    directory, frames = job
+    for name, lit_cells in frames:
+        surface = _worker_renderer.render_frame(lit_cells)
+        surface.write_to_png(os.path.join(directory, name + '.png'))
+    return len(frames)
+
+def _render_to_strip(job):
+    '''
+    Render a row of a sprite sheet. "job" is a tuple
+    (row_number, [(name, lit_cells), ...]). Return (row_number, png_data).
+    '''
+    row, frames = job
+    r = _worker_renderer
+    strip = cairo.ImageSurface(cairo.FORMAT_RGB24, r.size_x * len(frames),
+                               r.size_y)
+    cr = cairo.Context(strip)
+    for i, (name, lit_cells) in enumerate(frames):
+        cr.save()
+        cr.translate(i * r.size_x, 0)
+        r.paint(cr, lit_cells)
+        cr.restore()
+    buffer = StringIO.StringIO()
+    strip.write_to_png(buffer)
+    return (row, buffer.getvalue())
+
+def export_frames(renderer, frames, destination, sprite_sheet=False,
+                  sheet_cols=60, processes=None, callback=None):
+    '''
+    Render a list of frames, splitting the work across a pool of processes.
+    The layers of "renderer" are rendered once and shared with all workers.
+    - frames: list of tuples (name, lit_cells).
+    - destination: a directory (PNG sequence, one "name.png" per frame) or
+      a file name (sprite sheet).
+    - sprite_sheet: if True, output one image with "sheet_cols" frames per
+      row, in the same order of "frames".
+    - processes: number of workers (default: number of CPUs).
+    - callback: invoked with the fraction of work done (for progress bars).
+    Return the number of rendered frames.
+    '''
+    if sprite_sheet:
+        chunk_size = sheet_cols
+    else:
+        if not os.path.isdir(destination):
+            os.makedirs(destination)
+        chunk_size = 30
+    chunks = [frames[i:i+chunk_size] for i in
+              range(0, len(frames), chunk_size)]
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                (renderer.get_assets(),))
+    try:
+        if sprite_sheet:
+            sheet = cairo.ImageSurface(cairo.FORMAT_RGB24,
+                                       renderer.size_x * sheet_cols,
+                                       renderer.size_y * len(chunks))
+            cr = cairo.Context(sheet)
+            jobs = list(enumerate(chunks))
+            for done, (row, data) in enumerate(pool.imap_unordered(
+                                                    _render_to_strip, jobs)):
+                strip = cairo.ImageSurface.create_from_png(
+                                                    StringIO.StringIO(data))
+                cr.set_source_surface(strip, 0, row * renderer.size_y)
+                cr.paint()
+                if callback:
+                    callback(float(done+1)/len(jobs))
+            sheet.write_to_png(destination)
+        else:
+            jobs = [(destination, chunk) for chunk in chunks]
+            for done, n in enumerate(pool.imap_unordered(_render_to_files,
+                                                         jobs)):
+                if callback:
+                    callback(float(done+1)/len(jobs))
+    finally:
+        pool.close()
+        pool.join()
+    return len(frames)
+
+
+def get_style_label(style):
+    '''
+    Return a short human-readable description of a style.
+    '''
+    to_perc = lambda x : str(int(round(x*100)))
+    label = '%s %s%% %s%%' % (style['font_face'], to_perc(style['charspace']),
+                               to_perc(style['borderspace']))
+    for flag in ('italic', 'bold'):
+        if style.get(flag):
+            label += ' ' + flag
+    if style.get('case'):
+        label += ' ' + style['case']
+    return label
+
+def _init_variant_worker(chars, size, pixel_dimension):
+    '''
+    Initialise a worker of the style variants pool.
+    '''
+    global _worker_renderer
+    _worker_renderer = FaceRenderer(chars, size, pixel_dimension)
+
+def _render_variant(job):
+    '''
+    Render the clockface with a style variant. "job" is a tuple
+    (index, style, lit_cells). Return (index, png_data).
+    '''
+    index, style, lit_cells = job
+    _worker_renderer.set_style(**style)
+    buffer = StringIO.StringIO()
+    _worker_renderer.render_frame(lit_cells).write_to_png(buffer)
+    return (index, buffer.getvalue())
+
+def export_style_grid(renderer, variants, destination, lit_cells=(),
+                      thumb_dimension=200, processes=None, callback=None):
+    '''
+    Render a contact sheet with the clockface drawn in every combination of
+    style variants, splitting the work across a pool of processes.
+    - variants: dictionary {style_parameter:[value1, value2...]}, e.g.
+      {'font_face':['Courier New', 'Ubuntu'], 'charspace':[0.5, 1.0]}.
+      Parameters not listed keep the value they have in "renderer".
+    - destination: file name of the PNG contact sheet.
+    - lit_cells: cells to be lit in every thumbnail.
+    - thumb_dimension: size in pixels of the longest side of a thumbnail.
+    Return the list of the styles, in the order they appear on the sheet.
+    '''
+    keys = sorted(variants)
+    styles = []
+    for values in itertools.product(*[variants[k] for k in keys]):
+        style = renderer.get_style()
+        style.update(zip(keys, values))
+        styles.append(style)
+    thumb = FaceRenderer(renderer.chars, (renderer.cols, renderer.rows),
+                         thumb_dimension)
+    label_height = 20
+    cols = int(math.ceil(math.sqrt(len(styles))))
+    rows = int(math.ceil(len(styles)/float(cols)))
+    cell_w, cell_h = thumb.size_x, thumb.size_y + label_height
+    sheet = cairo.ImageSurface(cairo.FORMAT_RGB24, cols*cell_w, rows*cell_h)
+    cr = cairo.Context(sheet)
+    cr.set_source_rgb(1, 1, 1)
+    cr.paint()
+    cr.set_font_size(label_height*0.6)
+    jobs = [(i, style, lit_cells) for i, style in enumerate(styles)]
+    pool = multiprocessing.Pool(processes, _init_variant_worker,
+                                (renderer.chars,
+                                 (renderer.cols, renderer.rows),
+                                 thumb_dimension))
+    try:
+        for done, (i, data) in enumerate(pool.imap_unordered(_render_variant,
+                                                             jobs)):
+            x, y = (i % cols) * cell_w, (i / cols) * cell_h
+            image = cairo.ImageSurface.create_from_png(StringIO.StringIO(data))
+            cr.set_source_surface(image, x, y)
+            cr.paint()
+            cr.set_source_rgb(0, 0, 0)
+            cr.move_to(x + 2, y + cell_h - label_height*0.3)
+            cr.show_text(get_style_label(styles[i]))
+            if callback:
+                callback(float(done+1)/len(jobs))
+    finally:
+        pool.close()
+        pool.join()
+    sheet.write_to_png(destination)
+    return styles
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
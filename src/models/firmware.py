@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Generation of the clock table of the firmware.
+
+The firmware of the clock lights, for each frame (e.g. each minute of the
+day), the led strings of the words of its phrase. The table it reads them
+from is stored in the flash memory of the microcontroller, and is made of:
+- runData / runOffsets: a dictionary of "runs". A run is the list of the
+  channels (led strings) of one or more consecutive words that often appear
+  together (e.g. "it is"). Run "r" is runData[runOffsets[r]:runOffsets[r+1]].
+- phraseData / phraseOffsets: each unique phrase, stored once as a list of
+  run ids. Phrase "p" is phraseData[phraseOffsets[p]:phraseOffsets[p+1]].
+- frameIndex: the phrase id of each frame. If the second half of the day is
+  identical to the first one (12h clocks), only the first half is stored.
+
+The runs are chosen as in byte pair encoding: the pair of runs that appears
+the most often in the phrases is merged into a new run, as long as this
+saves flash memory.
+
+The "legacy" format is the one previously emitted by the program: the
+channels of each phrase one after the other, the last one flagged by the
+stop bit 0x80, with no index (the firmware scans the table counting stop
+bits to find a phrase).
+
+Decode costs are estimated in cycles of an AVR microcontroller: LPM_CYCLES
+for each byte read from flash, LOOP_CYCLES for each iteration of a loop.
+
+The Emulator decodes the tables as the firmware does, and "verify" checks
+the frames it lights against the phrases of the clock. Frames are compared
+as bitmasks (bit "n" set if channel "n" is lit): the lists of the masks of
+the whole day are compared at once, and the wrong frames are only looked for
+if the two lists differ.
+'''
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+LPM_CYCLES = 3  # cycles to read a byte from flash
+LOOP_CYCLES = 4  # cycles of overhead of a loop iteration
+STOP_BIT = 0x80  # flags the last channel of a phrase in the legacy format
+MAX_RUNS = 256  # run ids are stored in one byte
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def get_legacy_table(phrase_channels):
+    '''
+    Return the bytes of the table in the legacy format.
+    - phrase_channels: list of the channels of each phrase
+    '''
+    table = []
+    for channels in phrase_channels:
+        if not channels:
+            continue
+        table.extend(channels[:-1])
+        table.append(channels[-1] | STOP_BIT)
+    return table
+
+def get_legacy_cycles(phrase_channels):
+    '''
+    Return the worst-case cycles needed to decode a phrase of the legacy
+    table: the last phrase, as the table must be scanned from the beginning.
+    '''
+    return len(get_legacy_table(phrase_channels)) * (LPM_CYCLES + LOOP_CYCLES)
+
+def format_array(name, values, c_type='uint8_t', per_line=12):
+    '''
+    Return the C declaration of a PROGMEM array.
+    '''
+    text = 'const %s %s[] PROGMEM = {\n' % (c_type, name)
+    for i in range(0, len(values), per_line):
+        text += '    %s,\n' % ', '.join([hex(v) for v in
+                                          values[i:i+per_line]])
+    return text + '};\n'
+
+
+class FirmwareTable(object):
+
+    '''
+    The compact clock table for a set of phrases (see the module docstring).
+    '''
+
+    def __init__(self, phrase_channels, phrase_times=None, step=None):
+        '''
+        - phrase_channels: list of the channels of each phrase, in the order
+          of the words of the phrase (a word is a tuple of channels)
+        - phrase_times: list of the times (seconds from midnight) at which
+          each phrase is displayed, or None if frame "n" shows phrase "n"
+        - step: seconds between two frames (None to derive it from times)
+        '''
+        self.phrase_channels = [[tuple(w) for w in p] for p in phrase_channels]
+        if max([c for p in self.phrase_channels for w in p for c in w] or
+               [0]) > 0xff:
+            raise BaseException('Channel numbers must fit in one byte')
+        self.__build_index(phrase_times, step)
+        self.__build_runs()
+
+    def __build_index(self, phrase_times, step):
+        if not phrase_times or not any(phrase_times):
+            self.step = None
+            index = range(len(self.phrase_channels))
+        else:
+            frames = sorted([(time, phrase_id) for phrase_id, times in
+                             enumerate(phrase_times) for time in times])
+            if step == None:
+                step = SECONDS_PER_DAY / len(frames)
+            self.step = step
+            index = [phrase_id for time, phrase_id in frames]
+        self.frames = len(index)
+        half = len(index) / 2
+        if len(index) % 2 == 0 and index[:half] == index[half:]:
+            index = index[:half]
+        # Phrases are numbered in order of appearance, so that the index can
+        # be omitted if each frame has its own phrase
+        order = []
+        new_ids = {}
+        for phrase_id in index + range(len(self.phrase_channels)):
+            if phrase_id not in new_ids:
+                new_ids[phrase_id] = len(order)
+                order.append(phrase_id)
+        self.phrase_channels = [self.phrase_channels[p] for p in order]
+        self.index = [new_ids[p] for p in index]
+        self.direct = self.index == range(len(self.index))
+
+    def __build_runs(self):
+        '''
+        Build the run dictionary, merging the most frequent pair of runs
+        while it saves memory.
+        '''
+        run_ids = {}  # {tuple of channels:run id}
+        phrases = []
+        for words in self.phrase_channels:
+            phrases.append([run_ids.setdefault(w, len(run_ids))
+                            for w in words])
+        runs = sorted(run_ids, key=run_ids.get)
+        while len(runs) < MAX_RUNS:
+            counts = {}
+            for phrase in phrases:
+                for pair in zip(phrase, phrase[1:]):
+                    counts[pair] = counts.get(pair, 0) + 1
+            if not counts:
+                break
+            pair = max(counts, key=lambda p: (counts[p], -p[0], -p[1]))
+            merged = runs[pair[0]] + runs[pair[1]]
+            # Each occurrence saves a run id, the new run costs its channels
+            # plus its offset
+            if counts[pair] <= len(merged) + 2:
+                break
+            runs.append(merged)
+            new_id = len(runs) - 1
+            for i, phrase in enumerate(phrases):
+                phrases[i] = self.__replace_pair(phrase, pair, new_id)
+        self.runs, self.phrases = self.__prune(runs, phrases)
+        if len(self.runs) > MAX_RUNS:
+            raise BaseException('Too many different words for the table: '
+                                '%d (max %d)' % (len(self.runs), MAX_RUNS))
+
+    def __replace_pair(self, phrase, pair, new_id):
+        replaced = []
+        i = 0
+        while i < len(phrase):
+            if tuple(phrase[i:i+2]) == pair:
+                replaced.append(new_id)
+                i += 2
+            else:
+                replaced.append(phrase[i])
+                i += 1
+        return replaced
+
+    def __prune(self, runs, phrases):
+        '''
+        Drop the runs no longer used by any phrase, renumbering the others.
+        '''
+        used = sorted(set([r for phrase in phrases for r in phrase]))
+        new_ids = dict([(old, new) for new, old in enumerate(used)])
+        return ([runs[r] for r in used],
+                [[new_ids[r] for r in phrase] for phrase in phrases])
+
+    def get_tables(self):
+        '''
+        Return the tables of the firmware as a dictionary {name:(c_type,
+        values)}.
+        '''
+        run_data, run_offsets = [], [0]
+        for run in self.runs:
+            run_data.extend(run)
+            run_offsets.append(len(run_data))
+        phrase_data, phrase_offsets = [], [0]
+        for phrase in self.phrases:
+            phrase_data.extend(phrase)
+            phrase_offsets.append(len(phrase_data))
+        index_type = 'uint8_t' if len(self.phrases) <= 256 else 'uint16_t'
+        return {'runData':('uint8_t', run_data),
+                'runOffsets':('uint16_t', run_offsets),
+                'phraseData':('uint8_t', phrase_data),
+                'phraseOffsets':('uint16_t', phrase_offsets),
+                'frameIndex':(index_type, [] if self.direct else self.index)}
+
+    def get_flash_bytes(self):
+        '''
+        Return the flash memory taken by the tables, in bytes.
+        '''
+        sizes = {'uint8_t':1, 'uint16_t':2}
+        return sum([sizes[t] * len(v) for t, v in self.get_tables().values()])
+
+    def get_decode_cycles(self, phrase_id):
+        '''
+        Return the cycles needed to decode a phrase (see the decoder).
+        '''
+        index_bytes = 0 if self.direct else 1 if len(self.phrases) <= 256 \
+                      else 2
+        cycles = (index_bytes + 4) * LPM_CYCLES  # index, phrase offsets
+        for run_id in self.phrases[phrase_id]:
+            cycles += (1 + 4) * LPM_CYCLES + LOOP_CYCLES  # run id, offsets
+            cycles += len(self.runs[run_id]) * (LPM_CYCLES + LOOP_CYCLES)
+        return cycles
+
+    def get_worst_case_cycles(self):
+        return max([self.get_decode_cycles(p)
+                    for p in range(len(self.phrases))] or [0])
+
+    def get_decoder(self):
+        '''
+        Return the C source of the decoder of the table.
+        '''
+        index_type = self.get_tables()['frameIndex'][0]
+        if self.direct:  # phrase "n" is the one of frame "n"
+            lookup = 'frame % FRAME_PERIOD'
+        else:
+            lookup = '%s(&frameIndex[frame %% FRAME_PERIOD])' % \
+                     ('pgm_read_byte' if index_type == 'uint8_t'
+                      else 'pgm_read_word')
+        return '\n'.join([
+            '#define FRAME_PERIOD %d' % len(self.index),
+            '#define FRAME_STEP_SECONDS %d' % (self.step or 0),
+            '',
+            '// Call "light" on the channel of each led string of "frame"',
+            '// (the number of the frame in the day, e.g. the minute).',
+            'void showFrame(uint16_t frame, void (*light)(uint8_t)) {',
+            '    uint16_t phrase = %s;' % lookup,
+            '    uint16_t end = pgm_read_word(&phraseOffsets[phrase + 1]);',
+            '    for (uint16_t p = pgm_read_word(&phraseOffsets[phrase]);'
+            ' p < end; p++) {',
+            '        uint8_t run = pgm_read_byte(&phraseData[p]);',
+            '        uint16_t runEnd = pgm_read_word(&runOffsets[run + 1]);',
+            '        for (uint16_t r = pgm_read_word(&runOffsets[run]);'
+            ' r < runEnd; r++)',
+            '            light(pgm_read_byte(&runData[r]));',
+            '    }',
+            '}',
+            ''])
+
+    def get_c_code(self):
+        '''
+        Return the C source of the tables and of their decoder.
+        '''
+        tables = self.get_tables()
+        text = '#include <avr/pgmspace.h>\n#include <stdint.h>\n\n'
+        for name in ('runData', 'runOffsets', 'phraseData', 'phraseOffsets',
+                     'frameIndex'):
+            c_type, values = tables[name]
+            if values:
+                text += format_array(name, values, c_type) + '\n'
+        return text + self.get_decoder()
+
+    def get_report(self):
+        '''
+        Return a human-readable comparison with the legacy format.
+        '''
+        flat = [[c for w in p for c in w] for p in self.phrase_channels]
+        legacy_bytes = len(get_legacy_table(flat))
+        rows = [('', 'legacy', 'compact'),
+                ('Flash bytes', legacy_bytes, self.get_flash_bytes()),
+                ('Worst-case decode cycles', get_legacy_cycles(flat),
+                 self.get_worst_case_cycles()),
+                ('Frames indexed', 'no', '%d (period %d%s)' %
+                        (self.frames, len(self.index),
+                         ', direct' if self.direct else '')),
+                ('Unique phrases', len(flat), len(self.phrases)),
+                ('Runs in dictionary', '-', len(self.runs))]
+        return ''.join(['%s %s %s\n' % (str(a).ljust(26), str(b).rjust(8),
+                                        str(c).rjust(18)) for a, b, c in rows])
+
+
+class Emulator(object):
+
+    '''
+    Decode the tables of the firmware as the decoder of the microcontroller
+    does (see FirmwareTable.get_decoder), values truncated to their C type.
+    '''
+
+    def __init__(self, tables, period):
+        '''
+        - tables: dictionary {name:(c_type, values)}, as returned by
+          FirmwareTable.get_tables
+        - period: FRAME_PERIOD, the number of frames in the index
+        '''
+        masks = {'uint8_t':0xff, 'uint16_t':0xffff}
+        self.tables = dict([(name, [v & masks[t] for v in values])
+                            for name, (t, values) in tables.items()])
+        self.period = period
+
+    @classmethod
+    def from_table(cls, table):
+        return cls(table.get_tables(), len(table.index))
+
+    def show_frame(self, frame):
+        '''
+        Return the channels lit for "frame", in the order they are lit.
+        '''
+        frame_index = self.tables['frameIndex']
+        run_data = self.tables['runData']
+        run_offsets = self.tables['runOffsets']
+        phrase_data = self.tables['phraseData']
+        phrase_offsets = self.tables['phraseOffsets']
+        frame = (frame & 0xffff) % self.period
+        phrase = frame_index[frame] if frame_index else frame
+        channels = []
+        for p in xrange(phrase_offsets[phrase], phrase_offsets[phrase + 1]):
+            run = phrase_data[p]
+            channels.extend(run_data[run_offsets[run]:run_offsets[run + 1]])
+        return channels
+
+
+def get_mask(channels):
+    '''
+    Return the bitmask of a list of channels.
+    '''
+    mask = 0
+    for channel in channels:
+        mask |= 1 << channel
+    return mask
+
+def iter_clock_frames(clock):
+    '''
+    Iterate over the frames of a clock as tuples (time, phrase), where
+    time is in seconds from midnight.
+    '''
+    for hours, minutes, seconds in clock.iter_times():
+        yield (hours*3600 + minutes*60 + seconds,
+               clock.get_time_phrase(hours, minutes, seconds))
+
+def iter_pool_frames(pool):
+    '''
+    Iterate over the frames of a PhrasePool (see "iter_clock_frames"). If
+    the pool has no times, phrase "n" is shown by frame "n".
+    '''
+    if not any(pool.times):
+        for phrase_id in xrange(len(pool)):
+            yield (phrase_id, pool.get_text(phrase_id))
+        return
+    for phrase_id, times in enumerate(pool.times):
+        for time in times:
+            yield (time, pool.get_text(phrase_id))
+
+def verify(table, sequence, frames):
+    '''
+    Check that the firmware lights the right led strings for each frame.
+    Return the list of the mismatches, as tuples (frame, phrase,
+    expected_channels, decoded_channels), where "expected_channels" is None
+    if the sequence can't display the phrase at all.
+    - table: the FirmwareTable
+    - sequence: the supersequence, with its led strings set
+    - frames: list of tuples (time, phrase), see "iter_clock_frames". If the
+      table has no time step, frame "n" is the n-th tuple.
+    '''
+    emulator = Emulator.from_table(table)
+    expected_channels = {}  # cache, phrases are repeated in many frames
+    numbers, expected, decoded = [], [], []
+    mismatches = []
+    for n, (time, phrase) in enumerate(frames):
+        frame = time / table.step if table.step else n
+        if phrase not in expected_channels:
+            expected_channels[phrase] = sequence.get_phrase_channels(phrase)
+        try:
+            lit = emulator.show_frame(frame)
+        except IndexError:  # the decoder would read out of the tables
+            lit = None
+        if expected_channels[phrase] == None or lit == None:
+            mismatches.append((frame, phrase, expected_channels[phrase], lit))
+            continue
+        numbers.append((frame, phrase, lit))
+        expected.append(get_mask(expected_channels[phrase]))
+        decoded.append(get_mask(lit))
+    # Compare the whole day at once, and only look for the differing frames
+    # if there is any
+    if expected != decoded:
+        for (frame, phrase, lit), a, b in zip(numbers, expected, decoded):
+            if a != b:
+                mismatches.append((frame, phrase, expected_channels[phrase],
+                                   lit))
+    return sorted(mismatches)
+
+def get_verification_report(mismatches, frames_number, max_lines=20):
+    '''
+    Return a human-readable report of the output of "verify".
+    '''
+    if not mismatches:
+        return u'All %d frames light the right led strings.\n' % frames_number
+    text = u'%d frames out of %d are WRONG:\n' % (len(mismatches),
+                                                  frames_number)
+    for frame, phrase, expected, decoded in mismatches[:max_lines]:
+        if isinstance(phrase, str):
+            phrase = phrase.decode('utf-8')
+        if expected == None:
+            text += u'frame %d: "%s" can\'t be displayed\n' % (frame, phrase)
+        else:
+            text += u'frame %d: "%s" expected %s, decoded %s\n' % \
+                    (frame, phrase, sorted(expected), decoded and
+                     sorted(decoded))
+    if len(mismatches) > max_lines:
+        text += u'...\n'
+    return text
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
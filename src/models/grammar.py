@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Declarative grammars for clock plugins.
+
+A grammar is a list of rules, each of them a tuple (conditions, template):
+- conditions: a dictionary {variable:value} where "value" is either a number
+  or a container of numbers (e.g. a list or an xrange). A rule applies to a
+  time if all of its conditions are met. The first rule that applies wins.
+- template: the words of the phrase, separated by spaces. A word in the
+  form {table:variable} is replaced by the word for the value of "variable"
+  in the agreement table "table". A word in the form {table?:variable} is
+  optional: it is dropped if "table" has no word for the value.
+
+Tables are dictionaries {number:word} (a word can also be made of several
+words, e.g. compound numbers). The variables available to conditions and
+templates are (see "get_variables"):
+- h, m, s: hours (0-23), minutes (0-59) and seconds (0-59)
+- mt: minutes to the next hour (60-m)
+- h12: hours on a 12h clock face (0-11)
+- nh, nh12: the next hour (h+1, which can be 24) and its 12h version (1-12)
+
+Grammars are compiled when created: the phrases of a day (one every
+"granularity" seconds, one a minute by default) are generated once and
+stored as a table of phrase ids, so that getting the phrase for a given time
+is a lookup. Example (an English clock):
+
+    grammar = Grammar([({'m':0}, "It is {nums:h12} o'clock"),
+                       ({'m':xrange(1, 31)}, 'It is {nums:m} past {nums:h12}'),
+                       ({}, 'It is {nums:mt} to {nums:nh12}')],
+                      {'nums':{0:'twelve', 1:'one', ...}})
+'''
+
+import re
+import array
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+# A placeholder in a template: {table:variable} or {table?:variable}
+PLACEHOLDER = re.compile(r'^\{(\w+)(\??):(\w+)\}$')
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class GrammarError(Exception):
+
+    '''
+    Raised when a grammar is inconsistent (e.g. a time matches no rule).
+    '''
+
+    pass
+
+
+def get_variables(hours, minutes, seconds=0):
+    '''
+    Return the dictionary of the variables of a time (see the module
+    docstring).
+    '''
+    return {'h':hours,
+            'm':minutes,
+            's':seconds,
+            'mt':60 - minutes,
+            'h12':hours % 12,
+            'nh':hours + 1,
+            'nh12':hours % 12 + 1}
+
+
+class Grammar(object):
+
+    '''
+    A set of rules, compiled into a table of the phrases of a day.
+    '''
+
+    def __init__(self, rules, tables=None, separator=' ', granularity=60):
+        '''
+        - rules: list of tuples (conditions, template)
+        - tables: dictionary {table_name:{number:word}}
+        - separator: the string between words
+        - granularity: seconds between two entries of the compiled table
+        '''
+        self.tables = tables or {}
+        self.separator = separator
+        self.granularity = granularity
+        self.rules = [(self.__compile_conditions(c), self.__parse(t))
+                      for c, t in rules]
+        self.phrases = []  # unique phrases, indexed by phrase id
+        # Phrase id of each time of the day (a day has more than 65536
+        # seconds, so tables by the second might need more than 'H' ids)
+        self.table = array.array('H' if granularity >= 2 else 'I')
+        self.__compile()
+
+    def __compile_conditions(self, conditions):
+        compiled = []
+        for variable, value in conditions.items():
+            if isinstance(value, (int, long)):
+                value = (value,)
+            compiled.append((variable, frozenset(value)))
+        return compiled
+
+    def __parse(self, template):
+        '''
+        Return a template as a list of tokens: either plain words or tuples
+        (table, variable, optional).
+        '''
+        tokens = []
+        for word in template.split():
+            match = PLACEHOLDER.match(word)
+            if match == None:
+                tokens.append(word)
+                continue
+            table, optional, variable = match.groups()
+            if table not in self.tables:
+                raise GrammarError('Unknown table: %s' % table)
+            tokens.append((table, variable, optional == '?'))
+        return tokens
+
+    def __expand(self, tokens, variables):
+        words = []
+        for token in tokens:
+            if not isinstance(token, tuple):
+                words.append(token)
+                continue
+            table, variable, optional = token
+            try:
+                words.append(self.tables[table][variables[variable]])
+            except KeyError:
+                if not optional:
+                    raise GrammarError('No word in "%s" for %s=%s' %
+                            (table, variable, variables.get(variable)))
+        return self.separator.join(words)
+
+    def build_phrase(self, hours, minutes, seconds=0):
+        '''
+        Return the phrase for a time, applying the rules (without using the
+        compiled table).
+        '''
+        variables = get_variables(hours, minutes, seconds)
+        for conditions, tokens in self.rules:
+            for variable, values in conditions:
+                if variables[variable] not in values:
+                    break
+            else:
+                return self.__expand(tokens, variables)
+        raise GrammarError('No rule for %02d:%02d:%02d' %
+                           (hours, minutes, seconds))
+
+    def __compile(self):
+        ids = {}
+        for time in xrange(0, SECONDS_PER_DAY, self.granularity):
+            phrase = self.build_phrase(time/3600, time%3600/60, time%60)
+            if phrase not in ids:
+                ids[phrase] = len(self.phrases)
+                self.phrases.append(phrase)
+            self.table.append(ids[phrase])
+
+    def get_phrase_id(self, hours, minutes, seconds=0):
+        return self.table[(hours*3600 + minutes*60 + seconds) /
+                          self.granularity]
+
+    def get_phrase(self, hours, minutes, seconds=0):
+        '''
+        Return the phrase for a time (a lookup in the compiled table).
+        Times out of the day (e.g. 24:00, which approximations can produce)
+        are built on the fly.
+        '''
+        if 0 <= hours*3600 + minutes*60 + seconds < SECONDS_PER_DAY:
+            return self.phrases[self.get_phrase_id(hours, minutes, seconds)]
+        return self.build_phrase(hours, minutes, seconds)
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
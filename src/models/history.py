@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Undo/redo history of the changes to a supersequence.
+
+The history doesn't store copies of the supersequence: it listens to the
+changes of the sequence (see SuperSequence.add_listener) and stores the
+operations themselves, which are small tuples. Undoing a step applies the
+inverse operations, redoing it applies the operations again. Both go
+through SuperSequence.apply_operation, so any other listener (e.g. the
+autosave journal) gets notified as for any other change.
+'''
+
+import collections
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+def get_inverse(operation):
+    '''
+    Return the list of operations that revert "operation" (a tuple in the
+    form listeners are notified of).
+    '''
+    name, args = operation[0], operation[1:]
+    if name == 'swap':
+        pos_a, pos_b, spaces_a, spaces_b = args
+        inverse = [('swap', pos_b, pos_a)]
+        # After swapping back, the elements are again in their original
+        # positions, but stripped of their leading spaces
+        for pos, spaces in ((pos_a, spaces_a), (pos_b, spaces_b)):
+            if spaces:
+                inverse.append(('pad', pos, spaces))
+        return inverse
+    if name == 'pad':
+        return [('pad', args[0], -args[1])]
+    if name == 'merge':
+        return [('unmerge',) + args]
+    if name == 'unmerge':
+        return [('merge',) + args]
+    if name == 'pop':
+        return [('insert',) + args]
+    if name == 'insert':
+        return [('pop',) + args]
+    if name == 'cols':
+        return [('cols', args[1], args[0])]
+    raise BaseException('Unknown operation: %s' % name)
+
+def get_first_position(operations):
+    '''
+    Return the lowest position in the sequence affected by "operations"
+    (0 if the whole clockface is affected).
+    '''
+    positions = []
+    for operation in operations:
+        if operation[0] == 'cols':
+            return 0
+        if operation[0] in ('swap', 'merge', 'unmerge'):
+            positions.extend(operation[1:3])
+        else:  # pad, pop, insert: the other arguments aren't positions
+            positions.append(operation[1])
+    return min(positions)
+
+
+class History(object):
+
+    '''
+    Undo/redo history of a supersequence. Changes are grouped in steps: a
+    step is all the changes happened between two calls to "checkpoint".
+    '''
+
+    # Number of steps that can be undone
+    MAX_STEPS = 1000
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.undo_stack = collections.deque(maxlen=self.MAX_STEPS)
+        self.redo_stack = []
+        self.__step = None  # the operations of the step being recorded
+        self.__replaying = False
+        sequence.add_listener(self.record)
+
+    def record(self, operation, *args):
+        '''
+        Record a change (signature of a sequence listener).
+        '''
+        if self.__replaying:
+            return
+        if self.__step == None:
+            self.__step = []
+            self.undo_stack.append(self.__step)
+        self.__step.append((operation,) + args)
+        self.redo_stack = []
+
+    def checkpoint(self):
+        '''
+        Close the step being recorded: following changes go in a new one.
+        '''
+        if self.__step != None:
+            # Tuples take less memory than lists
+            self.undo_stack[-1] = tuple(self.__step)
+            self.__step = None
+
+    def can_undo(self):
+        return len(self.undo_stack) > 0
+
+    def can_redo(self):
+        return len(self.redo_stack) > 0
+
+    def __replay(self, operations):
+        self.__replaying = True
+        try:
+            for operation in operations:
+                self.sequence.apply_operation(*operation)
+        finally:
+            self.__replaying = False
+
+    def undo(self):
+        '''
+        Undo the last step. Return the lowest position in the sequence
+        affected by it, or None if there was nothing to undo.
+        '''
+        self.checkpoint()
+        if not self.can_undo():
+            return None
+        step = self.undo_stack.pop()
+        inverse = []
+        for operation in reversed(step):
+            inverse.extend(get_inverse(operation))
+        self.__replay(inverse)
+        self.redo_stack.append(step)
+        return get_first_position(step)
+
+    def redo(self):
+        '''
+        Redo the last undone step. Return the lowest position in the sequence
+        affected by it, or None if there was nothing to redo.
+        '''
+        self.checkpoint()
+        if not self.can_redo():
+            return None
+        step = self.redo_stack.pop()
+        self.__replay(step)
+        self.undo_stack.append(step)
+        return get_first_position(step)
+
+    def detach(self):
+        '''
+        Stop recording the changes to the sequence.
+        '''
+        self.sequence.remove_listener(self.record)
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
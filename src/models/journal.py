@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Journaled autosave of the changes to a supersequence.
+
+Every change to the supersequence (see SuperSequence.add_listener) is appended
+as a line to a journal file, so that the cost of saving an edit does not
+depend on the size of the project. Every COMPACT_EVERY changes, the whole
+project is written as a snapshot in a background thread, and the journal is
+then trimmed of the changes already included in the snapshot. Both files are
+fsynced by the background thread only: the thread recording the changes (the
+GUI) never waits for the disk.
+
+For a project saved as "foo.sav" the files are "foo.autosave" (the snapshot)
+and "foo.journal". Both are deleted when the project is saved or closed, so
+their presence means the last session did not end properly: "recover" the
+project by loading the snapshot and replaying the journal on it.
+
+The snapshot file is the first line {"session":ID, "seq":N}, followed by a
+regular project file (see the projectfile module). The journal file is the
+first line {"session":ID} followed by one line [seq, operation, args...] per
+change. Changes are numbered progressively within a session, and only those
+with a "seq" greater than the one of the snapshot are replayed.
+'''
+
+import os
+import json
+import time
+import threading
+import models.projectfile as projectfile
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+SNAPSHOT_EXTENSION = 'autosave'
+JOURNAL_EXTENSION = 'journal'
+
+
+def get_file_names(base_fname):
+    '''
+    Return a tuple (snapshot_fname, journal_fname) for a project file name.
+    '''
+    root = os.path.splitext(base_fname)[0]
+    return (root + '.' + SNAPSHOT_EXTENSION, root + '.' + JOURNAL_EXTENSION)
+
+def _write_synced(fname, data):
+    file_ = open(fname, 'wb')
+    file_.write(data)
+    file_.flush()
+    os.fsync(file_.fileno())
+    file_.close()
+
+def _write_atomically(fname, data):
+    _write_synced(fname + '.tmp', data)
+    os.rename(fname + '.tmp', fname)
+
+
+class Journal(object):
+
+    '''
+    Record the changes to a supersequence, compacting them periodically in a
+    snapshot of the whole project.
+    '''
+
+    # Number of changes after which a new snapshot is written
+    COMPACT_EVERY = 200
+
+    def __init__(self, base_fname, snapshot_factory):
+        '''
+        - base_fname: the file name of the project (it doesn't need to exist)
+        - snapshot_factory: callable returning the project serialised as by
+          projectfile.serialise()
+        '''
+        self.snapshot_fname, self.journal_fname = get_file_names(base_fname)
+        self.snapshot_factory = snapshot_factory
+        self.sequence = None
+        self.session = '%x-%x' % (int(time.time() * 1000), os.getpid())
+        self.seq = 0
+        self.tail = []  # (seq, line) of the changes not yet in a snapshot
+        self.snapshot_seq = None  # "seq" of the snapshot being written
+        self.committed_seq = None  # "seq" of the last snapshot on disk
+        self.__writer = None
+        self.__lock = threading.Lock()
+        self.__file = None
+
+    def attach(self, sequence):
+        '''
+        Start recording the changes to "sequence".
+        '''
+        self.sequence = sequence
+        directory = os.path.dirname(self.journal_fname)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # The first snapshot replaces the autosave of any previous session
+        # (which stays valid until then): until it is on disk, the changes
+        # are only kept in memory
+        self.compact()
+        sequence.add_listener(self.record)
+
+    def record(self, operation, *args):
+        '''
+        Append a change to the journal (signature of a sequence listener).
+        '''
+        self.seq += 1
+        line = json.dumps([self.seq, operation] + list(args),
+                          separators=(',', ':')) + '\n'
+        with self.__lock:
+            self.tail.append((self.seq, line))
+            if self.__file != None:
+                self.__file.write(line)
+                self.__file.flush()
+        if self.seq - (self.snapshot_seq or 0) >= self.COMPACT_EVERY:
+            self.compact()
+
+    def compact(self):
+        '''
+        Write a snapshot of the project in a background thread. Return False
+        if a snapshot is already being written.
+        '''
+        if self.__writer != None and self.__writer.is_alive():
+            return False
+        # Serialising must happen here, as the sequence is not thread-safe
+        header = json.dumps({'session':self.session, 'seq':self.seq})
+        data = header + '\n' + self.snapshot_factory()
+        self.snapshot_seq = self.seq
+        self.__writer = threading.Thread(target=self.__write_snapshot,
+                                         args=(data, self.seq))
+        self.__writer.daemon = True
+        self.__writer.start()
+        return True
+
+    def __write_snapshot(self, data, seq):
+        '''
+        Write a snapshot, then trim the journal of the changes it includes
+        (in the background thread).
+        '''
+        try:
+            _write_atomically(self.snapshot_fname, data)
+            self.__rewrite_journal(seq)
+        except (IOError, OSError):
+            pass  # the previous autosave files are still consistent
+
+    def __rewrite_journal(self, committed):
+        '''
+        Rewrite the journal without the changes up to "committed" (in the
+        background thread). The lock is only held to catch up with the
+        changes recorded meanwhile and to swap the files, not while syncing.
+        '''
+        with self.__lock:
+            self.tail = [(s, l) for s, l in self.tail if s > committed]
+            tail = self.tail[:]
+        header = json.dumps({'session':self.session}) + '\n'
+        tmp_fname = self.journal_fname + '.tmp'
+        _write_synced(tmp_fname, header + ''.join([l for s, l in tail]))
+        written = tail[-1][0] if tail else committed
+        with self.__lock:
+            file_ = open(tmp_fname, 'ab')
+            file_.write(''.join([l for s, l in self.tail if s > written]))
+            file_.close()
+            os.rename(tmp_fname, self.journal_fname)
+            if self.__file != None:
+                self.__file.close()
+            self.__file = open(self.journal_fname, 'ab')
+            self.committed_seq = committed
+
+    def wait(self):
+        '''
+        Block until the snapshot being written (if any) is on disk.
+        '''
+        if self.__writer != None:
+            self.__writer.join()
+
+    def stop(self, discard=True):
+        '''
+        Stop recording changes. If "discard" is True, delete the journal and
+        the snapshot from disk.
+        '''
+        if self.sequence != None:
+            self.sequence.remove_listener(self.record)
+            self.sequence = None
+        self.wait()
+        with self.__lock:
+            if self.__file != None:
+                self.__file.close()
+                self.__file = None
+        if discard:
+            discard_files(self.snapshot_fname)
+
+
+def discard_files(base_fname):
+    '''
+    Delete the autosave files of the project "base_fname".
+    '''
+    for fname in get_file_names(base_fname):
+        if os.path.exists(fname):
+            os.remove(fname)
+
+def has_autosave(base_fname):
+    '''
+    Return True if there is an autosave of "base_fname" more recent than the
+    project file itself.
+    '''
+    snapshot_fname = get_file_names(base_fname)[0]
+    if not os.path.exists(snapshot_fname):
+        return False
+    if not os.path.exists(base_fname):
+        return True
+    return os.path.getmtime(snapshot_fname) >= os.path.getmtime(base_fname)
+
+def recover(base_fname):
+    '''
+    Return a dictionary of project properties (see projectfile.deserialise)
+    rebuilt from the autosave files of "base_fname", or None if there is
+    no usable snapshot. Changes in the journal are replayed only if they
+    belong to the same session of the snapshot and follow it without gaps.
+    '''
+    snapshot_fname, journal_fname = get_file_names(base_fname)
+    try:
+        file_ = open(snapshot_fname, 'rb')
+        header_line, sep, data = file_.read().partition('\n')
+        file_.close()
+        header = json.loads(header_line)
+        properties = projectfile.deserialise(data)
+    except (IOError, ValueError, KeyError, projectfile.ProjectFileError):
+        return None
+    if properties['SCHEMA_VERSION'] != projectfile.SCHEMA_VERSION:
+        return None
+    sequence = properties['supersequence']
+    if sequence == None or not os.path.exists(journal_fname):
+        return properties
+    file_ = open(journal_fname, 'rb')
+    lines = file_.read().splitlines()
+    file_.close()
+    try:
+        if json.loads(lines[0]).get('session') != header['session']:
+            return properties
+    except (IndexError, ValueError):
+        return properties
+    expected = header['seq'] + 1
+    for line in lines[1:]:
+        try:
+            change = json.loads(line)
+        except ValueError:
+            break  # a partially written last line
+        if change[0] < expected:
+            continue
+        if change[0] > expected:
+            break
+        sequence.apply_operation(*change[1:])
+        expected += 1
+    return properties
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Assignment of the led strings of a clockface to the channels of the driver
+chips.
+
+The leds lighting each word of the clockface are wired in series in one or
+more "led strings", each of them driven by a channel of a constant current
+driver chip (TLC5940 by default). A lit channel dissipates on the chip the
+power not dropped by the leds of its string, so the chips driving more
+(and shorter) strings at the same time get hotter. The hottest chip limits
+the grayscale value (i.e. the brightness) that can be used for the whole
+clockface.
+
+The optimiser assigns strings to chips so that the worst-case dissipation
+of the hottest chip is as low as possible. Only the frames the clock
+actually displays are considered: two strings never lit together can share
+a chip at no cost. Strings are first assigned greedily, the ones that
+dissipate the most energy first (LPT, "longest processing time"), then the
+assignment is improved moving or swapping strings between the hottest chip
+and the others until no move helps or the time limit expires.
+'''
+
+import math
+import time
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+# Electrical constants, see "get_specs"
+DEFAULT_SPECS = {'max_leds_per_string':7,
+                 'channels_per_chip':16,  # channels of a chip
+                 'used_channels':15,  # channels used on each chip
+                 'led_input_v':24.0,  # volts
+                 'led_drop_v':3.25,  # volts
+                 'current':0.021,  # amperes
+                 'base_dissipation':0.060,  # watts (chip quiescent)
+                 'max_chip_dissipation':1.053,  # watts
+                 'dot_correction':63/63.0,
+                 'max_gs_value':4095,
+                 'duty_cycle':1.0}
+
+
+def get_specs(**overrides):
+    '''
+    Return the electrical constants: DEFAULT_SPECS updated with "overrides".
+    '''
+    unknown = set(overrides) - set(DEFAULT_SPECS)
+    if unknown:
+        raise BaseException('Unknown electrical constants: %s' %
+                            ', '.join(sorted(unknown)))
+    specs = DEFAULT_SPECS.copy()
+    specs.update(overrides)
+    return specs
+
+def get_channel_dissipation(leds, specs):
+    '''
+    Return the power (watts) dissipated by a channel lighting "leds" leds.
+    '''
+    return max(specs['led_input_v'] - leds * specs['led_drop_v'], 0) * \
+           specs['current'] * specs['dot_correction'] * specs['duty_cycle']
+
+def get_max_gs(dissipation, specs):
+    '''
+    Return the highest grayscale value a chip can use if its channels
+    dissipate "dissipation" watts at full brightness.
+    '''
+    if dissipation <= 0:
+        return specs['max_gs_value']
+    headroom = specs['max_chip_dissipation'] - specs['base_dissipation']
+    return min(specs['max_gs_value'],
+               int(round(specs['max_gs_value'] * headroom / dissipation)))
+
+def split_in_strings(leds, max_leds):
+    '''
+    Return the number of leds of each of the strings needed to light "leds"
+    leds, as evenly as possible.
+    '''
+    number = int(math.ceil(leds * 1.0 / max_leds))
+    return [leds / number + (1 if i < leds % number else 0)
+            for i in range(number)]
+
+def get_channel_number(chip, channel, specs):
+    '''
+    Return the global number of a channel (as used in the firmware table).
+    '''
+    return chip * specs['channels_per_chip'] + channel
+
+
+class LedStringOptimiser(object):
+
+    '''
+    Assign led strings to chips minimising the worst-case dissipation of the
+    hottest chip over the frames that are displayed.
+    '''
+
+    def __init__(self, leds, frames, specs=None):
+        '''
+        - leds: list with the number of leds of each string
+        - frames: list with the set of the frames (any hashable id, e.g. a
+          phrase id) in which each string is lit
+        - specs: electrical constants (see "get_specs")
+        '''
+        self.specs = specs or get_specs()
+        self.capacity = self.specs['used_channels']
+        self.weights = [get_channel_dissipation(l, self.specs) for l in leds]
+        # Frames are renumbered 0..n, for the load tables
+        ids = {}
+        self.frames = []
+        for string_frames in frames:
+            self.frames.append(frozenset([ids.setdefault(f, len(ids))
+                                          for f in string_frames]))
+        self.frames_number = len(ids)
+        self.chips_number = max(1, int(math.ceil(len(leds) * 1.0 /
+                                                 self.capacity)))
+
+    def __get_loads(self, assignment):
+        '''
+        Return the dissipation of each chip in each frame, for an assignment
+        (a list with the chip of each string).
+        '''
+        loads = [[0.0] * self.frames_number for c in range(self.chips_number)]
+        for string, chip in enumerate(assignment):
+            load, weight = loads[chip], self.weights[string]
+            for frame in self.frames[string]:
+                load[frame] += weight
+        return loads
+
+    def get_dissipations(self, assignment):
+        '''
+        Return the worst-case dissipation (watts, the quiescent dissipation
+        excluded) of each chip for "assignment".
+        '''
+        return [max(load or [0.0]) for load in self.__get_loads(assignment)]
+
+    def get_sequential_assignment(self):
+        '''
+        Return the assignment filling the channels in the order of the
+        strings (the naive wiring).
+        '''
+        return [string / self.capacity for string in range(len(self.weights))]
+
+    def get_greedy_assignment(self):
+        '''
+        Return the LPT assignment: strings are taken by decreasing energy
+        and each of them goes to the chip where it raises the worst-case
+        dissipation the least.
+        '''
+        order = sorted(range(len(self.weights)), reverse=True,
+                       key=lambda s: (self.weights[s] * len(self.frames[s]),
+                                      self.weights[s]))
+        loads = [[0.0] * self.frames_number for c in range(self.chips_number)]
+        peaks = [0.0] * self.chips_number
+        counts = [0] * self.chips_number
+        assignment = [None] * len(self.weights)
+        for string in order:
+            weight, frames = self.weights[string], self.frames[string]
+            best = None
+            for chip in range(self.chips_number):
+                if counts[chip] == self.capacity:
+                    continue
+                load = loads[chip]
+                peak = max([peaks[chip]] +
+                           [load[frame] + weight for frame in frames])
+                if best == None or (peak, counts[chip]) < best[:2]:
+                    best = (peak, counts[chip], chip)
+            chip = best[2]
+            for frame in frames:
+                loads[chip][frame] += weight
+            peaks[chip] = best[0]
+            counts[chip] += 1
+            assignment[string] = chip
+        return assignment
+
+    def __get_peak(self, load, order, removed, added):
+        '''
+        Return the peak of "load" after removing the string "removed" and
+        adding the string "added" (either can be None). "order" is the list
+        of the frames sorted by decreasing load.
+        '''
+        changed = {}
+        for string, sign in ((removed, -1), (added, 1)):
+            if string != None:
+                weight = sign * self.weights[string]
+                for frame in self.frames[string]:
+                    changed[frame] = changed.get(frame, load[frame]) + weight
+        peak = max(changed.values() or [0.0])
+        for frame in order:
+            if frame not in changed:
+                return max(peak, load[frame])
+        return peak
+
+    def improve(self, assignment, time_limit=2.0):
+        '''
+        Improve "assignment" in place moving or swapping strings between the
+        hottest chip and the others. Stop when no move helps or after
+        "time_limit" seconds. Return the assignment.
+        '''
+        deadline = time.time() + time_limit
+        while time.time() < deadline:
+            loads = self.__get_loads(assignment)
+            peaks = [max(load or [0.0]) for load in loads]
+            hottest = peaks.index(max(peaks))
+            members = [[] for c in range(self.chips_number)]
+            for string, chip in enumerate(assignment):
+                members[chip].append(string)
+            orders = [sorted(range(self.frames_number), reverse=True,
+                             key=load.__getitem__) for load in loads]
+            move = self.__find_move(assignment, loads, peaks, orders,
+                                    members, hottest, deadline)
+            if move == None:
+                break
+            for string, chip in move:
+                assignment[string] = chip
+        return assignment
+
+    def __find_move(self, assignment, loads, peaks, orders, members,
+                    hottest, deadline):
+        '''
+        Return the first move (a list of (string, new_chip) tuples) that
+        lowers the peak of the hottest chip without making another chip as
+        hot, or None.
+        '''
+        limit = peaks[hottest]
+        for string in sorted(members[hottest], reverse=True,
+                             key=self.weights.__getitem__):
+            for chip in range(self.chips_number):
+                if chip == hottest:
+                    continue
+                if time.time() > deadline:
+                    return None
+                # Candidates: moving to a free channel, or swapping
+                others = members[chip][:]
+                if len(others) < self.capacity:
+                    others.insert(0, None)
+                for other in others:
+                    new_hot = self.__get_peak(loads[hottest], orders[hottest],
+                                              string, other)
+                    if new_hot >= limit - 1e-9:
+                        continue
+                    new_cold = self.__get_peak(loads[chip], orders[chip],
+                                               other, string)
+                    if new_cold < limit - 1e-9:
+                        move = [(string, chip)]
+                        if other != None:
+                            move.append((other, hottest))
+                        return move
+        return None
+
+    def optimise(self, time_limit=2.0):
+        '''
+        Return the best assignment found within "time_limit" seconds, as a
+        list with the chip of each string.
+        '''
+        assignment = self.get_greedy_assignment()
+        return self.improve(assignment, time_limit)
+
+    def get_channels(self, assignment):
+        '''
+        Return the global channel number (see "get_channel_number") of each
+        string. Within a chip, channels follow the order of the strings.
+        '''
+        counts = [0] * self.chips_number
+        channels = []
+        for chip in assignment:
+            channels.append(get_channel_number(chip, counts[chip],
+                                               self.specs))
+            counts[chip] += 1
+        return channels
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
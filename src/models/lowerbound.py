@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Lower bounds on the size of a supersequence and of its board.
+
+The words of a supersequence are words of the phrases, and an element can
+display its own word or any word contained in it (see
+SuperSequence.merge_elements), but only one word per phrase. The bounds
+come from what every sane supersequence must have:
+
+- multiplicity: a phrase displaying "n" words containing the word "w" (e.g.
+  "seven" and "seventeen" both contain "seven") needs "n" different
+  elements containing "w". Words are processed longest first: the elements
+  already required for other words are counted as able to display "w" if
+  any word of the phrases contains both, and only the missing ones are
+  added, each as long as "w" at least.
+- order: two words that are displayed in both orders by different phrases
+  (e.g. "one" before "to" and "to" before "one") need at least one of them
+  to appear twice. This is only counted for words needing one element,
+  neither containing nor contained in other words, and for pairs with no
+  word in common (a matching of the conflicting pairs).
+
+The char bound is the sum of the lengths of the required elements, the
+element bound their number. The board can't be smaller than the char bound
+(see get_panel_size). Since the bounds are valid for any supersequence, the
+optimisers can stop as soon as they reach them.
+'''
+
+import math
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+def get_panel_size(chars):
+    '''
+    Return the closest panel size to a perfect square needed to contain
+    chars, as a tuple (x, y, extra cells).
+    '''
+    root = int(math.sqrt(chars))
+    if root**2 >= chars:
+        x, y = root, root
+    elif (root+1)*root >= chars:
+        x, y = root+1, root
+    else:
+        x, y = root+1, root+1
+    return x, y, x*y-chars
+
+def get_gap(chars, bound):
+    '''
+    Return how far (in percent of the bound) a supersequence of "chars"
+    chars is from the char bound "bound": the supersequence is within this
+    percentage of the optimal one.
+    '''
+    return 100.0 * (chars - bound) / bound if bound else 0.0
+
+
+class LowerBound(object):
+
+    '''
+    Lower bounds on the supersequences of the phrases of a PhrasePool.
+    '''
+
+    def __init__(self, pool):
+        '''
+        - pool: PhrasePool of the phrases the supersequence must display
+        '''
+        self.pool = pool
+        vocabulary = pool.vocabulary
+        size = len(vocabulary)
+        # {word id:ids of the words containing it, itself included}
+        self.containers = [set([j for j in xrange(size)
+                                if vocabulary[i] in vocabulary[j]])
+                           for i in xrange(size)]
+        self.needs = self.__get_needs()
+        self.forced = self.__get_forced()
+        self.conflicts = self.__get_conflicts()
+        self.elements = sum(self.forced.values()) + len(self.conflicts)
+        self.chars = sum([n * len(vocabulary[w])
+                          for w, n in self.forced.items()]) + \
+                     sum([min(len(vocabulary[a]), len(vocabulary[b]))
+                          for a, b in self.conflicts])
+
+    def __get_needs(self):
+        '''
+        Return {word id:number of elements containing it}, the most needed
+        by any single phrase.
+        '''
+        needs = dict.fromkeys(xrange(len(self.pool.vocabulary)), 0)
+        for phrase in self.pool.phrases:
+            counts = {}
+            for word in phrase:
+                counts[word] = counts.get(word, 0) + 1
+            for word in counts:
+                containing = sum([counts.get(other, 0)
+                                  for other in self.containers[word]])
+                needs[word] = max(needs[word], containing)
+        return needs
+
+    def __get_forced(self):
+        '''
+        Return {word id:number of elements required for it}.
+        '''
+        vocabulary = self.pool.vocabulary
+        forced = {}
+        for word in sorted(self.needs, key=lambda w: (-len(vocabulary[w]),
+                                                      vocabulary[w])):
+            # Elements required for "other" might be words containing both
+            supply = sum([n for other, n in forced.items()
+                          if self.containers[other] & self.containers[word]])
+            if self.needs[word] > supply:
+                forced[word] = self.needs[word] - supply
+        return forced
+
+    def __get_conflicts(self):
+        '''
+        Return a list of pairs of word ids displayed in both orders, each
+        requiring an extra element for one of its words.
+        '''
+        vocabulary = self.pool.vocabulary
+        isolated = set([w for w, n in self.needs.items() if n == 1 and
+                        self.containers[w] == set([w]) and
+                        sum([w in c for c in self.containers]) == 1])
+        orders = set()
+        for phrase in self.pool.phrases:
+            words = [w for w in phrase if w in isolated]
+            for i, first in enumerate(words):
+                for second in words[i+1:]:
+                    orders.add((first, second))
+        pairs = [(a, b) for a, b in orders if a < b and (b, a) in orders]
+        # Greedy matching, the longest extra elements first
+        pairs.sort(key=lambda p: (-min(len(vocabulary[p[0]]),
+                                       len(vocabulary[p[1]])), p))
+        matched = set()
+        conflicts = []
+        for a, b in pairs:
+            if a not in matched and b not in matched:
+                matched.update((a, b))
+                conflicts.append((a, b))
+        return conflicts
+
+    def get_panel_size(self):
+        '''
+        Return the smallest panel that can host the char bound, see
+        get_panel_size.
+        '''
+        return get_panel_size(self.chars)
+
+    def get_gap(self, chars):
+        '''
+        Return how far (in percent) a supersequence of "chars" chars is from
+        the char bound.
+        '''
+        return get_gap(chars, self.chars)
+
+    def get_report(self, chars=None):
+        '''
+        Return a human-readable summary of the bounds (and of the gap of a
+        supersequence of "chars" chars, if given).
+        '''
+        text = 'Lower bound: %d elements, %d chars\n' % (self.elements,
+                                                        self.chars)
+        text += 'Minimum board size (X, Y, extra cells): %s\n' % \
+                str(self.get_panel_size())
+        if chars != None:
+            text += 'Within %.1f%% of optimal (%d chars)\n' % \
+                    (self.get_gap(chars), chars)
+        return text
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+A pool of time phrases, each stored once as an array of word ids.
+
+The phrases of a clock are used by many stages of the program: the heuristic
+generating the supersequence, the sanity checks of the supersequence, the
+spacing of its elements, the mapping of the led strings... Instead of
+passing around lists of strings (and splitting and decoding them over and
+over), all of these stages share a PhrasePool:
+- every different word gets an integer id in the vocabulary of the pool
+- every unique phrase is stored as a compact array of word ids (and the
+  strings of the phrases are not kept)
+- for every phrase the pool keeps its multiplicity (how many times of the
+  day display it) and the list of those times
+- sets of phrases (e.g. the phrases using a word) are bitsets: python ints
+  with bit "n" set if phrase "n" is in the set
+
+Words are stored as unicode strings, as the words of the supersequence
+elements, so that the two can be compared directly.
+'''
+
+import array
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+# Typecodes of the arrays of word ids and of times (in seconds from midnight)
+WORD_ID_TYPECODE = 'H'
+TIME_TYPECODE = 'I'
+
+
+class PhrasePool(object):
+
+    '''
+    Collection of unique phrases, stored as arrays of word ids. A phrase is
+    addressed by its phrase id (its index in "phrases").
+    '''
+
+    def __init__(self, phrases=()):
+        '''
+        - phrases: iterable of phrases (strings) to add to the pool
+        '''
+        self.vocabulary = []  # words, indexed by word id
+        self.word_ids = {}  # {word:word id}
+        self.phrases = []  # arrays of word ids, indexed by phrase id
+        self.multiplicity = array.array('I')  # indexed by phrase id
+        self.times = []  # arrays of times, indexed by phrase id
+        # {packed word ids:phrase id}, only kept while the pool is built
+        self.__phrase_ids = None
+        self.__bigrams = None
+        self.__word_bits = None
+        for phrase in phrases:
+            self.add(phrase)
+        self.__phrase_ids = None
+
+    @classmethod
+    def from_clock(cls, clock):
+        '''
+        Return the pool of all the phrases a clock displays in a day.
+        '''
+        pool = cls()
+        for hours, minutes, seconds in clock.iter_times():
+            pool.add(clock.get_time_phrase(hours, minutes, seconds),
+                     hours*3600 + minutes*60 + seconds)
+        pool.__phrase_ids = None
+        return pool
+
+    def __copy__(self):
+        # Pools are shared, not copied (e.g. by clones of a supersequence)
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def __iter__(self):
+        '''
+        Iterate over the phrases as (unicode) strings.
+        '''
+        for phrase_id in xrange(len(self.phrases)):
+            yield self.get_text(phrase_id)
+
+    def intern(self, word):
+        '''
+        Return the id of "word", adding it to the vocabulary if needed.
+        '''
+        if isinstance(word, str):
+            word = word.decode('utf-8')
+        try:
+            return self.word_ids[word]
+        except KeyError:
+            self.word_ids[word] = len(self.vocabulary)
+            self.vocabulary.append(word)
+            return self.word_ids[word]
+
+    def tokenise(self, text):
+        '''
+        Return the tuple of word ids of "text" (a string of words).
+        '''
+        return tuple([self.intern(word) for word in text.split()])
+
+    def join(self, word_ids, separator=u' '):
+        '''
+        Return the unicode string of the words with ids "word_ids".
+        '''
+        return separator.join([self.vocabulary[i] for i in word_ids])
+
+    def add(self, phrase, time=None):
+        '''
+        Add an occurrence of "phrase" (displayed at "time", in seconds from
+        midnight, if given). Return the phrase id.
+        '''
+        words = array.array(WORD_ID_TYPECODE, self.tokenise(phrase))
+        key = words.tostring()
+        if self.__phrase_ids == None:
+            self.__phrase_ids = dict([(p.tostring(), i) for i, p in
+                                      enumerate(self.phrases)])
+        try:
+            phrase_id = self.__phrase_ids[key]
+        except KeyError:
+            phrase_id = len(self.phrases)
+            self.__phrase_ids[key] = phrase_id
+            self.phrases.append(words)
+            self.multiplicity.append(0)
+            self.times.append(array.array(TIME_TYPECODE))
+            self.__bigrams = None
+            self.__word_bits = None
+        self.multiplicity[phrase_id] += 1
+        if time != None:
+            self.times[phrase_id].append(time)
+        return phrase_id
+
+    def get_phrase_id(self, phrase):
+        '''
+        Return the id of "phrase" (as given to "add"), or None if the phrase
+        is not in the pool.
+        '''
+        if isinstance(phrase, str):
+            phrase = phrase.decode('utf-8')
+        words = [self.word_ids.get(word) for word in phrase.split()]
+        if None in words:
+            return None
+        words = array.array(WORD_ID_TYPECODE, words)
+        for phrase_id, other in enumerate(self.phrases):
+            if other == words:
+                return phrase_id
+        return None
+
+    def get_words(self, phrase_id):
+        '''
+        Return the words of a phrase, as a tuple of unicode strings.
+        '''
+        return tuple([self.vocabulary[i] for i in self.phrases[phrase_id]])
+
+    def get_text(self, phrase_id):
+        '''
+        Return a phrase as a unicode string.
+        '''
+        return self.join(self.phrases[phrase_id])
+
+    def has_bigram(self, first, second):
+        '''
+        Return True if the word "second" follows the word "first" in at
+        least one phrase of the pool.
+        '''
+        if self.__bigrams == None:
+            self.__bigrams = set()
+            for phrase in self.phrases:
+                self.__bigrams.update(zip(phrase, phrase[1:]))
+        try:
+            pair = (self.word_ids[first], self.word_ids[second])
+        except KeyError:  # at least one of the words is not in the pool
+            return False
+        return pair in self.__bigrams
+
+    def get_word_bits(self, word):
+        '''
+        Return the phrases using the word "word", as a bitset (bit "n" set if
+        phrase "n" uses the word).
+        '''
+        if self.__word_bits == None:
+            self.__word_bits = {}
+            for phrase_id, phrase in enumerate(self.phrases):
+                for word_id in set(phrase):
+                    self.__word_bits[word_id] = \
+                            self.__word_bits.get(word_id, 0) | 1 << phrase_id
+        if isinstance(word, str):
+            word = word.decode('utf-8')
+        try:
+            return self.__word_bits.get(self.word_ids[word], 0)
+        except KeyError:  # the word is not in the pool
+            return 0
+
+
+def iter_bits(bits):
+    '''
+    Iterate over the indexes of the bits set in "bits" (e.g. the ids of the
+    phrases in a bitset of phrases), lowest first.
+    '''
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def as_pool(phrases):
+    '''
+    Return "phrases" as a PhrasePool: pools are returned as they are, any
+    other iterable of strings is added to a new pool.
+    '''
+    if phrases == None or isinstance(phrases, PhrasePool):
+        return phrases
+    return PhrasePool(phrases)
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
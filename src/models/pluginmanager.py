@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Discovery of plugin modules (clocks, led drivers...).
+
+Plugin modules are discovered without importing them: the information on
+each of them (its name, description...) is read from the source code of its
+plugin class. This information is cached on disk and only read again for
+the files that changed. Modules are imported only when a plugin is actually
+needed (see PluginManager.get_plugin_class).
+
+Modules are looked for in a directory of Chasy (e.g. "plugins/clocks") and
+- if setuptools is installed - in an entry point group (e.g.
+"chasy.clocks"), so that third-party packages can provide plugins, e.g. in
+their setup.py:
+
+    entry_points={'chasy.clocks':['myclock = mypackage.myclock:Clock']}
+
+Each kind of plugin has its own subclass of PluginManager, which sets the
+class attributes describing where and how to look for the modules.
+'''
+
+import ast
+import glob
+import json
+import os.path
+import pkgutil
+import importlib
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+# Directory containing the plugin directories shipped with Chasy
+PLUGINS_ROOT = os.path.join(os.path.dirname(os.path.dirname(
+                            os.path.abspath(__file__))), 'plugins')
+# Directory of the caches of the information on the modules
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.chasy')
+
+
+def scan_source(fname, class_name, special_strings):
+    '''
+    Return a dictionary with the special strings (the names in
+    "special_strings", without the double underscores) defined as literals
+    in the body of the class "class_name" in the python file "fname", or
+    None if the class (or its "__module_name__") is not found.
+    '''
+    file_ = open(fname, 'rb')
+    try:
+        tree = ast.parse(file_.read(), fname)
+    finally:
+        file_.close()
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == class_name:
+            break
+    else:
+        return None
+    info = {}
+    for statement in node.body:
+        if not isinstance(statement, ast.Assign):
+            continue
+        for target in statement.targets:
+            if not isinstance(target, ast.Name):
+                continue
+            name = target.id[2:-2]
+            if target.id == '__%s__' % name and name in special_strings:
+                try:
+                    info[name] = ast.literal_eval(statement.value)
+                except ValueError:  # not a literal
+                    pass
+    if 'module_name' not in info:
+        return None
+    return info
+
+def get_class_info(class_, special_strings):
+    '''
+    Return a dictionary with the special strings of an imported class.
+    '''
+    info = {}
+    for name in special_strings:
+        info[name] = getattr(class_, '__%s__' % name, None)
+    return info
+
+
+class PluginManager(object):
+
+    '''
+    Expose convenience methods for managing plugin modules.
+
+    Unless specified otherwise, modules are addressed using their
+    human-readable name [defined within the module itself by __module_name__].
+    '''
+
+    # Package of the modules shipped with Chasy
+    PLUGIN_PACKAGE = None
+    # Entry point group for third-party modules
+    ENTRY_POINT_GROUP = None
+    # Name of the plugin class in the modules
+    CLASS_NAME = None
+    # Special strings read from the plugin class (__xxxx__)
+    SPECIAL_STRINGS = ('module_name', 'authors', 'description')
+
+    def __init__(self, cache_fname, plugin_dir):
+        '''
+        Discover all available modules and organise a human-readable list of
+        them in the form {'human_name':info}, where "info" is a dictionary
+        with the special strings of the module and the information needed to
+        import it.
+        - cache_fname: the on-disk cache (None to disable it)
+        - plugin_dir: the directory with the modules of PLUGIN_PACKAGE
+        '''
+        self.cache_fname = cache_fname
+        self.cache = self.__load_cache()
+        self.__cache_changed = False
+        self.__classes = {}  # imported plugin classes
+        self.modules = {}
+        for fname in sorted(glob.glob(os.path.join(plugin_dir, '*.py'))):
+            module_name = os.path.split(fname)[1][:-3]
+            if module_name != '__init__':
+                self.__add(fname, self.PLUGIN_PACKAGE + '.' + module_name,
+                           self.CLASS_NAME)
+        self.__add_entry_points()
+        if self.__cache_changed and self.cache_fname != None:
+            self.__save_cache()
+
+    def __load_cache(self):
+        if self.cache_fname == None:
+            return {}
+        try:
+            file_ = open(self.cache_fname, 'rb')
+            try:
+                return json.load(file_)
+            finally:
+                file_.close()
+        except (IOError, ValueError):
+            return {}
+
+    def __save_cache(self):
+        try:
+            directory = os.path.dirname(self.cache_fname)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            file_ = open(self.cache_fname, 'wb')
+            json.dump(self.cache, file_, sort_keys=True, indent=1)
+            file_.close()
+        except (IOError, OSError):
+            pass  # the cache is only an optimisation
+
+    def __get_info(self, fname, class_name):
+        '''
+        Return the special strings of a module file, from the cache if the
+        file has not changed since it was scanned.
+        '''
+        stat = os.stat(fname)
+        key = '%s:%s' % (os.path.abspath(fname), class_name)
+        signature = [stat.st_mtime, stat.st_size]
+        cached = self.cache.get(key)
+        if cached and cached['signature'] == signature:
+            return cached['info']
+        info = scan_source(fname, class_name, self.SPECIAL_STRINGS)
+        self.cache[key] = {'signature':signature, 'info':info}
+        self.__cache_changed = True
+        return info
+
+    def __add(self, fname, import_name, class_name, info=None):
+        '''
+        Add a module to the available ones. If "info" is not given, it is
+        read from the source file "fname".
+        '''
+        if info == None:
+            try:
+                info = self.__get_info(fname, class_name)
+            except (IOError, OSError, SyntaxError):
+                info = None
+        if info == None:
+            # Not statically readable: fall back to importing the module
+            try:
+                info = get_class_info(self.__import(import_name, class_name),
+                                      self.SPECIAL_STRINGS)
+            except Exception:
+                print('Unable to load plugin module: %s' % import_name)
+                return
+        info = dict(info)
+        info['import_name'] = import_name
+        info['class_name'] = class_name
+        self.modules[info['module_name']] = info
+
+    def __add_entry_points(self):
+        '''
+        Add the modules registered by other packages as entry points.
+        '''
+        try:
+            import pkg_resources
+        except ImportError:
+            return
+        for entry_point in pkg_resources.iter_entry_points(
+                                                    self.ENTRY_POINT_GROUP):
+            import_name = entry_point.module_name
+            class_name = entry_point.attrs[0] if entry_point.attrs \
+                         else self.CLASS_NAME
+            fname = None
+            try:
+                # Only the parent packages get imported here
+                loader = pkgutil.get_loader(import_name)
+                fname = loader.get_filename()
+            except Exception:
+                pass
+            if fname and fname.endswith('.py'):
+                self.__add(fname, import_name, class_name)
+            else:
+                self.__add_from_entry_point(entry_point, class_name)
+
+    def __add_from_entry_point(self, entry_point, class_name):
+        try:
+            class_ = entry_point.load()
+        except Exception:
+            print('Unable to load plugin module: %s' %
+                  entry_point.module_name)
+            return
+        self.__classes[entry_point.module_name] = class_
+        self.__add(None, entry_point.module_name, class_name,
+                   get_class_info(class_, self.SPECIAL_STRINGS))
+
+    def __import(self, import_name, class_name):
+        '''
+        Return the plugin class of a module, importing the module if needed.
+        '''
+        try:
+            return self.__classes[import_name]
+        except KeyError:
+            pass
+        module = importlib.import_module(import_name)
+        self.__classes[import_name] = getattr(module, class_name)
+        return self.__classes[import_name]
+
+    def get_plugin_class(self, module_name):
+        '''
+        Return the plugin class of module "module_name" (the module is
+        imported on the first call).
+        '''
+        info = self.modules[module_name]
+        return self.__import(info['import_name'], info['class_name'])
+
+    def _get_module_specialstring(self, module_name, property_name):
+        '''
+        Return the any of the special strings (__xxxx__) from a given module.
+        '''
+        return self.modules[module_name].get(property_name)
+
+    def get_all_module_names(self):
+        '''
+        Return the list of all the available modules.
+        '''
+        return [name for name in self.modules]
+
+    def get_module_description(self, module_name):
+        '''
+        Return the description of the module as given by its author.
+        '''
+        raw = self._get_module_specialstring(module_name, 'description')
+        return ' '.join((raw or '').split())
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
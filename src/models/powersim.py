@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Whole-day simulation of the power needs of the clockface.
+
+For every frame of the day the simulation knows exactly which led strings
+are lit (it decodes the firmware table, see firmware.Emulator), and computes:
+- the current drawn through each chip and in total (each lit string draws
+  the constant current of its channel)
+- the number of leds lit at the same time
+- the dissipation of each chip: its quiescent dissipation plus the power
+  not dropped by the leds of its lit channels
+
+A clock displays few different frames (one per unique phrase), so the
+values are computed once per different frame and then looked up for each
+time of the day.
+'''
+
+import csv
+import models.firmware as firmware
+import models.ledstrings as ledstrings
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+def get_table_frames(table):
+    '''
+    Return the frames of a day as a list of tuples (time, mask), decoding
+    the FirmwareTable "table" (time is in seconds from midnight, or the
+    frame number if the table has no time step).
+    '''
+    emulator = firmware.Emulator.from_table(table)
+    step = table.step or 1
+    return [(frame * step, firmware.get_mask(emulator.show_frame(frame)))
+            for frame in xrange(table.frames)]
+
+def format_time(seconds):
+    '''
+    Return a time of the day as HH:MM (HH:MM:SS if it has seconds).
+    '''
+    fields = [seconds / 3600, seconds % 3600 / 60]
+    if seconds % 60:
+        fields.append(seconds % 60)
+    return ':'.join([str(f).zfill(2) for f in fields])
+
+
+class PowerSimulation(object):
+
+    '''
+    Currents and dissipations of a clockface for all the frames of a day.
+    '''
+
+    def __init__(self, sequence, frames, specs=None):
+        '''
+        - sequence: the supersequence, with its led strings set (see
+          SuperSequence.set_led_strings)
+        - frames: list of tuples (time, mask), see "get_table_frames"
+        - specs: electrical constants (see ledstrings.get_specs)
+        '''
+        self.specs = specs or ledstrings.get_specs()
+        self.leds = {}  # {channel:number of leds of its string}
+        for el in sequence:
+            self.leds.update(zip(el.led_strings, el.led_string_leds))
+        per_chip = self.specs['channels_per_chip']
+        self.chips = max(self.leds or [0]) / per_chip + 1
+        self.times = [time for time, mask in frames]
+        self.masks = [mask for time, mask in frames]
+        # Values of each different frame
+        self.values = {}
+        for mask in set(self.masks):
+            self.values[mask] = self.__simulate(mask)
+
+    def __simulate(self, mask):
+        '''
+        Return a tuple (leds, currents, dissipations) for a frame, where
+        the last two are lists with the value of each chip.
+        '''
+        specs = self.specs
+        leds = 0
+        currents = [0.0] * self.chips
+        dissipations = [specs['base_dissipation']] * self.chips
+        for channel, string_leds in self.leds.items():
+            if mask >> channel & 1:
+                chip = channel / specs['channels_per_chip']
+                leds += string_leds
+                currents[chip] += specs['current'] * specs['duty_cycle']
+                dissipations[chip] += ledstrings.get_channel_dissipation(
+                                                        string_leds, specs)
+        return leds, currents, dissipations
+
+    def __get_peak(self, key):
+        '''
+        Return a tuple (value, time) for the frame with the highest "key".
+        '''
+        best = max(set(self.masks), key=lambda m: key(self.values[m]))
+        return key(self.values[best]), self.times[self.masks.index(best)]
+
+    def get_peak_leds(self):
+        return self.__get_peak(lambda v: v[0])
+
+    def get_peak_current(self):
+        return self.__get_peak(lambda v: sum(v[1]))
+
+    def get_average_current(self):
+        return sum([sum(self.values[m][1]) for m in self.masks]) / \
+               max(len(self.masks), 1)
+
+    def get_chip_peaks(self):
+        '''
+        Return the list of the worst-case (dissipation, time) of each chip.
+        '''
+        return [self.__get_peak(lambda v: v[2][chip])
+                for chip in range(self.chips)]
+
+    def get_report(self):
+        '''
+        Return a human-readable summary of the simulation.
+        '''
+        specs = self.specs
+        leds, leds_time = self.get_peak_leds()
+        current, current_time = self.get_peak_current()
+        text = 'Peak simultaneous leds: %d at %s\n' % (leds,
+                                                      format_time(leds_time))
+        text += 'Peak current: %.3f A at %s (supply: %.2f W)\n' % \
+                (current, format_time(current_time),
+                 current * specs['led_input_v'])
+        text += 'Average current: %.3f A\n' % self.get_average_current()
+        for chip, (dissipation, time) in enumerate(self.get_chip_peaks()):
+            flag = 'OK' if dissipation <= specs['max_chip_dissipation'] \
+                   else 'OVER LIMIT'
+            text += 'chip %02d: worst dissipation %.3f W at %s [%s]\n' % \
+                    (chip, dissipation, format_time(time), flag)
+        return text
+
+    def write_csv(self, file_):
+        '''
+        Write the values of every frame as CSV to the file object "file_".
+        '''
+        writer = csv.writer(file_)
+        chips = range(self.chips)
+        writer.writerow(['time', 'leds', 'current_a'] +
+                        ['chip%02d_current_a' % c for c in chips] +
+                        ['chip%02d_dissipation_w' % c for c in chips])
+        for time, mask in zip(self.times, self.masks):
+            leds, currents, dissipations = self.values[mask]
+            writer.writerow([format_time(time), leds,
+                             '%.4f' % sum(currents)] +
+                            ['%.4f' % c for c in currents] +
+                            ['%.4f' % d for d in dissipations])
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
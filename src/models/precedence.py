@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Ordering constraints between the elements of a supersequence.
+
+Each phrase of the sanity pool is displayed by a chain of elements (see
+SuperSequence.match_phrases): any element of the chain must stay before the
+following one. Together, the chains of all phrases form a DAG of required
+orderings, whose transitive closure is stored as bitsets (python ints, bit
+"n" standing for the element in position "n"), so that many questions on
+moves ("can these two elements swap?", "how far can this element go?") are
+answered with a couple of bitwise operations instead of a sanity check.
+
+The constraints are those of the chains in use: when a word can be displayed
+by more than one element (duplicated or merged words) a move forbidden by
+the model might still be possible by displaying a phrase with different
+elements, but any move allowed by the model keeps the sequence sane.
+
+The model listens to the changes of the sequence (see
+SuperSequence.add_listener), and only matches again the phrases whose chain
+is affected by a change.
+'''
+
+import models.phrasepool as phrasepool
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+class PrecedenceModel(object):
+
+    '''
+    DAG of the required orderings between the elements of a sequence.
+    Elements can be given as instances of Element() or positions.
+    '''
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.chains = {}  # {phrase id:elements displaying it, or None}
+        self.users = {}  # {element:ids of the phrases using it}
+        self.edges = {}  # {(element, next element):number of phrases}
+        self.positions = {}  # {element:position}
+        self.successors = []  # bitsets of the next elements of the chains
+        self.after = []  # bitsets of the elements that must follow
+        self.before = []  # bitsets of the elements that must precede
+        self.__update_chains(xrange(len(sequence.sanity_pool)))
+        self.__build_bitsets()
+        sequence.add_listener(self.update)
+
+    def detach(self):
+        '''
+        Stop following the changes of the sequence.
+        '''
+        self.sequence.remove_listener(self.update)
+
+    def __update_chains(self, phrase_ids):
+        '''
+        Match again the phrases "phrase_ids" and update their chains.
+        Return the lists of the edges dropped from the DAG and of the edges
+        added to it.
+        '''
+        phrase_ids = list(phrase_ids)
+        existed = {}  # {edge:True if it was in the DAG before the update}
+        for phrase_id in phrase_ids:
+            chain = self.chains.pop(phrase_id, None) or []
+            for el in chain:
+                self.users[el].discard(phrase_id)
+                if not self.users[el]:
+                    del self.users[el]
+            for edge in zip(chain, chain[1:]):
+                existed.setdefault(edge, True)
+                self.edges[edge] -= 1
+                if not self.edges[edge]:
+                    del self.edges[edge]
+        for phrase_id, positions in \
+                self.sequence.match_phrases(phrase_ids).items():
+            if positions == None:
+                self.chains[phrase_id] = None
+                continue
+            chain = [self.sequence[pos] for pos in positions]
+            self.chains[phrase_id] = chain
+            for el in chain:
+                self.users.setdefault(el, set()).add(phrase_id)
+            for edge in zip(chain, chain[1:]):
+                existed.setdefault(edge, edge in self.edges)
+                self.edges[edge] = self.edges.get(edge, 0) + 1
+        dropped = [e for e, old in existed.items()
+                   if old and e not in self.edges]
+        added = [e for e, old in existed.items()
+                 if not old and e in self.edges]
+        return dropped, added
+
+    def __build_bitsets(self):
+        '''
+        Compute the transitive closure of the edges, in both directions.
+        '''
+        self.positions = dict([(el, i) for i, el in
+                               enumerate(self.sequence)])
+        size = len(self.sequence)
+        self.successors = successors = [0] * size
+        for first, second in self.edges:
+            successors[self.positions[first]] |= \
+                                            1 << self.positions[second]
+        # Edges go left to right: the elements right of an element have
+        # their closure ready when it is computed
+        self.after = [0] * size
+        for i in xrange(size - 1, -1, -1):
+            reach = successors[i]
+            for j in phrasepool.iter_bits(successors[i]):
+                reach |= self.after[j]
+            self.after[i] = reach
+        self.before = [0] * size
+        for i in xrange(size):
+            for j in phrasepool.iter_bits(self.after[i]):
+                self.before[j] |= 1 << i
+
+    def __set_after(self, i, reach):
+        '''
+        Replace the bitset of the elements following "i", keeping the
+        bitsets of the elements preceding them in sync.
+        '''
+        for j in phrasepool.iter_bits(self.after[i] & ~reach):
+            self.before[j] &= ~(1 << i)
+        for j in phrasepool.iter_bits(reach & ~self.after[i]):
+            self.before[j] |= 1 << i
+        self.after[i] = reach
+
+    def __remove_element(self, pos, dropped, added):
+        '''
+        Update the bitsets after the removal of the element in position
+        "pos" (popped or merged) and the change of the edges. Only the
+        elements that could reach a dropped edge have their closure computed
+        again, the added edges are propagated to the elements preceding them.
+        '''
+        # Clear bit "pos", the elements on its right shift left
+        low = (1 << pos) - 1
+        for bitsets in (self.successors, self.after, self.before):
+            del bitsets[pos]
+            for i, bits in enumerate(bitsets):
+                bitsets[i] = bits & low | bits >> 1 & ~low
+        self.positions = dict([(el, i) for i, el in
+                               enumerate(self.sequence)])
+        positions = self.positions
+        for first, second in dropped:
+            if first in positions and second in positions:
+                self.successors[positions[first]] &= \
+                                            ~(1 << positions[second])
+        for first, second in added:
+            self.successors[positions[first]] |= 1 << positions[second]
+        # Elements whose closure might have lost bits: the sources of the
+        # dropped edges (an edge to the removed element included) and the
+        # elements preceding them
+        dirty = 0
+        for first, second in dropped:
+            if first in positions:
+                i = positions[first]
+                dirty |= 1 << i | self.before[i]
+        # Edges go left to right: right to left, the closure of the
+        # successors is always up to date
+        for i in reversed(list(phrasepool.iter_bits(dirty))):
+            reach = self.successors[i]
+            for j in phrasepool.iter_bits(self.successors[i]):
+                reach |= self.after[j]
+            self.__set_after(i, reach)
+        for first, second in added:
+            i, j = positions[first], positions[second]
+            reach = 1 << j | self.after[j]
+            for k in [i] + list(phrasepool.iter_bits(self.before[i])):
+                if reach & ~self.after[k]:
+                    self.__set_after(k, self.after[k] | reach)
+
+    def update(self, operation, *args):
+        '''
+        Follow a change of the sequence (signature of a sequence listener).
+        '''
+        if operation in ('pad', 'cols'):
+            return
+        # Phrases the sequence couldn't display are always matched again
+        affected = set([p for p, chain in self.chains.items()
+                        if chain == None])
+        if operation == 'swap':
+            # The element now on the right was on the left
+            left, right = sorted(args[:2])
+            first, second = self.sequence[right], self.sequence[left]
+            if (first, second) in self.edges:
+                affected.update(self.users[first] & self.users[second])
+        elif operation in ('pop', 'merge'):
+            present = set(self.sequence)
+            for el in self.users.keys():
+                if el not in present:
+                    affected.update(self.users[el])
+        elif operation == 'unmerge':
+            # The phrases displayed thanks to the merge get a new chain
+            affected.update(self.users.get(self.sequence[args[0]], ()))
+        elif operation != 'insert':
+            affected = self.chains.keys()
+        dropped, added = self.__update_chains(affected)
+        if operation in ('pop', 'merge'):
+            self.__remove_element(args[0 if operation == 'pop' else 1],
+                                  dropped, added)
+        else:
+            self.__build_bitsets()
+
+    def __index(self, what):
+        if isinstance(what, (int, long)):
+            return what if what >= 0 else len(self.sequence) + what
+        return self.positions[what]
+
+    def must_precede(self, one, two):
+        '''
+        Return True if element "one" must stay before element "two".
+        '''
+        return bool(self.after[self.__index(one)] >> self.__index(two) & 1)
+
+    def can_swap(self, one, two):
+        '''
+        Return True if the two elements can exchange their positions.
+        '''
+        i, j = sorted([self.__index(one), self.__index(two)])
+        between = (1 << j) - (1 << (i + 1)) if j > i else 0
+        return not (self.after[i] & (between | 1 << j) or
+                    self.before[j] & between)
+
+    def get_range(self, what):
+        '''
+        Return the leftmost and rightmost positions the element can be moved
+        to (all the other elements keeping their order).
+        '''
+        i = self.__index(what)
+        lo = self.before[i].bit_length()
+        after = self.after[i]
+        hi = (after & -after).bit_length() - 2 if after else \
+             len(self.sequence) - 1
+        return lo, hi
+
+    def iter_orderings(self, limit=None):
+        '''
+        Iterate over the orderings of the elements satisfying all the
+        constraints, as tuples of the current positions of the elements
+        (the current ordering first).
+        - limit: maximum number of orderings to return
+        '''
+        size = len(self.sequence)
+        ordering = []
+        counter = [0]
+        def extend(placed):
+            if len(ordering) == size:
+                counter[0] += 1
+                yield tuple(ordering)
+                return
+            for i in xrange(size):
+                if placed >> i & 1 or self.before[i] & ~placed:
+                    continue
+                ordering.append(i)
+                for result in extend(placed | 1 << i):
+                    yield result
+                    if limit != None and counter[0] >= limit:
+                        return
+                ordering.pop()
+        for result in extend(0):
+            yield result
+            if limit != None and counter[0] >= limit:
+                return
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
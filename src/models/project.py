@@ -8,9 +8,10 @@ packing, unpacking and other helper methods to provide basic manipulation
 of projects (e.g. saving/loading from drive).
 '''
 
-import pickle
 import os.path
 import gobject
+import models.projectfile as projectfile
+import models.journal as journal
 
 
 __author__ = "Mac Ryan"
@@ -30,9 +31,9 @@ class Project(gobject.GObject):
     '''
 
     DEFAULT_EXTENSION = 'sav'
-    # Just to keep the door open for possible future non backward-
-    # compatible changes...
-    SCHEMA_VERSION = '1.0'
+    # Schema of the project files (see the projectfile module). Files with
+    # an older schema are converted on loading.
+    SCHEMA_VERSION = projectfile.SCHEMA_VERSION
     # All properties of the objects that need to be saved (and loaded)
     SAVE_MASK = ['SCHEMA_VERSION',
                  'project_settings',
@@ -41,12 +42,120 @@ class Project(gobject.GObject):
                  'supersequence']
     # Project settings grouping
     PRJ_STTNGS_PHRASES = ('clock', 'resolution', 'approx_method')
+    # Base name for the autosave files of projects never saved
+    UNTITLED_FNAME = os.path.join(os.path.expanduser('~'), '.chasy',
+                                  'untitled.' + DEFAULT_EXTENSION)
 
     def __init__(self):
         self.__gobject_init__()
+        # Callable returning the phrases of the project clock, used to
+        # regenerate the sanity pool of sequences loaded from disk.
+        self.phrases_factory = None
+        self.journal = None
+        # Number of changes to each of the properties in SAVE_MASK
+        self.versions = {}
+        self._supersequence = None
         self.__reset_project()
         self.unsaved_flag = False
 
+    def __setattr__(self, name, value):
+        if name in self.SAVE_MASK and self.__differs(name, value):
+            self.__bump(name)
+        gobject.GObject.__setattr__(self, name, value)
+
+    def __differs(self, property, value):
+        '''
+        Return True if "value" is a change of the property (supersequences
+        are compared by identity, not to decode them).
+        '''
+        if property == 'supersequence':
+            pending = getattr(self, '_pending_payload', None)
+            return value is not (self._supersequence if pending == None
+                                 else pending)
+        if property not in self.__dict__:
+            return True
+        return value != self.__dict__[property]
+
+    def __bump(self, property):
+        self.versions[property] = self.versions.get(property, 0) + 1
+
+    def __get_supersequence(self):
+        if self._pending_payload != None:
+            payload, self._pending_payload = self._pending_payload, None
+            self._supersequence = payload.load()
+            if self._supersequence != None and self.phrases_factory:
+                self._supersequence.set_pool_factory(self.phrases_factory)
+            self.__start_journal()
+        return self._supersequence
+
+    def __set_supersequence(self, sequence):
+        self._pending_payload = None
+        if sequence is self._supersequence:
+            return
+        self._supersequence = sequence
+        self.__start_journal()
+
+    # The supersequence of projects loaded from disk is only decoded when
+    # first accessed.
+    supersequence = property(__get_supersequence, __set_supersequence)
+
+    def has_supersequence(self):
+        '''
+        Return True if the project has a supersequence (without decoding it,
+        if the project has been loaded from disk and not yet used).
+        '''
+        return self._pending_payload != None or self._supersequence != None
+
+    def __get_snapshot(self):
+        prj = self.__get_masked_dict()
+        return projectfile.serialise(prj)
+
+    def __start_journal(self):
+        '''
+        (Re)start the journaled autosave of the changes to the supersequence.
+        '''
+        self.stop_autosave()
+        if self._supersequence == None:
+            return
+        fname = getattr(self, 'last_save_fname', None) or self.UNTITLED_FNAME
+        self.journal = journal.Journal(fname, self.__get_snapshot)
+        try:
+            self.journal.attach(self._supersequence)
+        except (IOError, OSError):
+            self.journal.stop(discard=False)
+            self.journal = None
+
+    def stop_autosave(self):
+        '''
+        Stop the autosave of the project and delete its files (to be called
+        whenever the changes are saved or abandoned).
+        '''
+        if self.journal != None:
+            self.journal.stop()
+            self.journal = None
+
+    def get_versions(self):
+        '''
+        Return a dictionary with a version for each property in SAVE_MASK.
+        A version changes every time the property is assigned a new value or
+        (for the supersequence) modified in place, and it is computed in O(1),
+        without decoding a supersequence not yet loaded.
+        '''
+        versions = {}
+        for pr in self.SAVE_MASK:
+            versions[pr] = (self.versions.get(pr, 0),
+                            getattr(self._get_raw(pr), 'version', 0))
+        return versions
+
+    def _get_raw(self, property):
+        '''
+        Return the value of a property (the LazyPayload of a supersequence
+        not yet decoded).
+        '''
+        if property == 'supersequence' and self._pending_payload != None:
+            return self._pending_payload
+        return getattr(self, property)
+
     def __reset_project(self):
         '''
         Reset all those properties of the object that are project-specific.
@@ -54,7 +163,7 @@ class Project(gobject.GObject):
         for property in self.SAVE_MASK:
             if property != 'SCHEMA_VERSION':  # don't overwrite class property!
                 setattr(self, property, None)
-        self.saved_state = self.__get_masked_dict()
+        self.saved_state = self.get_versions()
         self.last_save_fname = None
         self.unsaved_flag = False
 
@@ -69,35 +178,37 @@ class Project(gobject.GObject):
 
     def broadcast_change(self, skip_flag_setting=False):
         '''
-        Check current values of the properties in SAVE_MASK against their
-        values on last broadcast_change call. If the state is changed, it emits
-        the signal "project_updated" with a dictionary of the properties that
-        have changed as a parameter.
+        Check current versions of the properties in SAVE_MASK against their
+        versions on last broadcast_change call. If the state is changed, it
+        emits the signal "project_updated" with a dictionary of the properties
+        that have changed as a parameter (a supersequence not yet decoded is
+        passed as LazyPayload).
             It also set the "unsaved_flag" to True, unless the parameter
         'skip_flag_setting' is set to True (useful for when project is first
         loaded).
             Return True if the state of the project has changed.
         '''
-        has_changed = False
-        new_state = self.__get_masked_dict()
-        if self.saved_state != new_state:
-            has_changed = True
-            if not skip_flag_setting:
-                self.unsaved_flag = True
-            data = {}
-            for pr in self.SAVE_MASK:
-                if self.saved_state[pr] != new_state[pr]:
-                    data[pr] = new_state[pr]
-            self.saved_state = new_state
-            self.emit("project_updated", data)
-        return has_changed
+        new_state = self.get_versions()
+        changed = [pr for pr in self.SAVE_MASK
+                   if self.saved_state[pr] != new_state[pr]]
+        if not changed:
+            return False
+        if not skip_flag_setting:
+            self.unsaved_flag = True
+        data = dict([(pr, self._get_raw(pr)) for pr in changed])
+        self.saved_state = new_state
+        self.emit("project_updated", data)
+        return True
 
     def is_populated(self):
         '''
         Return True if the project is populated.
         '''
+        if self.has_supersequence():
+            return True
         for pr in self.SAVE_MASK:
-            if pr != 'SCHEMA_VERSION' and getattr(self, pr) != None:
+            if pr not in ('SCHEMA_VERSION', 'supersequence') and \
+               getattr(self, pr) != None:
                 return True
         return False
 
@@ -136,19 +247,20 @@ class Project(gobject.GObject):
         for property in self.SAVE_MASK:
             prj[property] = getattr(self, property)
         try:
-            file_ = open(fname, 'w')
+            file_ = open(fname, 'wb')
         except:
             problem_description = '''It was <b>impossible to open the requested
                 file</b>. Hint: are you sure the saved file has the right
                 permissions for <i>Chasy</i> to open it?'''
             self.emit("disk_operation_problem", problem_description)
             return -1
-        # Protocol 0 (default one *will* generate problems with cyclic
-        # reference of sequence and elements.
-        pickle.dump(prj, file_, pickle.HIGHEST_PROTOCOL)
+        file_.write(projectfile.serialise(prj))
         file_.close()
         self.last_save_fname = fname
         self.unsaved_flag = False
+        # The autosave is now older than the project: start over
+        if self.journal != None:
+            self.__start_journal()
         # Need to call this to update main window title
         self.emit("project_updated", None)
 
@@ -161,7 +273,7 @@ class Project(gobject.GObject):
         '''
         self.__reset_project()
         try:
-            file_ = open(fname, 'r')
+            file_ = open(fname, 'rb')
         except:
             problem_description = '''It was <b>impossible to open the requested
                 file</b>. Hint: are you sure the saved file has the right
@@ -169,7 +281,7 @@ class Project(gobject.GObject):
             self.emit("disk_operation_problem", problem_description)
             return -1
         try:
-            prj = pickle.load(file_)
+            header, payload = projectfile.split(file_.read())
         except:
             problem_description = '''Although it was possible to open the
                 project file, it was <b>impossible to decode the data</b> in
@@ -179,28 +291,64 @@ class Project(gobject.GObject):
             return -1
         file_.close()
         # Schema version compatibility check (mostly for future!)
-        if prj['SCHEMA_VERSION'] != self.SCHEMA_VERSION:
+        if header['schema'] != self.SCHEMA_VERSION:
             problem_description = '''The project is saved with a <b>schema
                 version</b> (%s) which is incompatible with the one of the
                 version of <i>Chasy</i> in use on this system.''' % \
-                prj['SCHEMA_VERSION']
+                header['schema']
             self.emit("disk_operation_problem", problem_description)
             return -1
-        del prj['SCHEMA_VERSION']
         # Verify required module is installed
-        required = prj['project_settings']['clock']
+        required = header['project_settings']['clock']
         if required not in installed_modules:
             problem_description = '''The saved project is based the <b>"%s"
                 clock module</b>, which is not installed on the system in use.
                 ''' % required
             self.emit("disk_operation_problem", problem_description)
             return -1
-        for property in prj:
-            setattr(self, property, prj[property])
+        for property in projectfile.SETTINGS:
+            setattr(self, property, header.get(property))
         self.last_save_fname = fname
+        # Recover unsaved changes from the autosave of a crashed session
+        recovered = None
+        if journal.has_autosave(fname):
+            recovered = journal.recover(fname)
+            if recovered != None and \
+               self.__same_as_payload(recovered, header, payload):
+                journal.discard_files(fname)
+                recovered = None
+        if recovered != None:
+            for property in projectfile.SETTINGS:
+                setattr(self, property, recovered.get(property))
+            # The phrases factory is only set when the settings just loaded
+            # are broadcast: look it up when the pool is first needed
+            if recovered['supersequence'] != None:
+                recovered['supersequence'].set_pool_factory(
+                                            lambda: self.phrases_factory())
+            self.supersequence = recovered['supersequence']
+            self.broadcast_change(skip_flag_setting=True)
+            self.unsaved_flag = True
+            return
+        # The supersequence is decoded only when first needed
+        self._pending_payload = payload
+        self.__bump('supersequence')
         self.unsaved_flag = False
         self.broadcast_change(skip_flag_setting=True)
 
+    def __same_as_payload(self, recovered, header, payload):
+        '''
+        Return True if the recovered properties are the same as those in the
+        project file.
+        '''
+        for property in projectfile.SETTINGS:
+            if recovered.get(property) != header.get(property):
+                return False
+        sequence = payload.load()
+        recovered = recovered['supersequence']
+        if sequence == None or recovered == None:
+            return sequence == recovered
+        return sequence.to_dict() == recovered.to_dict()
+
     def close(self):
         '''
         Close the current project.
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8  -*-
+'''
+Read and write Chasy project files.
+
+Project files store only the essential data of a project: settings and the
+words (with their spacing) and merged mapping of the supersequence.
+Everything else is regenerated when needed.
+
+A file is made of two lines, each of them a JSON document:
+- the header: format, schema, settings and a few statistics. It is small
+  and can be read without touching the rest of the file (e.g. to list or
+  validate many projects quickly).
+- the payload: the supersequence. It is only decoded when needed.
+
+Files saved by earlier versions of Chasy are still readable: schema 2.0
+(one JSON document) and schema 1.0 (pickles of the live objects) get
+converted on the fly. When executed as a script, this module converts the
+files given as arguments.
+'''
+
+import json
+import pickle
+import sys
+import os
+import glob
+import models.supseq as supseq
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+FORMAT_NAME = 'chasy-project'
+SCHEMA_VERSION = '2.1'
+# Schema of the files that are pickles of the live objects
+PICKLE_SCHEMA_VERSION = '1.0'
+# Properties stored verbatim in the header (they must only contain plain types)
+SETTINGS = ('project_settings', 'vclock_settings', 'electronics_settings')
+
+
+class ProjectFileError(Exception):
+
+    '''
+    Raised when a file can't be decoded as a Chasy project.
+    '''
+
+    pass
+
+
+class LazyPayload(object):
+
+    '''
+    The not-yet-decoded payload of a project file. Calling "load()" returns
+    the supersequence (without sanity pool, see
+    SuperSequence.set_pool_factory).
+    '''
+
+    def __init__(self, data):
+        '''
+        - data: the payload, as JSON string or as already decoded dictionary.
+        '''
+        self.data = data
+
+    def load(self):
+        data = self.data
+        if isinstance(data, basestring):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                raise ProjectFileError('Invalid JSON payload')
+        if data['supersequence'] == None:
+            return None
+        return supseq.SuperSequence.from_dict(data['supersequence'])
+
+
+def _dumps(doc):
+    return json.dumps(doc, separators=(',', ':'), sort_keys=True)
+
+def get_stats(sequence):
+    '''
+    Return a dictionary of statistics on a supersequence, for the header.
+    '''
+    if sequence == None:
+        return None
+    return {'words':len(sequence),
+            'chars':sequence.get_char_length(),
+            'merged':sum([len(v) for v in sequence._merged_mapping.values()])}
+
+def serialise(properties, stats=None):
+    '''
+    Return the content of a project file for a dictionary of project
+    properties (as the one built by Project.save() out of its SAVE_MASK).
+    - stats: statistics for the header. If None, they are computed.
+    '''
+    sequence = properties.get('supersequence')
+    header = {'format':FORMAT_NAME,
+              'schema':SCHEMA_VERSION,
+              'stats':stats or get_stats(sequence)}
+    for property in SETTINGS:
+        header[property] = properties.get(property)
+    payload = {'supersequence':None if sequence == None else
+                               sequence.to_dict()}
+    return _dumps(header) + '\n' + _dumps(payload) + '\n'
+
+def parse_header(line):
+    '''
+    Return the header dictionary out of the first line of a project file.
+    Raise ProjectFileError if the line is not the header of a project in a
+    JSON-based schema.
+    '''
+    if not line.lstrip().startswith('{'):
+        raise ProjectFileError('Not a JSON-based project file')
+    try:
+        header = json.loads(line)
+    except ValueError:
+        raise ProjectFileError('Invalid JSON header')
+    if not isinstance(header, dict) or header.get('format') != FORMAT_NAME:
+        raise ProjectFileError('Not a Chasy project')
+    return header
+
+def split(data):
+    '''
+    Return a tuple (header, LazyPayload) out of the content of a project
+    file, in any of the supported schemas. Only the header gets decoded.
+    '''
+    if not data.lstrip().startswith('{'):
+        doc = from_legacy(data)
+        header = dict([(k, v) for k, v in doc.items() if k != 'supersequence'])
+        return (header, LazyPayload(doc))
+    header_line, sep, payload = data.partition('\n')
+    header = parse_header(header_line)
+    if header.get('schema') == '2.0':
+        # Schema 2.0 has a single JSON document including the payload
+        header['schema'] = SCHEMA_VERSION
+        header['stats'] = None
+        return (header, LazyPayload({'supersequence':
+                                     header.pop('supersequence')}))
+    return (header, LazyPayload(payload))
+
+def read_header(fname):
+    '''
+    Return the header of the project file "fname", reading only the first
+    line of JSON-based files.
+    '''
+    file_ = open(fname, 'rb')
+    try:
+        first = file_.readline()
+        if first.lstrip().startswith('{'):
+            header = parse_header(first)
+            if header.get('schema') == '2.0':
+                header.pop('supersequence', None)
+            return header
+        return split(first + file_.read())[0]
+    finally:
+        file_.close()
+
+def list_projects(directory, extension='sav'):
+    '''
+    Return a sorted list of tuples (file_name, header) for all the valid
+    project files with "extension" in "directory".
+    '''
+    projects = []
+    for fname in sorted(glob.glob(os.path.join(directory, '*.' + extension))):
+        try:
+            projects.append((fname, read_header(fname)))
+        except (ProjectFileError, IOError):
+            pass
+    return projects
+
+def deserialise(data):
+    '''
+    Return a dictionary of project properties out of the content of a
+    project file, in any of the supported schemas, decoding all of it.
+    '''
+    header, payload = split(data)
+    properties = {'SCHEMA_VERSION':header.get('schema')}
+    # Unknown schemas can't be interpreted: the caller will report that
+    if properties['SCHEMA_VERSION'] != SCHEMA_VERSION:
+        return properties
+    for property in SETTINGS:
+        properties[property] = header.get(property)
+    properties['supersequence'] = payload.load()
+    return properties
+
+def from_legacy(data):
+    '''
+    Convert the content of a pickled (schema 1.0) project file into a
+    document with the header and payload data of the current schema.
+    '''
+    try:
+        prj = pickle.loads(data)
+    except Exception:
+        raise ProjectFileError('Unable to unpickle data')
+    if not isinstance(prj, dict) or \
+       prj.get('SCHEMA_VERSION') != PICKLE_SCHEMA_VERSION:
+        raise ProjectFileError('Not a Chasy project')
+    doc = {'format':FORMAT_NAME,
+           'schema':SCHEMA_VERSION,
+           'stats':None,
+           'supersequence':None}
+    for property in SETTINGS:
+        doc[property] = prj.get(property)
+    sequence = prj.get('supersequence')
+    if sequence != None:
+        doc['supersequence'] = \
+            {'words':[el.word for el in sequence],
+             'merged_mapping':sequence.__dict__.get('_merged_mapping', {})}
+    return doc
+
+def migrate(fname, new_fname=None):
+    '''
+    Convert a project file to the current schema. If "new_fname" is not
+    given, the file is converted in place.
+    '''
+    file_ = open(fname, 'rb')
+    properties = deserialise(file_.read())
+    file_.close()
+    if properties['SCHEMA_VERSION'] != SCHEMA_VERSION:
+        raise ProjectFileError('Unknown schema: %s' %
+                               properties['SCHEMA_VERSION'])
+    file_ = open(new_fname or fname, 'wb')
+    file_.write(serialise(properties))
+    file_.close()
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    if len(sys.argv) < 2:
+        print('Usage: projectfile.py FILE [FILE...]  (converts in place)')
+    for fname in sys.argv[1:]:
+        migrate(fname)
+        print('Converted: %s' % fname)
+
+if __name__ == '__main__':
+    run_as_script()
@@ -11,8 +11,12 @@ This module provide a supersequence class with methods for its manipulation,
 storage, modification, testing, etc...
 '''
 
-import copy
-import math
+import bisect
+import models.phrasepool as phrasepool
+import models.automaton as automaton
+import models.ledstrings as ledstrings
+import models.firmware as firmware
+import models.powersim as powersim
 
 __author__ = "Mac Ryan"
 __copyright__ = "Copyright 2011, Mac Ryan"
@@ -22,6 +26,37 @@ __email__ = "quasipedia@gmail.com"
 __status__ = "Development"
 
 
+def merge_intervals(intervals):
+    '''
+    Return a list of integer intervals (lo, hi) as a sorted list of disjoint
+    intervals, joining the overlapping and contiguous ones.
+    '''
+    merged = []
+    for lo, hi in sorted(intervals):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(hi, merged[-1][1]))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+def intersect_intervals(first, second):
+    '''
+    Return the intersection of two sorted lists of disjoint intervals.
+    '''
+    intersection = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        lo = max(first[i][0], second[j][0])
+        hi = min(first[i][1], second[j][1])
+        if lo <= hi:
+            intersection.append((lo, hi))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return intersection
+
+
 class Element(object):
 
     '''
@@ -30,11 +65,13 @@ class Element(object):
 
     def __init__(self, sequence, word):
         self.sequence = sequence
-        self.word = word.decode('utf-8')
-        # Cache of elements that can block shifting in either direction
-        self.blocked_by = {'left':[], 'right':[]}
+        self.word = word if isinstance(word, unicode) else word.decode('utf-8')
         self.tile = None  # this is just a reminder, see ClockFace!
-        self.led_strings = None
+        self.led_strings = None  # channels of the led strings of the word
+        self.led_string_leds = None  # number of leds of each string
+        # Bitset of the phrases that can use the element (see
+        # SuperSequence.get_phrase_bits)
+        self.phrase_bits = None
 
     def get_position(self):
         '''
@@ -62,7 +99,20 @@ class Element(object):
             word = self.word.strip()
         else:
             raise BaseException('Wrong strip parameter')
-        return len(word.decode('utf-8'))
+        return len(word)  # words are unicode: no need to decode them
+
+    def get_lit_strings(self, offset, length):
+        '''
+        Return the indexes (in "led_strings") of the strings lighting the
+        "length" chars starting at "offset" of the stripped word.
+        '''
+        lit = []
+        first = 0
+        for index, leds in enumerate(self.led_string_leds):
+            if first < offset + length and offset < first + leds:
+                lit.append(index)
+            first += leds
+        return lit
 
     def test_contact(self):
         '''
@@ -74,11 +124,17 @@ class Element(object):
         pos = self.get_position()
         if pos == len(self.sequence) - 1:  #if last in the sequence
             return False
-        str_to_check = self.word.strip() + ' ' + \
-                       self.sequence[pos + 1].word.strip()
-        for phrase in self.sequence.sanity_pool:
-            if str_to_check in phrase:
-                return True
+        following = self.sequence[pos + 1]
+        # Quick exit if no phrase uses both elements
+        get_phrase_bits = self.sequence.get_phrase_bits
+        if not get_phrase_bits(self) & get_phrase_bits(following):
+            return False
+        pool = self.sequence.sanity_pool
+        displayed = self.sequence.get_displayed_words
+        for first in displayed(self):
+            for second in displayed(following):
+                if pool.has_bigram(first, second):
+                    return True
         return False
 
 
@@ -92,12 +148,117 @@ class SuperSequence(list):
     def __init__(self, sequence, sanity_pool):
         '''
         - sequence, string: supersequence of words
-        - sanity_pool: list of sentences the sequence should be used for.
+        - sanity_pool: the sentences the sequence should be used for (a
+          PhrasePool or a list of strings), or None if the pool is going to
+          be provided by a factory (see "set_pool_factory").
         '''
         for text in sequence.split():
             self.append(Element(self, text))
-        self.sanity_pool = sanity_pool[:]  # prevent modification of original
+        self.pool_factory = None
+        self.sanity_pool = sanity_pool
         self._merged_mapping = {}  # needed if merging optimisation is used
+        self.cols = None  # width of the clockface the spacing is meant for
+        # Callables invoked as listener(operation, *args) on each change
+        self.listeners = []
+        self.version = 0  # incremented on each change
+        self.firmware_table = None  # see "set_led_strings"
+        self.led_specs = None  # specs the firmware table was built with
+
+    def __getstate__(self):
+        '''
+        Listeners are not part of the state: clones (e.g. the disposable
+        sequences used for testing changes) must not notify anybody.
+        '''
+        self.sanity_pool  # make sure clones don't need the factory
+        state = self.__dict__.copy()
+        state['listeners'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('listeners', [])
+        self.__dict__.setdefault('version', 0)
+        self.__dict__.setdefault('firmware_table', None)
+        self.__dict__.setdefault('led_specs', None)
+
+    def add_listener(self, listener):
+        '''
+        Register a callable to be invoked as listener(operation, *args) after
+        each change of the sequence. Operations and their arguments are:
+        - 'swap', pos_a, pos_b, spaces_a, spaces_b: two adjacent elements
+          have been swapped, after stripping them of their leading spaces
+          (spaces_a and spaces_b, counted before the swap)
+        - 'pad', pos, amount: leading spaces of an element changed by amount
+        - 'merge', pos_large, pos_small, small_word: an element has been
+          merged into a larger one
+        - 'unmerge', pos_large, pos_small, small_word: a merge has been
+          reverted
+        - 'pop', pos, word: an element has been removed
+        - 'insert', pos, word: an element has been inserted
+        - 'cols', new_cols, old_cols: the clockface width has changed
+        '''
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        '''
+        Unregister a listener.
+        '''
+        try:
+            self.listeners.remove(listener)
+        except ValueError:
+            pass
+
+    def _notify(self, operation, *args):
+        self.version += 1
+        for listener in self.listeners[:]:
+            listener(operation, *args)
+
+    def __get_sanity_pool(self):
+        if self._sanity_pool == None and self.pool_factory:
+            self._sanity_pool = phrasepool.as_pool(self.pool_factory())
+            self.pool_factory = None
+        return self._sanity_pool
+
+    def __set_sanity_pool(self, sanity_pool):
+        # Pools are never modified, so they can be shared with the caller
+        self._sanity_pool = phrasepool.as_pool(sanity_pool)
+        self.__reset_phrase_bits()
+
+    # The sanity pool is derived data: it can be regenerated lazily from the
+    # clock module when the sequence is loaded from disk.
+    sanity_pool = property(__get_sanity_pool, __set_sanity_pool)
+
+    def set_pool_factory(self, factory):
+        '''
+        Set a callable returning the sanity pool, to be invoked only when
+        (and if) the pool is needed.
+        '''
+        if self._sanity_pool == None:
+            self.pool_factory = factory
+
+    def to_dict(self):
+        '''
+        Return the essential data of the sequence as a dictionary of plain
+        types: the words (including spacing) and the merged mapping.
+        Everything else (tiles, caches, sanity pool...) is derived data.
+        '''
+        return {'words':[el.word for el in self],
+                'merged_mapping':dict([(k, list(v)) for k, v in
+                                       self._merged_mapping.items()]),
+                'cols':self.cols}
+
+    @classmethod
+    def from_dict(cls, data, sanity_pool=None):
+        '''
+        Return a sequence rebuilt from the output of "to_dict()".
+        '''
+        sequence = cls('', sanity_pool)
+        for word in data['words']:
+            sequence.append(Element(sequence, word))
+        sequence._merged_mapping = dict([(k, list(v)) for k, v in
+                                         data['merged_mapping'].items()])
+        sequence.cols = data.get('cols')
+        return sequence
 
     def __what_convert(self, what, target_format):
         '''
@@ -129,14 +290,141 @@ class SuperSequence(list):
         # self._merged_mapping is a dictionary indicating into what words
         # [w1, w2, w3, w4...] an original word w0 has been merged.
         # The format is self._merged_mapping[w0] = [w1, w2, w3, w4...]
+        self.__force_merge(pos_large, pos_small)
+        return self.sanity_check()
+
+    def __force_merge(self, pos_large, pos_small):
+        '''
+        Merge two words in one, without checking the resulting sequence
+        (see "__force_merge_and_check").
+        '''
         large = self[pos_large]
         small = self[pos_small]
         try:
             self._merged_mapping[small.word].append(large.word)
         except KeyError:
             self._merged_mapping[small.word] = [large.word]
-        self.pop(pos_small)
-        return self.sanity_check()
+        list.pop(self, pos_small)
+        self.__reset_phrase_bits(large.word.strip())
+        self._notify('merge', pos_large, pos_small, small.word)
+
+    def __get_merge_mapping(self, large, small):
+        '''
+        Return the merged mapping the sequence would have after merging the
+        element "small" into the element "large".
+        '''
+        mapping = self._merged_mapping.copy()
+        mapping[small.word] = mapping.get(small.word, []) + [large.word]
+        return mapping
+
+    def __can_merge(self, pos_large, pos_small, phrase_bits=None):
+        '''
+        Return True if the sequence would still be sane after merging the
+        element at "pos_small" into the one at "pos_large". The sequence is
+        not modified, and only the phrases that can use the small element
+        are checked (the other ones are not affected by the merge).
+        - phrase_bits: the bitset of those phrases, if already known
+        '''
+        large = self[pos_large]
+        small = self[pos_small]
+        pool = self.sanity_pool
+        if phrase_bits == None:
+            phrase_bits = self.get_phrase_bits(small)
+        return self.__check_phrases(pool, [pool.phrases[i] for i in
+                                           phrasepool.iter_bits(phrase_bits)],
+                                    pos_small,
+                                    self.__get_merge_mapping(large, small))
+
+    def can_remove(self, what):
+        '''
+        Return True if the element can be removed, the sequence still
+        displaying all the phrases. Only the phrases that can use the element
+        are checked.
+        - what: instance of Element() or index in SuperSeq
+        '''
+        pos = self.__what_convert(what, 'index')
+        pool = self.sanity_pool
+        return self.__check_phrases(pool, [pool.phrases[i] for i in
+                            phrasepool.iter_bits(self.get_phrase_bits(pos))],
+                            pos)
+
+    def pop(self, index=-1):
+        '''
+        Remove and return the element at "index" (notifying listeners).
+        '''
+        index = index if index >= 0 else len(self)+index
+        el = list.pop(self, index)
+        self._notify('pop', index, el.word)
+        return el
+
+    def insert_element(self, pos, word):
+        '''
+        Insert a new element for "word" at position "pos".
+        '''
+        list.insert(self, pos, Element(self, word))
+        self._notify('insert', pos, word)
+
+    def __unmerge(self, pos_large, pos_small, small_word):
+        '''
+        Revert a merge (see "__force_merge_and_check"), given the positions
+        the two elements had before merging.
+        '''
+        list.insert(self, pos_small, Element(self, small_word))
+        mapped = self._merged_mapping.get(small_word, [])
+        if self[pos_large].word in mapped:
+            mapped.remove(self[pos_large].word)
+        if not mapped:
+            self._merged_mapping.pop(small_word, None)
+        self.__reset_phrase_bits(self[pos_large].word.strip())
+        self._notify('unmerge', pos_large, pos_small, small_word)
+
+    def pad_element(self, what, amount):
+        '''
+        Add (amount>0) or remove (amount<0) leading spaces to the word of
+        an element. Return True if the word has changed.
+        - what: instance of Element() or index in SuperSeq
+        '''
+        el = self.__what_convert(what, 'element')
+        if amount > 0:
+            el.word = ' ' * amount + el.word
+        elif amount < 0 and el.word.startswith(' ' * -amount):
+            el.word = el.word[-amount:]
+        else:
+            return False
+        self._notify('pad', el.get_position(), amount)
+        return True
+
+    def set_cols(self, cols):
+        '''
+        Set the width of the clockface the spacing of the words is meant for.
+        '''
+        if cols != self.cols:
+            old, self.cols = self.cols, cols
+            self._notify('cols', cols, old)
+
+    def apply_operation(self, operation, *args):
+        '''
+        Apply an operation in the same form listeners are notified of (see
+        "add_listener"), without any sanity check. Used to replay changes.
+        '''
+        if operation == 'swap':
+            pos_a, pos_b = args[:2]
+            direction = 'right' if pos_b > pos_a else 'left'
+            self.shift_element(pos_a, direction, only_if_sane=False)
+        elif operation == 'pad':
+            self.pad_element(*args[:2])
+        elif operation == 'merge':
+            self.__force_merge(*args[:2])
+        elif operation == 'unmerge':
+            self.__unmerge(*args[:3])
+        elif operation == 'pop':
+            self.pop(args[0])
+        elif operation == 'insert':
+            self.insert_element(*args[:2])
+        elif operation == 'cols':
+            self.set_cols(args[0])
+        else:
+            raise BaseException('Unknown operation: %s' % operation)
 
     def _closest_next_match(self, sequence, word):
         '''
@@ -157,27 +445,220 @@ class SuperSequence(list):
                 pass
         return None if hits == [] else min(hits)
 
+    def get_displayed_words(self, element):
+        '''
+        Return the words "element" can display: its own word, and any word
+        merged into it.
+        '''
+        word = element.word.strip()
+        return [word] + [small for small, larges in
+                         self._merged_mapping.items() if word in larges]
+
+    def get_phrase_bits(self, what):
+        '''
+        Return the phrases of the sanity pool that can use an element (see
+        "get_displayed_words"), as a bitset. The bitset is kept by the
+        element, and reset when merges change the words it displays.
+        - what: instance of Element() or index in SuperSeq
+        '''
+        element = self.__what_convert(what, 'element')
+        bits = getattr(element, 'phrase_bits', None)
+        if bits == None:
+            pool = self.sanity_pool
+            bits = 0
+            for word in self.get_displayed_words(element):
+                bits |= pool.get_word_bits(word)
+            element.phrase_bits = bits
+        return bits
+
+    def __reset_phrase_bits(self, word=None):
+        '''
+        Reset the phrase bitsets of the elements with (stripped) word "word"
+        (of all elements if no word is given).
+        '''
+        for el in self:
+            if word == None or el.word.strip() == word:
+                el.phrase_bits = None
+
     def sanity_check(self, phrases=None):
         '''
         Test if the sequence can be used to generate all phrases.
-        - phrases: list of strings or None. If None, check against all the
-                   phrases given at time of sequence generation.
+        - phrases: PhrasePool, list of strings or None. If None, check against
+                   all the phrases given at time of sequence generation.
         Return True if sequence is sane, False otherwise
         '''
-        if not phrases:
-            phrases = self.sanity_pool
-        word_sequence = self.get_sequence_as_string().split()
+        pool = phrasepool.as_pool(phrases) if phrases else self.sanity_pool
+        return self.__check_phrases(pool, pool.phrases)
+
+    def __get_candidates(self, pool, elements, mapping=None):
+        '''
+        Return a function returning, for a word id of "pool", the sorted
+        positions in "elements" of the elements that can display the word
+        (the word "as it is" or any of its mapped representations).
+        - mapping: merged mapping to use instead of the one of the sequence
+        '''
+        if mapping == None:
+            mapping = self._merged_mapping
+        # Positions in the sequence of each word
+        positions = {}
+        for i, el in enumerate(elements):
+            positions.setdefault(el.word.strip(), []).append(i)
+        matches = {}
+        def get_candidates(word_id):
+            try:
+                return matches[word_id]
+            except KeyError:
+                word = pool.vocabulary[word_id]
+                candidates = positions.get(word, [])[:]
+                for mapped in mapping.get(word, []):
+                    candidates += positions.get(mapped, [])
+                candidates.sort()
+                matches[word_id] = candidates
+                return candidates
+        return get_candidates
+
+    def __check_phrases(self, pool, phrases, skip=None, mapping=None):
+        '''
+        Return True if the sequence can display all "phrases" (arrays of
+        word ids of "pool").
+        - skip: position of an element to ignore, as if it had been removed
+        - mapping: merged mapping to use instead of the one of the sequence
+        '''
+        elements = self if skip == None else self[:skip] + self[skip+1:]
+        get_candidates = self.__get_candidates(pool, elements, mapping)
         for phrase in phrases:
             cursor = 0
-            for word in phrase.split():
-                try:
-                    # Following strip() is for added spaces from clockface
-                    cursor += self._closest_next_match(word_sequence[cursor:],
-                                                        word.strip()) + 1
-                except TypeError:  #Triggered by "cursor += None" operation
+            for word_id in phrase:
+                candidates = get_candidates(word_id)
+                index = bisect.bisect_left(candidates, cursor)
+                if index == len(candidates):
                     return False
+                cursor = candidates[index] + 1
         return True
 
+    def match_phrases(self, phrase_ids):
+        '''
+        Return a dictionary {phrase id:positions}, where "positions" are the
+        positions of the elements displaying the phrase of the sanity pool
+        (the leftmost possible ones), or None if the sequence can't display
+        the phrase.
+        '''
+        pool = self.sanity_pool
+        get_candidates = self.__get_candidates(pool, self)
+        matches = {}
+        for phrase_id in phrase_ids:
+            positions = []
+            for word_id in pool.phrases[phrase_id]:
+                candidates = get_candidates(word_id)
+                cursor = positions[-1] + 1 if positions else 0
+                index = bisect.bisect_left(candidates, cursor)
+                if index == len(candidates):
+                    positions = None
+                    break
+                positions.append(candidates[index])
+            matches[phrase_id] = positions
+        return matches
+
+    def __get_insertion_slots(self, element, others):
+        '''
+        Return the positions at which "element" could be inserted in the
+        list of elements "others" so that all the phrases that can use it
+        are still displayed, as a sorted list of disjoint intervals (lo, hi).
+
+        For each phrase, greedy matching from the left gives the shortest
+        prefix of "others" displaying its first k words, and greedy matching
+        from the right the longest suffix displaying the words after the
+        k-th one: if "element" can display the k-th word, it can be inserted
+        anywhere between the two.
+        '''
+        pool = self.sanity_pool
+        get_candidates = self.__get_candidates(pool, others)
+        displayed = set([pool.word_ids[w] for w in
+                         self.get_displayed_words(element)
+                         if w in pool.word_ids])
+        slots = [(0, len(others))]
+        for phrase_id in phrasepool.iter_bits(self.get_phrase_bits(element)):
+            phrase = pool.phrases[phrase_id]
+            length = len(phrase)
+            # prefix[k]: end of the shortest prefix displaying phrase[:k]
+            prefix = [0] + [None] * length
+            for k in range(length):
+                candidates = get_candidates(phrase[k])
+                index = bisect.bisect_left(candidates, prefix[k])
+                if index == len(candidates):
+                    break
+                prefix[k + 1] = candidates[index] + 1
+            if prefix[length] != None:
+                continue  # the phrase doesn't need "element"
+            # suffix[k]: start of the longest suffix displaying phrase[k:]
+            suffix = [None] * length + [len(others)]
+            for k in range(length - 1, -1, -1):
+                candidates = get_candidates(phrase[k])
+                index = bisect.bisect_left(candidates, suffix[k + 1]) - 1
+                if index < 0:
+                    break
+                suffix[k] = candidates[index]
+            intervals = []
+            for k in range(length):
+                if phrase[k] in displayed and prefix[k] != None and \
+                   suffix[k + 1] != None and prefix[k] <= suffix[k + 1]:
+                    intervals.append((prefix[k], suffix[k + 1]))
+            slots = intersect_intervals(slots, merge_intervals(intervals))
+        return slots
+
+    def get_feasible_range(self, what):
+        '''
+        Return the leftmost and rightmost positions "what" can be shifted to
+        keeping the sequence sane, computed from the ordering constraints of
+        the phrases that can use the element (no trial shifting). The
+        sequence is assumed to be sane.
+        - what: instance of Element() or index in SuperSeq
+        '''
+        pos = self.__what_convert(what, 'index')
+        slots = self.__get_insertion_slots(self[pos],
+                                           self[:pos] + self[pos+1:])
+        for lo, hi in slots:
+            if lo <= pos <= hi:
+                return lo, hi
+        return pos, pos
+
+    def get_phrase_elements(self, phrase):
+        '''
+        Return the elements used to display "phrase", as a list of tuples
+        (element, offset, length) where "offset" and "length" locate the
+        phrase word within the stripped word of the element (the offset is
+        non-zero only for words merged into larger ones).
+        Return None if the sequence can't be used to display the phrase.
+        '''
+        word_sequence = self.get_sequence_as_string().split()
+        matches = []
+        cursor = 0
+        for word in phrase.split():
+            if isinstance(word, str):
+                word = word.decode('utf-8')
+            index = self._closest_next_match(word_sequence[cursor:], word)
+            if index == None:
+                return None
+            cursor += index
+            offset = max(word_sequence[cursor].find(word), 0)
+            matches.append((self[cursor], offset, len(word)))
+            cursor += 1
+        return matches
+
+    def get_phrase_channels(self, phrase):
+        '''
+        Return the channels of the led strings lighting "phrase" (see
+        "set_led_strings"), or None if the sequence can't display it.
+        '''
+        matches = self.get_phrase_elements(phrase)
+        if matches == None:
+            return None
+        channels = []
+        for el, offset, length in matches:
+            channels.extend([el.led_strings[i] for i in
+                             el.get_lit_strings(offset, length)])
+        return channels
+
     def get_sequence_as_string(self):
         '''
         Return unicode representation of sequence.
@@ -260,19 +741,18 @@ class SuperSequence(list):
             raise BaseException('Shifting error! El:%s Dir:%s' %
                                 (repr(el_pos), repr(direction)))
         if only_if_sane:
-            # Stage the change and verify the result is still sane...
-            scrap = copy.deepcopy(self)
-            scrap[el_pos], scrap[new_pos] = scrap[new_pos], scrap[el_pos]
-            # ...if not, return
-            if not scrap.sanity_check():
-                el = self.__what_convert(what, 'element')
-                el.blocked_by[direction].append(self[new_pos])
+            lo, hi = self.get_feasible_range(el_pos)
+            if not lo <= new_pos <= hi:
                 return False
         # Strip potential spaces introduced for clockface reasons...
-        self[el_pos].word = self[el_pos].word.strip()
-        self[new_pos].word = self[new_pos].word.strip()
+        spaces = []
+        for pos in (el_pos, new_pos):
+            el = self[pos]
+            spaces.append(len(el.word) - len(el.word.lstrip()))
+            el.word = el.word.strip()
         # ...and swap!
         self[el_pos], self[new_pos] = self[new_pos], self[el_pos]
+        self._notify('swap', el_pos, new_pos, *spaces)
         if callback:
             callback()
         return True
@@ -286,24 +766,20 @@ class SuperSequence(list):
         - only_if_sane: perform the shifting only if the resulting seq can
           still generate all the phrases.
         '''
+        el_pos = self.__what_convert(what, 'index')
         # The shift is a no-move!
-        if self.__what_convert(what, 'index') == target:
+        if el_pos == target:
             return True
-        # Look up cache first!
-        el = self.__what_convert(what, 'element')
-        el_pos = self.__what_convert(what, 'index')
         direction = 'right' if target > el_pos else 'left'
-        start_, stop_ = sorted([el_pos, target])
-        if set(self[start_:stop_]).intersection(set(el.blocked_by[direction])):
-            return False
-        # Try to actually shift the element
-        moveable = True
-        while moveable:
-            # Need to pass "what" as "el" as index(el) will change!!
-            moveable = self.shift_element(el, direction, only_if_sane)
-            if el.get_position() == target:
-                return True
-        return False
+        # Move as close to the target as the sequence allows
+        reachable = target
+        if only_if_sane:
+            lo, hi = self.get_feasible_range(el_pos)
+            reachable = min(max(target, lo), hi)
+        step = 1 if direction == 'right' else -1
+        for pos in range(el_pos, reachable, step):
+            self.shift_element(pos, direction, only_if_sane=False)
+        return reachable == target
 
     def shift_remaining_longest_next_to(self, what_or_none, max_len=None):
         '''
@@ -345,20 +821,26 @@ class SuperSequence(list):
         # Sort elements according to their order in the sequence
         one, two = sorted([one, two], key = lambda x: x.get_position())
         while True:
+            pos_one = one.get_position()
+            pos_two = two.get_position()
             # if they have converged
-            if two.get_position() - one.get_position() == 1:
+            if pos_two - pos_one == 1:
                 return True
-            # Smartass trick: the logic "or" guarantees that only either e1 or e2
-            # get shifted at each pass [if the first shift returns True, the
-            # if condition is already True and the second shift is neither tried.
-            if not (self.shift_element(one, 'right') or \
-                   self.shift_element(two, 'left')):
+            # The first element goes right as far as it can, then the second
+            # one takes a step left (which might unblock the first one)
+            hi = self.get_feasible_range(pos_one)[1]
+            if hi > pos_one:
+                self.shift_element_to_position(pos_one, min(hi, pos_two - 1),
+                                               only_if_sane=False)
+            elif not self.shift_element(pos_two, 'left'):
                 return False
 
     def eliminate_redundancies(self, callback=None):
         '''
-        Eliminate redundant words by checking if they can converge next to
-        each other, and then if one of them can be eliminated.
+        Eliminate redundant words: for each pair of elements with the same
+        word, check if a single element placed somewhere in between the
+        other elements could display all the phrases using them, and if so
+        remove one of the two and move the other there.
         - callback is the function to invoke to update progress data in GUI
         '''
         dup_words = self.get_duplicate_words()
@@ -368,34 +850,52 @@ class SuperSequence(list):
             for el in self:
                 if el.word == word:
                     dup_els.append(el)
-            # Then try to make them converge
-            for i in range(len(dup_els)-1):
+            for e1, e2 in zip(dup_els, dup_els[1:]):
                 if callback:
                     callback()
-                e1 = dup_els[i]
-                e2 = dup_els[i+1]
-                # if they converged
-                if self.converge_elements(e1, e2):
-                    guinea_pig = copy.deepcopy(self)
-                    guinea_pig.pop(e1.get_position())
-                    if guinea_pig.sanity_check():
-                        self.pop(e1.get_position())
-                        break
-                    else:
-                        break
+                pos_one = e1.get_position()
+                pos_two = e2.get_position()
+                if self.can_remove(pos_one):
+                    self.pop(pos_one)
+                    break
+                others = [el for el in self if el not in (e1, e2)]
+                slots = self.__get_insertion_slots(e2, others)
+                if not slots:
+                    continue
+                # The closest position to the one of the element kept
+                current = pos_two - 1
+                target = min([min(max(current, lo), hi) for lo, hi in slots],
+                             key=lambda pos: abs(pos - current))
+                self.pop(pos_one)
+                self.shift_element_to_position(e2, target,
+                                               only_if_sane=False)
+                break
 
     def get_containing_pairs(self):
         '''
         Return a list of tuples (containing_string, contained_string).
+        The words contained in each word are found with a single scan of
+        it (see the automaton module), instead of testing every pair.
         '''
         decreasing = self.get_remaining_elements_by_size()
+        rank = dict([(id(el), i) for i, el in enumerate(decreasing)])
+        by_word = {}  # {stripped word:elements with that word}
+        for el in decreasing:
+            by_word.setdefault(el.word.strip(), []).append(el)
+        words = by_word.keys()
+        finder = automaton.WordAutomaton(words)
+        contained = {}  # {stripped word:elements with words it contains}
         matches = []
-        for i, large in enumerate(decreasing):
-            for small in decreasing[i+1:]:
-                sws = small.word.strip()
-                lws = large.word.strip()
-                if sws != lws and sws in lws:
-                    matches.append([large, small])
+        for large in decreasing:
+            lws = large.word.strip()
+            if lws not in contained:
+                smalls = []
+                for index in finder.find(lws):
+                    if words[index] != lws:
+                        smalls.extend(by_word[words[index]])
+                contained[lws] = sorted(smalls, key=lambda el: rank[id(el)])
+            matches.extend([[large, small] for small in contained[lws]
+                            if rank[id(small)] > rank[id(large)]])
         return matches
 
     def merge_elements(self, one, two):
@@ -405,12 +905,10 @@ class SuperSequence(list):
         - one, two: instances of supseq.Element
         '''
         if self.converge_elements(one, two):
-            scrap = copy.deepcopy(self)
             pos_one = one.get_position()
             pos_two = two.get_position()
-            if scrap.__force_merge_and_check(pos_one, pos_two):
-                merge_result = self.__force_merge_and_check(pos_one, pos_two)
-                assert merge_result == True
+            if self.__can_merge(pos_one, pos_two):
+                self.__force_merge(pos_one, pos_two)
                 return True
         return False
 
@@ -418,26 +916,60 @@ class SuperSequence(list):
         '''
         Try to merge together two words if one is a substring of the other.
         Typical example: 'five' and 'twenty-five' or 'eight' and 'eighteen'.
+        Consecutive pairs that are already adjacent (so don't need to
+        converge) and don't interact (no shared elements, nor phrases using
+        the small words) are checked against the same sequence and merged in
+        a single batch.
         '''
         self.halt_heuristic = False
         if callback:
             callback(phase='Substring merging', time='---', bar=0)
         merged_objects = []
-        pairs = self.get_containing_pairs()
-        for one, two in pairs:
+        batch = []
+        busy_elements = set()
+        busy_phrases = 0
+        for one, two in self.get_containing_pairs():
             if self.halt_heuristic == True:
                 return
             if callback:
                 callback()
             print("W1-> %s  W2-> %s" % (one.word, two.word))
-            if two in merged_objects:
+            phrase_bits = self.get_phrase_bits(two)
+            if id(one) in busy_elements or id(two) in busy_elements or \
+               phrase_bits & busy_phrases:
+                self.__merge_batch(batch, merged_objects)
+                busy_elements.clear()
+                busy_phrases = 0
+            if one in merged_objects or two in merged_objects:
                 print('already merged')
                 continue
+            pos_one = one.get_position()
+            pos_two = two.get_position()
+            if abs(pos_one - pos_two) == 1:
+                if self.__can_merge(pos_one, pos_two, phrase_bits):
+                    batch.append((one, two))
+                    busy_elements.update((id(one), id(two)))
+                    busy_phrases |= phrase_bits
+                continue
+            # Converging shifts elements: the batch must be merged first
+            self.__merge_batch(batch, merged_objects)
+            busy_elements.clear()
+            busy_phrases = 0
             if self.merge_elements(one, two):
                 print('merged!')
                 merged_objects.append(two)
             else:
                 print('unmergeable')
+        self.__merge_batch(batch, merged_objects)
+
+    def __merge_batch(self, batch, merged_objects):
+        '''
+        Merge (and empty) a batch of checked pairs of elements.
+        '''
+        for one, two in batch:
+            self.__force_merge(one.get_position(), two.get_position())
+            merged_objects.append(two)
+        del batch[:]
 
     def get_best_fit(self, size, from_, new_line=False, callback=None):
         '''
@@ -496,24 +1028,54 @@ class SuperSequence(list):
         # return the element that filled the space better
         return closest
 
-    def set_led_strings(self):
+    def set_led_strings(self, specs=None, time_limit=2.0):
         '''
-        Assign to each element of the sequence the right led string number
+        Assign to each element of the sequence the right led string numbers,
+        spreading the strings on the driver chips so that the worst-case
+        dissipation of the hottest chip is minimised (see the ledstrings
+        module). Return a report with the mapping, the firmware table and the
+        simulated power needs over the day (see the powersim module).
+        - specs: electrical constants (see ledstrings.get_specs)
+        - time_limit: seconds the optimiser can spend improving the mapping
         '''
         # TODO: This will need deep changes for substring optimisation
-        max_led_number = 7  #TODO: put this in an interactive menu
-        string_counter = 0
+        if specs == None:
+            specs = ledstrings.get_specs()
+        # Split words in strings: (element, number of leds)
+        strings = []
+        by_element = {}
         for el in self:
             el.led_strings = []
-            l = el.get_word_length('both')
-            for s in range(int(math.ceil(l*1.0/max_led_number))):
-                el.led_strings.append(string_counter)
-                string_counter += 1
-                # TODO: This hardcoded way of using only 15 channels per TLC
-                # should be automatised to maximise energy dissipation spread
-                if (string_counter + 1) % 16 == 0:
-                    string_counter += 1
-        self.number_of_led_strings = string_counter
+            el.led_string_leds = ledstrings.split_in_strings(
+                        el.get_word_length('both'),
+                        specs['max_leds_per_string'])
+            by_element[id(el)] = range(len(strings),
+                                       len(strings) + len(el.led_string_leds))
+            strings.extend([(el, leds) for leds in el.led_string_leds])
+        # Strings lit by each phrase, word by word (a word is a list of
+        # strings), and frames (phrase ids) in which each string is lit
+        pool = self.sanity_pool
+        phrase_strings = []
+        frames = [set() for string in strings]
+        for phrase_id in xrange(len(pool)):
+            matches = self.get_phrase_elements(pool.get_text(phrase_id))
+            if matches == None:
+                raise BaseException('The sequence can\'t display: %s' %
+                                    pool.get_text(phrase_id))
+            words = []
+            for el, offset, length in matches:
+                words.append([by_element[id(el)][i] for i in
+                              el.get_lit_strings(offset, length)])
+                for index in words[-1]:
+                    frames[index].add(phrase_id)
+            phrase_strings.append(words)
+        optimiser = ledstrings.LedStringOptimiser([l for e, l in strings],
+                                                  frames, specs)
+        assignment = optimiser.optimise(time_limit)
+        for (el, leds), channel in zip(strings,
+                                       optimiser.get_channels(assignment)):
+            el.led_strings.append(channel)
+        self.number_of_led_strings = len(strings)
 
         # Output a human-readable mapping of words to led strings
         text = 'LED STRING MAPPING\n'
@@ -527,44 +1089,21 @@ class SuperSequence(list):
             text += '\n'
         text += '\n'
 
-        # Output the noisiest combination of strings for each TLC.
-        # NOISIEST = highest dissipation within TLC specifications at
-        # 50% duty cycle.
-        text += 'NOISIEST COMBOS\n'
-        text += '===============\n'
-        # Groups strings by chip, storing length
-        chips_image = {}
-        for el in self:
-            for s in el.led_strings:
-                chip_number = (s+1)/16
-                tmp = el.get_word_length(strip='both')
-                leds_in_string =  tmp/len(el.led_strings)  #approximate!
-                try:
-                    chips_image[chip_number].append((s, leds_in_string))
-                except KeyError:
-                    chips_image[chip_number] = [(s, leds_in_string)]
-        # Calculating dissipations
-        LED_INPUT_V = 24.0  #volts
-        LED_DROP_V = 3.25  #volts
-        CURRENT = 0.021  #amperes
-        BASE_DISSIPATION = 0.060  #watts
-        MAX_CHIP_DISSIPATION = 1.053  #watts
-        DOT_CORRECTION = 63/63.0
-        MAX_GS_VALUE = 4095
-        DUTY_CYCLE = MAX_GS_VALUE/float(MAX_GS_VALUE)
-        max_ch_dissipation = lambda leds : (LED_INPUT_V - leds * LED_DROP_V) \
-                                            * CURRENT * DOT_CORRECTION \
-                                            * DUTY_CYCLE
-        # Calculate the sum of max channel dissipations for each chip
-        chip_max_dissipations = [sum([max_ch_dissipation(leds) for \
-                                 ch, leds in values]) for \
-                                 values in chips_image.values()]
-        # Calculate the max possible GS scale value for each chip.
-        get_gs = lambda diss : int(round(MAX_GS_VALUE*(MAX_CHIP_DISSIPATION\
-                                                       -BASE_DISSIPATION)\
-                                                       /diss))
-        chip_max_GS = [get_gs(diss) for diss in chip_max_dissipations]
-        text += str(chip_max_GS) + '\n'
+        # Output the worst-case dissipation of each chip over the displayed
+        # frames, compared to wiring the strings in sequence.
+        text += 'CHIP DISSIPATION\n'
+        text += '================\n'
+        naive = optimiser.get_dissipations(
+                                    optimiser.get_sequential_assignment())
+        optimised = optimiser.get_dissipations(assignment)
+        for chip, (before, after) in enumerate(zip(naive, optimised)):
+            text += 'chip %02d: %.3f W (sequential wiring: %.3f W)\n' % \
+                    (chip, after, before)
+        chip_max_GS = [ledstrings.get_max_gs(d, specs) for d in optimised]
+        text += 'Max GS per chip: %s\n' % str(chip_max_GS)
+        text += 'Max GS for the clockface: %d (sequential wiring: %d)\n' % \
+                (min(chip_max_GS), min([ledstrings.get_max_gs(d, specs)
+                                        for d in naive]))
         text += '\n'
 
 
@@ -590,29 +1129,30 @@ class SuperSequence(list):
 #                text += '.byte %s\n' % str(string).zfill(3)
 #        text += '\nRequired bytes for complete mapping: %d' % byte_counter
 
+        # Output the firmware table, in its compact format
+        channels = optimiser.get_channels(assignment)
+        table = firmware.FirmwareTable(
+                    [[[channels[s] for s in word] for word in words]
+                     for words in phrase_strings], pool.times)
+        text += 'FIRMWARE TABLE\n'
+        text += '==============\n'
+        text += table.get_report() + '\n'
+        self.firmware_table = table
+        self.led_specs = specs
+        text += 'VERIFICATION\n'
+        text += '============\n'
+        frames = list(firmware.iter_pool_frames(pool))
+        mismatches = firmware.verify(table, self, frames)
+        text += firmware.get_verification_report(mismatches, len(frames))
+        text += '\n'
+        text += 'POWER\n'
+        text += '=====\n'
+        simulation = powersim.PowerSimulation(self,
+                                    powersim.get_table_frames(table), specs)
+        text += simulation.get_report() + '\n'
         text += 'C CODE\n'
         text += '========\n'
-        text += 'unsigned char clockTable[] PROGMEM {\n'
-        byte_counter = 0
-        for phrase in self.sanity_pool:
-            text += '    // %s\n' % phrase  # Phrase as ASM comment
-            strings = []
-            cursor = 0
-            for phrase_word in phrase.split():
-                for el in self[cursor:]:
-                    cursor += 1
-                    cface_word = el.word.strip()
-                    if phrase_word == cface_word:
-                        for s in el.led_strings:
-                            strings.append(s)
-                            byte_counter += 1
-                        break
-            # Add stop-bit information to the last string
-            strings[-1] |= 0b10000000
-#            text += '    %s,\n' % ', '.join([str(s).zfill(3) for s in strings])
-            text += '    %s,\n' % ', '.join([str(hex(s)) for s in strings])
-        text += '}\n'
-        text += '\nRequired bytes for complete mapping: %d' % byte_counter
+        text += table.get_c_code()
 ########### OLD BITMASK CODE ####################
 #        bytes_number = self.number_of_led_strings // 8 + 1
 #        for phrase in self.sanity_pool:
@@ -9,7 +9,7 @@ Generate screenshots and all the files to create the project.
 
 import cairo
 import gtk
-import os
+import models.facerenderer as facerenderer
 
 __author__ = "Mac Ryan"
 __copyright__ = "Copyright 2011, Mac Ryan"
@@ -45,6 +45,10 @@ class VirtualClock(unicode):
         cls.unlit_color = gtk.gdk.Color("#888")
         cls.lit_color = gtk.gdk.Color("#FFF")
         cls.custom_color = gtk.gdk.Color("#800")
+        # Headless renderer doing the actual drawing with cached layers
+        cls.renderer = facerenderer.FaceRenderer(chars, size)
+        # Indexes of the cells currently lit
+        cls.lit_cells = frozenset()
         cls.drawing_area.set_size_request(cls.min_pixel_dimension,
                                           cls.min_pixel_dimension)
         return super(VirtualClock, cls).__new__(cls, chars)
@@ -124,86 +128,113 @@ class VirtualClock(unicode):
                                                            self.rows)
         self.size_x, self.size_y = int(self.cols*self.scaling), \
                                    int(self.rows*self.scaling)
+        gtk_to_rgb = lambda x : tuple([c/65535.0 for c in
+                                       (x.red, x.green, x.blue)])
+        self.renderer.set_pixel_dimension(self.max_pixel_dimension)
+        self.renderer.set_style(font_face=self.font_face,
+                                charspace=self.charspace,
+                                borderspace=self.borderspace,
+                                case=self.case,
+                                italic=self.italic,
+                                bold=self.bold,
+                                bkg_color=gtk_to_rgb(self.bkg_color),
+                                unlit_color=gtk_to_rgb(self.unlit_color),
+                                lit_color=gtk_to_rgb(self.lit_color))
+
+    def get_background(self):
+        '''
+        Return the cached static layer (background and unlit letters).
+        '''
+        return self.renderer.get_layer('unlit')
 
     def update(self):
+        '''
+        Schedule the redraw of the entire clock (needed when any of the
+        drawing parameters has changed).
+        '''
         self.refresh_params()
-        self.drawing_area.window.clear()
+        self.drawing_area.queue_draw()
+
+    def set_lit_cells(self, cells):
+        '''
+        Change the cells that are lit, scheduling the redraw of only those
+        cells whose state has changed. Return the set of changed cells.
+        '''
+        cells = frozenset(cells)
+        changed = cells.symmetric_difference(self.lit_cells)
+        self.lit_cells = cells
+        if self.drawing_area.window:
+            for cell in changed:
+                self.drawing_area.queue_draw_area(
+                                        *self.renderer.get_cell_rect(cell))
+        return changed
+
+    def expose(self, area=None):
+        '''
+        Repaint the "area" (x, y, width, height) of the clock, or all of it
+        if "area" is None. Meant to be called on expose events.
+        '''
         surface = self.drawing_area.window.cairo_create()
-        self.draw(surface)
-
-    def draw(self, surface):
-        '''
-        Draw the clock on the surface.
-        '''
-        gtk_to_rgb = lambda x : [c/65535.0 for c in (x.red, x.green, x.blue)]
-        cr = surface
-        # NORMALISATION
-        cr.scale(self.size_x, self.size_y)
-        # EM [one char size, in percentage of normalised surface]
-        ems_in_matrix_unit = 1.0+self.charspace
-        ems_in_border = self.borderspace
-        em_x = 1/(ems_in_border*2+ems_in_matrix_unit*(self.cols-1)+1)
-        em_y = 1/(ems_in_border*2+ems_in_matrix_unit*(self.rows-1)+1)
-        # BACKGROUND
-        cr.save()
-        cr.set_source_rgb(*gtk_to_rgb(self.bkg_color))
-        cr.rectangle(0, 0, 1, 1)
-        cr.fill()
-        cr.restore()
-        # FONT SETTINGS
-        slant = cairo.FONT_SLANT_ITALIC if \
-                            self.italic else cairo.FONT_SLANT_NORMAL
-        weight = cairo.FONT_WEIGHT_BOLD if \
-                            self.bold else cairo.FONT_WEIGHT_NORMAL
-        cr.select_font_face(self.font_face, slant, weight)
-        cr.set_source_rgb(*gtk_to_rgb(self.unlit_color))
-        # LETTER OUTPUT
-        cr.scale(em_x, em_y)  #normalisation to em = 1.0
-        cr.set_font_size(1.0)
-        fascent, fdescent, fheight, fxadvance, fyadvance = cr.font_extents()
-        cx, cy = 0, 0
-        cr.translate(ems_in_border, ems_in_border)
-        for letter in self:
-            if self.case == 'lower':
-                letter = letter.lower()
-            elif self.case == 'upper':
-                letter = letter.upper()
-            xbearing, ybearing, width, height, xadvance, yadvance = \
-                                                    cr.text_extents(letter)
-            cr.move_to(cx*ems_in_matrix_unit + 0.5 - xbearing - width / 2,
-                       cy*ems_in_matrix_unit + 0.5 - fdescent + fheight / 2)
-            cr.show_text(letter)
-            if cx == self.cols-1:
-                cy += 1
-                cx = 0
-            else:
-                cx += 1
-#        cr.show_page()
-
-    def get_shot(self, format):
-        '''
-        Return a file in either 'svg' or 'png' formats.
-        '''
-        fname = 'cface_shot' + '.' + format
+        self.draw(surface, area)
+
+    def draw(self, surface, area=None):
+        '''
+        Draw the clock on the surface, by blitting the cached layers. If
+        "area" is given, drawing is clipped to it.
+        '''
+        self.renderer.paint(surface, self.lit_cells, area)
+
+    def draw_vector(self, surface):
+        '''
+        Draw the clock on the surface as vector graphics (used for vector
+        output formats, where blitting bitmaps would be inappropriate).
+        '''
+        self.renderer.draw_vector(surface, self.lit_cells)
+
+    def get_shot_name(self, format):
+        '''
+        Return a file name describing the current style of the clock.
+        '''
+        name = facerenderer.get_style_label(self.renderer.get_style())
+        return '_'.join(name.replace('%', '').split()) + '.' + format
+
+    def get_shot(self, format, dpi=72, fname=None):
+        '''
+        Save a file of the clock in either 'svg' or 'png' formats. PNG files
+        are rendered at "dpi" dots per inch (72 is one pixel per point).
+        If "fname" is not given, the name is derived from the clock style.
+        Return the name of the saved file.
+        '''
+        if fname == None:
+            fname = self.get_shot_name(format)
         self.refresh_params()
         if format == 'svg':
             surface = cairo.SVGSurface(fname, self.size_x, self.size_y)
+            self.draw_vector(cairo.Context(surface))
+            surface.finish()
+        elif format == 'png':
+            renderer = facerenderer.FaceRenderer(self.renderer.chars,
+                            (self.cols, self.rows),
+                            int(round(self.max_pixel_dimension*dpi/72.0)),
+                            **self.renderer.get_style())
+            renderer.render_frame(self.lit_cells).write_to_png(fname)
         else:
             raise BaseException("Allowed file formats: 'svg', 'png'.")
-        self.draw(cairo.Context(surface))
-        surface.finish()
-        to_perc = lambda x : str(int(round(x*100)))
-        new_name = '_'.join((self.font_face,
-                             to_perc(self.charspace),
-                             to_perc(self.borderspace)))
-        if self.italic:
-            new_name += '_italic'
-        if self.bold:
-            new_name += '_bold'
-        if self.case:
-            new_name += '_' + self.case
-        new_name += '.' + format
-        os.rename(fname, new_name)
+        return fname
+
+    def get_style_grid(self, variants, fname='style_grid.png',
+                       thumb_dimension=200, processes=None):
+        '''
+        Save a PNG contact sheet with the clock rendered in all combinations
+        of "variants" (a dictionary {style_parameter:[values]}, e.g.
+        {'font_face':[...], 'charspace':[...], 'borderspace':[...],
+        'case':[None, 'lower', 'upper']}). Rendering is done in parallel.
+        Return the list of rendered styles.
+        '''
+        self.refresh_params()
+        return facerenderer.export_style_grid(self.renderer, variants, fname,
+                            thumb_dimension=thumb_dimension,
+                            processes=processes)
 
 def run_as_script():
     '''Run this code if the file is executed as script.'''
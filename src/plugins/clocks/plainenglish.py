@@ -5,6 +5,7 @@ Clock plugin providing sentences in standard English.
 '''
 
 import models.baseclock
+import models.grammar
 
 __author__ = "Mac Ryan"
 __copyright__ = "Copyright 2011, Mac Ryan"
@@ -58,23 +59,11 @@ class Clock(models.baseclock.Clock):
             29:'twenty-nine',
             30:'half'}
 
-    def __build_time_phrase(self, hours, minutes):
-        '''
-        Return the sentence meaning "it's hours:minute".
-        This method is the only method to make a module for Chasy.
-        '''
-        words = ["It", "is"]
-        if 0 < minutes < 31:
-            words.append(self.nums[minutes])
-            words.append("past")
-        elif minutes > 30:
-            words.append(self.nums[60-minutes])
-            words.append("to")
-            hours += 1
-        words.append(self.nums[hours%12])
-        if minutes == 0:
-            words.append("o'clock")
-        return ' '.join(words)
+    grammar = models.grammar.Grammar(
+        [({'m':0}, "It is {nums:h12} o'clock"),
+         ({'m':xrange(1, 31)}, 'It is {nums:m} past {nums:h12}'),
+         ({'m':xrange(31, 60)}, 'It is {nums:mt} to {nums:nh12}')],
+        {'nums':nums})
 
 
 def run_as_script():
@@ -9,6 +9,7 @@ are maybe redundant in their formulation but are correct.
 '''
 
 import models.baseclock
+import models.grammar
 
 __author__ = "Mac Ryan"
 __credits__ = ["Olga Andronova"]
@@ -19,6 +20,29 @@ __email__ = "quasipedia@gmail.com"
 __status__ = "Stable"
 
 
+def _flatten(choices):
+    '''
+    Return a {key:word} dictionary out of a {(key, key, ...):word} one.
+    '''
+    return dict([(k, word) for keys, word in choices.items() for k in keys])
+
+def _minutes(cardinals, words_minutes, special):
+    '''
+    Return the table of the expressions for 1-30 minutes ("twenty one minutes"
+    and the like). Numbers above twenty are built with the word for twenty,
+    so that the physical clock can reuse the words for the units. "special"
+    holds the expressions which are not numbers (e.g. "quarter").
+    '''
+    table = {}
+    for minutes in range(1, 31):
+        number = cardinals[min(minutes, 20)]
+        if minutes > 20:
+            number += ' ' + cardinals[minutes-20]
+        table[minutes] = number + ' ' + words_minutes[minutes]
+    table.update(special)
+    return table
+
+
 class Clock(models.baseclock.Clock):
 
     '''
@@ -34,27 +58,27 @@ class Clock(models.baseclock.Clock):
     in a day has its unique sentence. Trivia: this is the module that started
     the entire project Chasy.'''
 
-    word_it_is = 'Сейчас'
-
-    word_to = 'без'
-    word_o_clock = 'ровно'
     word_quarter_nominative = 'четверть'
     word_quarter_genitive = 'четверти'
     word_half = 'половина'
-    word_noon = 'полдень'
-    word_midnight = 'полночь'
-    words_hour = {('to_one_hour',1):'час',
-                  ('to_two/three/four_hour', 2,3,4):'часа',
-                  (5,6,7,8,9,10,11,12,13,14,15,16,
-                            17,18,19,20,21,22,23,0):'часов'}
-    words_minutes = {(1,21):'минута',
-                     ('gen_1',2,3,4,22,23,24):'минуты',
-                     ('gen_not_1',5,6,7,8,9,10,11,12,13,14,15,16,17,
-                                  18,19,20,25,26,27,28,29):'минут'}
-    words_day_parts = {(4, 5, 6, 7, 8, 9, 10, 11):'утра',
-                       (12, 13, 14, 15, 16, 17):'дня',
-                       (18, 19, 20, 21, 22, 23):'вечера',
-                       (0, 1, 2, 3, 24):'ночи'} #24 because of +1 ops
+    words_hour = _flatten({(1,):'час',
+                           (2, 3, 4):'часа',
+                           (5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16,
+                            17, 18, 19, 20, 21, 22, 23, 0):'часов'})
+    words_minutes_nominative = _flatten({(1, 21):'минута',
+                                         (2, 3, 4, 22, 23, 24):'минуты',
+                                         (5, 6, 7, 8, 9, 10, 11, 12, 13, 14,
+                                          15, 16, 17, 18, 19, 20, 25, 26, 27,
+                                          28, 29, 30):'минут'})
+    words_minutes_genitive = _flatten({(1, 21):'минуты',
+                                       (2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12,
+                                        13, 14, 15, 16, 17, 18, 19, 20, 22,
+                                        23, 24, 25, 26, 27, 28, 29,
+                                        30):'минут'})
+    words_day_parts = _flatten({(4, 5, 6, 7, 8, 9, 10, 11):'утра',
+                                (12, 13, 14, 15, 16, 17):'дня',
+                                (18, 19, 20, 21, 22, 23):'вечера',
+                                (0, 1, 2, 3, 24):'ночи'}) #24 because of +1 ops
     cardinals_for_hours = {0:'двенадцать', #This is 12 and not 0!!!
                            1:'один',
                            2:'два',
@@ -121,89 +145,38 @@ class Clock(models.baseclock.Clock):
                          11:'одиннадцатого',
                          12:'двенадцатого'}
 
-    def __build_time_phrase(self, hours, minutes):
-        '''
-        Return the sentence meaning "it's hours:minute".
-        This method is the only method to make a module for Chasy.
-        '''
-        output = [self.word_it_is]
-
-        # O'CLOCK CASE
-        if minutes == 0:
-            if hours == 12:
-                output.append(self.word_noon)
-            elif hours == 0:
-                output.append(self.word_midnight)
-            else:
-                output.append(self.word_o_clock)
-                output.append(self.cardinals_for_hours[hours%12])
-                output.append(self._word_select(hours%12, self.words_hour))
-                output.append(self._word_select(hours, self.words_day_parts))
-
-        # <30 MINUTES TO FULL HOUR
-        elif minutes > 30:
-            output.append(self.word_to)
-            # ADD PROPER NUMBER - looks convoluted, but it is so because
-            # it has been written thinking to the actual physical clock
-            # and the need to recycle the word "one, two, three..." for
-            # "twenty-one", "twenty-two", "twenty-three", etc...
-            minutes_to = 60-minutes
-            if minutes_to == 15:
-                output.append(self.word_quarter_genitive)
-            else:
-                if minutes_to >= 20:
-                    output.append(self.cardinals_genitive[20])
-                    if minutes_to > 20:
-                        output.append(self.cardinals_genitive[minutes_to-20])
-                else:
-                    output.append(self.cardinals_genitive[minutes_to])
-                # ADD WORD 'MINUTES'
-                if minutes_to == 1 or minutes_to == 21:
-                    output.append(self._word_select('gen_1',
-                                                    self.words_minutes))
-                else:
-                    output.append(self._word_select('gen_not_1',
-                                                    self.words_minutes))
-            # ADD THE HOUR THAT WILL COME
-            if hours%12+1 == 1:
-                output.append(self._word_select('to_one_hour',
-                                                self.words_hour))
-            else:
-                output.append(self.cardinals_for_hours[hours%12+1])
-            # ONLY FOR 2, 3, 4 PM and 3 AM ADD WORD "часа"
-            if hours+1 in (14, 15, 16, 3):
-                output.append(self._word_select('to_two/three/four_hour',
-                                                self.words_hour))
-            # APPEND DAY PERIOD
-            output.append(self._word_select(hours+1, self.words_day_parts))
-
-        # MAX 30 MINUTES AFTER FULL HOUR
-        elif minutes <= 30:
-            if minutes == 15:
-                output.append(self.word_quarter_nominative)
-            elif minutes == 30:
-                output.append(self.word_half)
-            else:
-                if minutes >= 20:
-                    output.append(self.cardinals_nominative[20])
-                    if minutes > 20:
-                        output.append(self.cardinals_nominative[minutes-20])
-                else:
-                    output.append(self.cardinals_nominative[minutes])
-                output.append(self._word_select(minutes, self.words_minutes))
-            output.append(self.ordinals_genitive[hours%12+1])
-            # ONLY BETWEEN 11:01 AND 11:29 USE "утра" INSTEAD OF "дня"
-            if hours == 11 and minutes != 30:
-                output.append(self._word_select(hours, self.words_day_parts))
-            else:
-                output.append(self._word_select(hours+1, self.words_day_parts))
-
-        # EXCEPTION
-        else:
-            raise(Exception, ' '.join(('Unrecognised time --- ',
-                                       str(hours), ':', str(minutes))))
-        return ' '.join(output)
-
+    # The hour that will come is "час" and not "один час"...
+    to_hours = dict(cardinals_for_hours)
+    to_hours[1] = words_hour[1]
+    # ...and only for 2, 3, 4 PM and 3 AM it is followed by "часа"
+    to_hours_suffix = {3:words_hour[3], 14:words_hour[3],
+                       15:words_hour[3], 16:words_hour[3]}
+
+    grammar = models.grammar.Grammar(
+        [({'h':12, 'm':0}, 'Сейчас полдень'),
+         ({'h':0, 'm':0}, 'Сейчас полночь'),
+         ({'m':0}, 'Сейчас ровно {hours:h12} {words_hour:h12} {day_parts:h}'),
+         # <30 MINUTES TO FULL HOUR
+         ({'m':xrange(31, 60)}, 'Сейчас без {minutes_to:mt} {to_hours:nh12} '
+                                '{to_hours_suffix?:nh} {day_parts:nh}'),
+         # MAX 30 MINUTES AFTER FULL HOUR (between 11:01 and 11:29 use "утра"
+         # instead of "дня")
+         ({'h':11, 'm':xrange(1, 30)}, 'Сейчас {minutes_past:m} '
+                                       '{ordinals:nh12} {day_parts:h}'),
+         ({'m':xrange(1, 31)}, 'Сейчас {minutes_past:m} {ordinals:nh12} '
+                               '{day_parts:nh}')],
+        {'hours':cardinals_for_hours,
+         'words_hour':words_hour,
+         'day_parts':words_day_parts,
+         'to_hours':to_hours,
+         'to_hours_suffix':to_hours_suffix,
+         'ordinals':ordinals_genitive,
+         'minutes_to':_minutes(cardinals_genitive, words_minutes_genitive,
+                               {15:word_quarter_genitive}),
+         'minutes_past':_minutes(cardinals_nominative,
+                                 words_minutes_nominative,
+                                 {15:word_quarter_nominative,
+                                  30:word_half})})
 
 def run_as_script():
     '''Run this code if the file is executed as script.'''
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Led driver plugin for a daisy chain of TLC5940 chips.
+
+The TLC5940 has 16 constant current channels, each with a 12 bit grayscale
+value. Chips are daisy-chained: the grayscale data of the whole chain is
+shifted in at once, starting from the last chip of the chain and, within a
+chip, from channel 15, most significant bit first (two channels every three
+bytes). A frame is the grayscale data of the whole chain, which the device
+(e.g. a microcontroller bridging a serial port to the chain) shifts in and
+latches.
+'''
+
+import math
+import models.baseleddriver
+
+__author__ = "Mac Ryan"
+__copyright__ = "Copyright 2011, Mac Ryan"
+__license__ = "GPL v3"
+__maintainer__ = "Mac Ryan"
+__email__ = "quasipedia@gmail.com"
+__status__ = "Development"
+
+
+class Driver(models.baseleddriver.Driver):
+
+    '''
+    TLC5940 daisy chain driver.
+    '''
+
+    __module_name__ = 'TLC5940 daisy chain'
+    __authors__ = 'Mac Ryan'
+    __description__ = '''Streams frames to a daisy chain of TLC5940 16
+    channel, 12 bit grayscale led drivers: 24 bytes per chip and frame.'''
+
+    CHANNELS_PER_CHIP = 16
+    MAX_GS_VALUE = 4095
+
+    def __init__(self, device, channels, batch_size=None, max_gs=None,
+                 chips=None):
+        '''
+        - chips: number of chips of the chain (default: enough chips for
+          the channel numbers of "channels")
+        - max_gs: the highest grayscale value of each chip (a number, or a
+          list with a value per chip, see ledstrings.get_max_gs). Brightness
+          scales these values.
+        '''
+        models.baseleddriver.Driver.__init__(self, device, channels,
+                                             batch_size)
+        if chips == None:
+            chips = max(1, int(math.ceil(self.channels * 1.0 /
+                                         self.CHANNELS_PER_CHIP)))
+        self.chips = chips
+        if max_gs == None:
+            max_gs = self.MAX_GS_VALUE
+        if isinstance(max_gs, (int, long)):
+            max_gs = [max_gs] * self.chips
+        self.max_gs = max_gs
+        self.__chip_cache = {}  # {(chip, chip mask):encoded chip}
+
+    def set_brightness(self, brightness):
+        models.baseleddriver.Driver.set_brightness(self, brightness)
+        self.__chip_cache = {}
+
+    def __encode_chip(self, chip, chip_mask):
+        gs = int(round(self.max_gs[chip] * self.brightness))
+        values = [gs if chip_mask >> channel & 1 else 0 for channel in
+                  reversed(range(self.CHANNELS_PER_CHIP))]
+        data = []
+        for a, b in zip(values[::2], values[1::2]):
+            data.extend((a >> 4, (a & 0xf) << 4 | b >> 8, b & 0xff))
+        return ''.join(map(chr, data))
+
+    def encode_frame(self, mask):
+        if mask >> self.chips * self.CHANNELS_PER_CHIP:
+            raise BaseException('Frame has channels beyond the %d chips of '
+                                'the chain' % self.chips)
+        chip_full = (1 << self.CHANNELS_PER_CHIP) - 1
+        blocks = []
+        for chip in reversed(range(self.chips)):
+            key = (chip, mask >> chip * self.CHANNELS_PER_CHIP & chip_full)
+            try:
+                blocks.append(self.__chip_cache[key])
+            except KeyError:
+                self.__chip_cache[key] = self.__encode_chip(*key)
+                blocks.append(self.__chip_cache[key])
+        return ''.join(blocks)
+
+
+def run_as_script():
+    '''Run this code if the file is executed as script.'''
+    print('Module executed as script!')
+
+if __name__ == '__main__':
+    run_as_script()
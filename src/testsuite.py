@@ -10,6 +10,29 @@ import supseq
 import baseclock
 import copy
 import clocks.verboserussian as verboserussian
+import models.projectfile as projectfile
+import models.journal as journal
+import models.project as project
+import models.history as history
+import models.clockmanager as clockmanager
+import models.grammar as grammar
+import models.phrasepool as phrasepool
+import models.automaton as automaton
+import models.ledstrings as ledstrings
+import models.firmware as firmware
+import models.drivermanager as drivermanager
+import models.baseleddriver as baseleddriver
+import models.powersim as powersim
+import models.precedence as precedence
+import models.annealing as annealing
+import models.lowerbound as lowerbound
+import sys
+import pickle
+import StringIO
+import tempfile
+import threading
+import shutil
+import os
 
 __author__ = "Mac Ryan"
 __copyright__ = "Copyright 2011, Mac Ryan"
@@ -53,9 +76,12 @@ class LogicPrivateUtils(unittest.TestCase):
 
     def testIsomorphicFamilies(self):
         '''Grouping similar phrases together.'''
-        families = self.logic._get_isomorphic_families(self.phrases)
+        pool = phrasepool.PhrasePool(self.phrases)
+        families = self.logic._get_isomorphic_families(
+                                    [tuple(phrase) for phrase in pool.phrases])
         self.assertEqual(len(self.expected_families), len(families))
-        families = set([tuple(sorted(fam)) for fam in families])
+        families = set([tuple(sorted([pool.join(p) for p in fam]))
+                        for fam in families])
         expected_families = set([tuple(sorted(fam)) for fam in
                                                     self.expected_families])
         self.assertEqual(families, expected_families)
@@ -66,8 +92,36 @@ class LogicPrivateUtils(unittest.TestCase):
         expected_orphans = ['it is nine to nine', 'it is five to seven']
         phrases.insert(3, expected_orphans[1])
         phrases.insert(7, expected_orphans[0])
-        orphans = self.logic._get_orphans(phrases, self.expected_families)
-        self.assertEqual(sorted(orphans), sorted(expected_orphans))
+        pool = phrasepool.PhrasePool()
+        families = [[pool.tokenise(p) for p in fam]
+                    for fam in self.expected_families]
+        orphans = self.logic._get_orphans([pool.tokenise(p) for p in phrases],
+                                          families)
+        self.assertEqual(sorted([pool.join(p) for p in orphans]),
+                         sorted(expected_orphans))
+
+    def testCombinationNumber(self):
+        '''Number of pairs, also when there aren't enough phrases.'''
+        self.assertEqual(self.logic._get_combination_number(5, 2), 10)
+        self.assertEqual(self.logic._get_combination_number(1, 2), 0)
+
+    def testMisalignedFamily(self):
+        '''Supersequence of a family the matcher aligns on different words.'''
+        pool = phrasepool.PhrasePool()
+        family = [pool.tokenise('it is ten to one'),
+                  pool.tokenise('it is seven to ten')]
+        supersequence = self.logic._get_isomorphic_supersequence(pool, family)
+        self.assertEqual(pool.join(supersequence),
+                         'it is seven ten to one ten')
+
+    def testMultiStartReport(self):
+        '''Spread of the outcomes of multiple runs.'''
+        results = [(12, 0, None), (10, 1, None), (10, 2, None), (16, 3, None)]
+        report = self.logic._get_multi_start_report(results)
+        self.assertTrue('Runs: 4\n' in report)
+        self.assertTrue('(min, avg, max): (10, 12.0, 16)\n' in report)
+        self.assertTrue('Standard deviation: 2.4 chars\n' in report)
+        self.assertTrue('Best: 10 chars with seed 1\n' in report)
 
 class LogicPublicAPI(unittest.TestCase):
 
@@ -122,6 +176,39 @@ class LogicPublicAPI(unittest.TestCase):
         sequence = self.logic.get_sequence(phrases, force_rerun=True)
         self.assertTrue(sequence.sanity_check())
 
+    def testSeededHeuristic(self):
+        '''The winning seed of a multi-start run reproduces its sequence'''
+        phrases = ['it is one past seven', 'it is ten to one',
+                   'it is often even', 'it is seven to ten']
+        report = self.logic.multi_start_sequence(runs=4, processes=1,
+                                                 phrases=phrases)
+        best = self.logic.project.supersequence.get_sequence_as_string()
+        seed = int(report.split('with seed ')[1].split()[0])
+        for i in range(2):
+            sequence = self.logic.get_sequence(phrases, force_rerun=True,
+                                               seed=seed)
+            self.assertTrue(sequence.sanity_check())
+            self.assertEqual(sequence.get_sequence_as_string(), best)
+
+    def testPowerSimulationSpecs(self):
+        '''The power simulation uses the specs of the led strings'''
+        phrases = ['it is one', 'it is two']
+        sequence = self.logic.get_sequence(phrases, force_rerun=True)
+        specs = ledstrings.get_specs(current=0.04)
+        sequence.set_led_strings(specs)
+        self.assertEqual(sequence.led_specs, specs)
+        directory = tempfile.mkdtemp()
+        try:
+            report = self.logic.export_power_simulation(
+                                        os.path.join(directory, 'power.csv'))
+        finally:
+            shutil.rmtree(directory)
+        simulation = powersim.PowerSimulation(sequence,
+                    powersim.get_table_frames(sequence.firmware_table), specs)
+        self.assertEqual(report, simulation.get_report())
+        simulation = powersim.PowerSimulation(sequence,
+                    powersim.get_table_frames(sequence.firmware_table))
+        self.assertNotEqual(report, simulation.get_report())
 
     def testCoarseRedundancyLoop(self):
         '''Coarse redundancy filter loop.'''
@@ -137,15 +224,15 @@ class LogicPublicAPI(unittest.TestCase):
                        the home land farm fridge fridge it is none of your
                        business have"""
         ok_seq = ' '.join(ok_seq.split())
-        sequence = noisy_seq
+        pool = phrasepool.PhrasePool(phrases)
+        sequence = pool.tokenise(noisy_seq)
         while True:
-            new_sequence = self.logic.coarse_redundancy_filter(sequence,
-                                                               phrases)
+            new_sequence = self.logic.coarse_redundancy_filter(sequence, pool)
             if len(new_sequence) < len(sequence):
                 sequence = new_sequence
             else:
                 break
-        self.assertEqual(new_sequence, ok_seq)
+        self.assertEqual(pool.join(new_sequence), ok_seq)
 
 
 class Element(unittest.TestCase):
@@ -259,6 +346,21 @@ class SuperSequence(unittest.TestCase):
         new_seq = t.get_sequence_as_string()
         self.assertEqual(new_seq, 'have one two banana carrot dog I cats')
 
+    def testFeasibleRange(self):
+        '''Range of positions an element can be shifted to'''
+        phrases = ['I have one dog', 'I have two cats']
+        seq = 'I have one two banana carrot dog cats'
+        s = supseq.SuperSequence(seq, phrases)
+        self.assertEqual(s.get_feasible_range(-1), (4, 7))
+        self.assertEqual(s.get_feasible_range(-2), (3, 7))
+        self.assertEqual(s.get_feasible_range(4), (0, 7))
+        self.assertEqual(s.get_feasible_range(0), (0, 0))
+        self.assertEqual(supseq.merge_intervals([(5, 6), (0, 2), (3, 3)]),
+                         [(0, 3), (5, 6)])
+        self.assertEqual(supseq.intersect_intervals([(0, 3), (5, 9)],
+                                                    [(2, 6)]),
+                         [(2, 3), (5, 6)])
+
     def testConvergence(self):
         '''Make two elements converge'''
         phrases = ['aaa bbb ccc', 'ccc ddd eee']
@@ -326,6 +428,23 @@ class SuperSequence(unittest.TestCase):
         s.substring_merging_optimisation()
         self.assertTrue(s.get_sequence_as_string() in valid)
 
+    def testMergeAdjacentSubstrings(self):
+        '''Adjacent pairs not sharing phrases are merged in one batch'''
+        phrases = ['it is seven', 'it is even', 'it is often', 'it is ten']
+        s = supseq.SuperSequence('it is seven even often ten', phrases)
+        s.substring_merging_optimisation()
+        self.assertEqual(s.get_sequence_as_string(), 'it is seven often')
+        self.assertEqual(s._merged_mapping, {'even':['seven'],
+                                             'ten':['often']})
+        self.assertTrue(s.sanity_check())
+
+    def testWordAutomaton(self):
+        '''The automaton finds all the words contained in a text'''
+        words = ['he', 'she', 'his', 'hers']
+        finder = automaton.WordAutomaton(words)
+        self.assertEqual(sorted(finder.find('ushers')), [0, 1, 3])
+        self.assertEqual(finder.find('this'), set([2]))
+
     def testGetBestFit(self):
         '''Test bin filling heuristics'''
         phrases = ['I have one dog', 'I have two cats']
@@ -348,6 +467,18 @@ class SuperSequence(unittest.TestCase):
 #        self.assertTrue(tmp[0])
 #        self.assertEqual('two one cats', best_str)
 
+    def testVersion(self):
+        '''In-place changes bump the version, clones don't'''
+        phrases = ['I have one dog', 'I have two cats']
+        t = supseq.SuperSequence('I have one two dog cats', phrases)
+        self.assertEqual(t.version, 0)
+        t.shift_element(3, 'left')
+        t.pad_element(1, +1)
+        self.assertEqual(t.version, 2)
+        clone = copy.deepcopy(t)
+        clone.pad_element(1, -1)
+        self.assertEqual(t.version, 2)
+
 
 class BaseClock(unittest.TestCase):
 
@@ -1867,5 +1998,739 @@ class Russian(unittest.TestCase):
         for k in known_values:
             self.assertEqual(self.clock.get_time_phrase(*k), known_values[k])
 
+class ProjectFile(unittest.TestCase):
+
+    '''
+    Test the projectfile serialisation.
+    '''
+
+    phrases = ['I have one dog', 'I have two cats', 'I have a bone dog']
+    settings = {'clock':'Standard English 12h', 'resolution':1,
+                'approx_method':'closest'}
+
+    def _get_sequence(self):
+        s = supseq.SuperSequence('I have two cats bone dog', self.phrases)
+        s._merged_mapping = {u'one':[u'bone'], u'a':[u'cats']}
+        s[3].word = u'  ' + s[3].word
+        return s
+
+    def testRoundTrip(self):
+        '''Words, spacing, mapping and settings survive a round trip'''
+        s = self._get_sequence()
+        data = projectfile.serialise({'supersequence':s,
+                                      'project_settings':self.settings})
+        prj = projectfile.deserialise(data)
+        self.assertEqual(prj['SCHEMA_VERSION'], projectfile.SCHEMA_VERSION)
+        self.assertEqual(prj['project_settings'], self.settings)
+        loaded = prj['supersequence']
+        self.assertEqual([el.word for el in loaded], [el.word for el in s])
+        self.assertEqual(loaded._merged_mapping, s._merged_mapping)
+
+    def testLazyPool(self):
+        '''The sanity pool is only regenerated when needed'''
+        data = projectfile.serialise({'supersequence':self._get_sequence()})
+        loaded = projectfile.deserialise(data)['supersequence']
+        calls = []
+        factory = lambda : calls.append(1) or self.phrases
+        loaded.set_pool_factory(factory)
+        self.assertEqual(calls, [])
+        self.assertTrue(loaded.sanity_check())
+        self.assertTrue(loaded.sanity_check())
+        self.assertEqual(calls, [1])
+
+    def testLegacyMigration(self):
+        '''Pickled (schema 1.0) projects are converted'''
+        s = self._get_sequence()
+        legacy = pickle.dumps({'SCHEMA_VERSION':'1.0',
+                               'project_settings':self.settings,
+                               'vclock_settings':None,
+                               'electronics_settings':None,
+                               'supersequence':s}, pickle.HIGHEST_PROTOCOL)
+        prj = projectfile.deserialise(legacy)
+        self.assertEqual(prj['SCHEMA_VERSION'], projectfile.SCHEMA_VERSION)
+        self.assertEqual(prj['supersequence'].to_dict(), s.to_dict())
+        self.assertTrue(len(projectfile.serialise(prj)) < len(legacy))
+
+    def testHeaderOnly(self):
+        '''The header can be read without decoding the payload'''
+        data = projectfile.serialise({'supersequence':self._get_sequence(),
+                                      'project_settings':self.settings})
+        header, payload = projectfile.split(data)
+        self.assertEqual(header['project_settings'], self.settings)
+        self.assertEqual(header['stats']['words'], 6)
+        self.assertTrue(isinstance(payload.data, basestring))
+        self.assertEqual(header, projectfile.parse_header(data.split('\n')[0]))
+
+class Journal(unittest.TestCase):
+
+    '''
+    Test the journaled autosave.
+    '''
+
+    phrases = ProjectFile.phrases
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'test.sav')
+        self.sequence = supseq.SuperSequence('I have two cats bone dog',
+                                             self.phrases)
+        self.sequence._merged_mapping = {u'one':[u'bone'], u'a':[u'cats']}
+        factory = lambda : projectfile.serialise({'supersequence':
+                                                  self.sequence})
+        self.journal = journal.Journal(self.fname, factory)
+        self.journal.attach(self.sequence)
+        self.journal.wait()
+
+    def tearDown(self):
+        self.journal.stop(discard=False)
+        shutil.rmtree(self.directory)
+
+    def _edit(self):
+        self.sequence.shift_element(3, 'right', only_if_sane=False)
+        self.sequence.pad_element(2, +1)
+        self.sequence.set_cols(7)
+
+    def testRecovery(self):
+        '''Changes not in a snapshot are replayed on recovery'''
+        self._edit()
+        self.journal.wait()
+        recovered = journal.recover(self.fname)['supersequence']
+        self.assertEqual(recovered.to_dict(), self.sequence.to_dict())
+
+    def testMergeRecovery(self):
+        '''Merges are replayed on snapshots without a phrase pool'''
+        self.sequence.insert_element(4, 'one')
+        self.assertTrue(self.sequence.merge_elements(self.sequence[5],
+                                                     self.sequence[4]))
+        self.journal.wait()
+        recovered = journal.recover(self.fname)['supersequence']
+        self.assertEqual(recovered.sanity_pool, None)
+        self.assertEqual(recovered.to_dict(), self.sequence.to_dict())
+
+    def testCompaction(self):
+        '''Compaction writes a snapshot and trims the journal'''
+        self.journal.COMPACT_EVERY = 2
+        self._edit()
+        self.journal.wait()
+        self.sequence.pad_element(0, +1)
+        self.assertEqual([s for s, l in self.journal.tail], [3, 4])
+        recovered = journal.recover(self.fname)['supersequence']
+        self.assertEqual(recovered.to_dict(), self.sequence.to_dict())
+
+    def testBackgroundSync(self):
+        '''Files are synced by the writer thread only'''
+        synced = []
+        fsync = os.fsync
+        def spy(fd):
+            synced.append(threading.current_thread().name)
+            fsync(fd)
+        os.fsync = spy
+        try:
+            self.journal.COMPACT_EVERY = 2
+            self.journal.stop(discard=False)
+            self.journal.attach(self.sequence)
+            self._edit()
+            self.journal.wait()
+        finally:
+            os.fsync = fsync
+        self.assertTrue(synced)
+        self.assertFalse(threading.current_thread().name in synced)
+        recovered = journal.recover(self.fname)['supersequence']
+        self.assertEqual(recovered.to_dict(), self.sequence.to_dict())
+
+    def testDiscard(self):
+        '''Stopping the journal deletes its files'''
+        self._edit()
+        self.assertTrue(journal.has_autosave(self.fname))
+        self.journal.stop()
+        self.assertFalse(journal.has_autosave(self.fname))
+        self.assertEqual(journal.recover(self.fname), None)
+
+class Project(unittest.TestCase):
+
+    '''
+    Test the project bookkeeping.
+    '''
+
+    phrases = ProjectFile.phrases
+    settings = ProjectFile.settings
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'test.sav')
+        self.project = self._get_project()
+        self.project.project_settings = dict(self.settings)
+        self.project.last_save_fname = self.fname
+        self.project.supersequence = supseq.SuperSequence(
+                                'I have two cats one a bone dog', self.phrases)
+        self.project.broadcast_change()
+        self.project.save(self.fname)
+
+    def tearDown(self):
+        self.project.stop_autosave()
+        shutil.rmtree(self.directory)
+
+    def _get_project(self):
+        # Like the core, set the phrases factory when the settings change
+        prj = project.Project()
+        def on_updated(prj, data):
+            if data and 'project_settings' in data:
+                prj.phrases_factory = lambda : self.phrases
+        prj.connect('project_updated', on_updated)
+        return prj
+
+    def testRecovery(self):
+        '''A sequence recovered on loading regenerates its pool'''
+        self.project.supersequence.pad_element(2, +1)
+        self.project.journal.wait()
+        self.project.journal.stop(discard=False)
+        self.project.journal = None  # the session has crashed
+        prj = self._get_project()
+        prj.load(self.fname, [self.settings['clock']])
+        try:
+            self.assertTrue(prj.is_unsaved())
+            self.assertEqual(prj.supersequence.to_dict(),
+                             self.project.supersequence.to_dict())
+            self.assertTrue(prj.supersequence.sanity_check())
+        finally:
+            prj.stop_autosave()
+
+    def testEqualSettings(self):
+        '''Assigning equal settings is not a change'''
+        self.project.project_settings = dict(self.settings)
+        self.project.vclock_settings = None
+        self.project.supersequence = self.project.supersequence
+        self.assertFalse(self.project.broadcast_change())
+        self.assertFalse(self.project.is_unsaved())
+        self.project.project_settings = dict(self.settings, resolution=60)
+        self.assertTrue(self.project.broadcast_change())
+        self.assertTrue(self.project.is_unsaved())
+
+
+class History(unittest.TestCase):
+
+    '''
+    Test the undo/redo history.
+    '''
+
+    phrases = ProjectFile.phrases
+
+    def setUp(self):
+        self.sequence = supseq.SuperSequence('I have two cats bone dog a one',
+                                             self.phrases)
+        self.history = history.History(self.sequence)
+
+    def _edit(self):
+        self.sequence.pad_element(3, +2)
+        self.history.checkpoint()
+        self.sequence.shift_element(3, 'right', only_if_sane=False)
+        self.history.checkpoint()
+        self.sequence.apply_operation('merge', 4, 7)
+        self.sequence.pop(6)
+        self.sequence.set_cols(9)
+
+    def testUndoRedo(self):
+        '''Undoing and redoing all steps restores the sequence'''
+        before = self.sequence.to_dict()
+        self._edit()
+        after = self.sequence.to_dict()
+        while self.history.undo() != None:
+            pass
+        self.assertEqual(self.sequence.to_dict(), before)
+        while self.history.redo() != None:
+            pass
+        self.assertEqual(self.sequence.to_dict(), after)
+
+    def testSteps(self):
+        '''Steps are undone one at a time, a new change clears redo'''
+        self._edit()
+        self.assertEqual(len(self.history.undo_stack), 3)
+        self.assertEqual(self.history.undo(), 0)  # cols change
+        self.assertEqual(self.history.undo(), 3)
+        self.assertEqual(self.sequence[3].word, u'  cats')
+        self.sequence.pad_element(0, +1)
+        self.assertFalse(self.history.can_redo())
+
+    def testPadSteps(self):
+        '''Undoing and redoing a padding reports the padded position'''
+        for amount in (+1, -1):
+            self.sequence.pad_element(5, amount)
+            self.history.checkpoint()
+            self.assertEqual(self.history.undo(), 5)
+            self.assertEqual(self.history.redo(), 5)
+        self.assertEqual(history.get_first_position([('pad', 5, 1),
+                                                     ('pop', 6, u'a')]), 5)
+
+class ClockManager(unittest.TestCase):
+
+    '''
+    Test the discovery of clock modules.
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_fname = os.path.join(self.directory, 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testLazyDiscovery(self):
+        '''Modules are listed without being imported'''
+        sys.modules.pop('plugins.clocks.plainenglish', None)
+        cm = clockmanager.ClockManager(self.cache_fname)
+        self.assertTrue('Standard English 12h' in cm.get_all_module_names())
+        self.assertEqual(cm.get_all_module_names('Russian'),
+                         ['Verbose Russian'])
+        self.assertFalse('plugins.clocks.plainenglish' in sys.modules)
+        clock = cm.get_clock_instance('Standard English 12h', 1, 'closest')
+        self.assertEqual(clock.__module_name__, 'Standard English 12h')
+
+    def testCache(self):
+        '''Unchanged modules are read from the cache'''
+        cm = clockmanager.ClockManager(self.cache_fname)
+        for entry in cm.cache.values():
+            entry['info']['description'] = 'cached'
+        cm._PluginManager__save_cache()
+        cm = clockmanager.ClockManager(self.cache_fname)
+        self.assertEqual(cm.get_module_description('Verbose Russian'),
+                         'cached')
+
+class Grammar(unittest.TestCase):
+
+    '''
+    Test the declarative grammars.
+    '''
+
+    tables = {'nums':dict(enumerate(['twelve', 'one', 'two', 'three', 'four',
+                                     'five', 'six', 'seven', 'eight', 'nine',
+                                     'ten', 'eleven', 'twelve'])),
+              'pm':dict([(h, 'pm') for h in range(12, 24)])}
+
+    def testCompiledTable(self):
+        '''Phrases are unique and looked up from the compiled table'''
+        g = grammar.Grammar([({'m':0}, '{nums:h12} o\'clock {pm?:h}'),
+                             ({}, 'after {nums:h12}')], self.tables)
+        self.assertEqual(g.get_phrase(13, 0), "one o'clock pm")
+        self.assertEqual(g.get_phrase(1, 0), "one o'clock")
+        self.assertEqual(g.get_phrase(1, 30), 'after one')
+        self.assertEqual(len(g.table), 1440)
+        self.assertEqual(len(g.phrases), 12 + 12 + 12)
+        self.assertEqual(g.get_phrase(24, 0), "twelve o'clock")
+
+    def testErrors(self):
+        '''Missing rules, tables and words are reported'''
+        self.assertRaises(grammar.GrammarError, grammar.Grammar,
+                          [({'m':0}, '{nums:h12}')], self.tables)
+        self.assertRaises(grammar.GrammarError, grammar.Grammar,
+                          [({}, '{nope:h}')], self.tables)
+        self.assertRaises(grammar.GrammarError, grammar.Grammar,
+                          [({}, '{nums:m}')], self.tables)
+
+class SecondsClock(unittest.TestCase):
+
+    '''
+    Test clocks with a resolution finer than a minute.
+    '''
+
+    class Clock(baseclock.Clock):
+        __granularity__ = 15
+        grammar = grammar.Grammar([({'s':0}, '{n:m} sharp'),
+                                   ({}, '{n:m} and {n:s}')],
+                                  {'n':dict([(i, str(i)) for i in range(60)])},
+                                  granularity=15)
+
+    def testApproximation(self):
+        '''Times are approximated to the resolution in seconds'''
+        clock = self.Clock('15s', 'closest')
+        self.assertEqual(clock.approximate(10, 59, 53), (11, 0, 0))
+        self.assertEqual(clock.get_time_phrase(1, 2, 20), '2 and 15')
+        clock = self.Clock('15s', 'last')
+        self.assertEqual(clock.get_time_phrase(1, 2, 59), '2 and 45')
+        # Phrases can't be finer than the granularity of the plugin
+        self.assertEqual(self.Clock('1s', 'last').step, 15)
+
+    def testStreaming(self):
+        '''Unique phrases are generated lazily and without repetitions'''
+        clock = self.Clock('15s', 'closest')
+        self.assertEqual(clock.get_frames_per_day(), 24 * 60 * 4)
+        phrases = clock.iter_unique_phrases()
+        self.assertEqual(phrases.next(), '0 sharp')
+        self.assertEqual(len(list(phrases)), 60 * 4 - 1)
+        self.assertEqual(clock.get_phrases_dump(True)[1], '00:00:15  0 and 15')
+        minutes = self.Clock(5, 'closest')
+        self.assertEqual(len(minutes.get_phrases_dump()), 24 * 12)
+
+class PhrasePool(unittest.TestCase):
+
+    '''
+    Test the pool of tokenised phrases.
+    '''
+
+    def testTokenisation(self):
+        '''Words are shared between phrases, duplicates are counted'''
+        pool = phrasepool.PhrasePool(['it is one', 'it is two', 'it is one'])
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(len(pool.vocabulary), 4)
+        self.assertEqual(list(pool.multiplicity), [2, 1])
+        self.assertEqual(pool.get_words(1), (u'it', u'is', u'two'))
+        self.assertEqual(list(pool), [u'it is one', u'it is two'])
+        self.assertTrue(pool.has_bigram(u'is', u'two'))
+        self.assertFalse(pool.has_bigram(u'two', u'is'))
+        self.assertTrue(phrasepool.as_pool(pool) is pool)
+        self.assertTrue(copy.deepcopy(pool) is pool)
+        self.assertEqual(pool.get_word_bits('is'), 0b11)
+        self.assertEqual(pool.get_word_bits('three'), 0)
+        self.assertEqual(list(phrasepool.iter_bits(0b101)), [0, 2])
+
+    def testPhraseBits(self):
+        '''Elements know the phrases using them, also after merges'''
+        phrases = ['it is seven', 'it is even', 'it is ten']
+        seq = supseq.SuperSequence('it is seven even ten', phrases)
+        self.assertEqual(seq.get_phrase_bits(2), 0b001)
+        self.assertEqual(seq.get_phrase_bits(0), 0b111)
+        self.assertFalse(seq.can_remove(2))
+        seq.substring_merging_optimisation()
+        self.assertEqual(seq.get_phrase_bits(2), 0b011)
+        self.assertTrue(seq[1].test_contact())
+        self.assertFalse(seq[2].test_contact())
+        seq.insert_element(2, 'ten')
+        self.assertTrue(seq.can_remove(2))
+
+    def testFromClock(self):
+        '''A pool from a clock maps each phrase to the times displaying it'''
+        clock = SecondsClock.Clock(1, 'last')
+        pool = phrasepool.PhrasePool.from_clock(clock)
+        self.assertEqual(len(pool), 60)
+        self.assertEqual(sum(pool.multiplicity), 24 * 60)
+        phrase_id = pool.get_phrase_id('5 sharp')
+        self.assertEqual(list(pool.times[phrase_id][:2]), [300, 3900])
+        # Looking up unknown phrases doesn't grow the vocabulary
+        words = len(pool.vocabulary)
+        self.assertEqual(pool.get_phrase_id('5 flat'), None)
+        self.assertEqual(len(pool.vocabulary), words)
+
+    def testNonAsciiSanity(self):
+        '''Sanity checks compare words as unicode'''
+        phrases = ['ровно час', 'ровно два', 'два часа']
+        seq = supseq.SuperSequence('ровно два часа час', phrases)
+        self.assertTrue(seq.sanity_check())
+        self.assertTrue(seq[1].test_contact())
+        self.assertFalse(seq[2].test_contact())
+        self.assertEqual(seq[0].get_word_length(), 5)
+        self.assertFalse(supseq.SuperSequence('ровно часа', phrases).
+                         sanity_check())
+
+class LedStrings(unittest.TestCase):
+
+    '''
+    Test the assignment of led strings to the driver chips.
+    '''
+
+    def testSplit(self):
+        '''Words are split in strings of balanced length'''
+        self.assertEqual(ledstrings.split_in_strings(15, 7), [5, 5, 5])
+        self.assertEqual(ledstrings.split_in_strings(8, 7), [4, 4])
+        self.assertEqual(ledstrings.split_in_strings(7, 7), [7])
+
+    def testSpreading(self):
+        '''Strings lit together are spread on different chips'''
+        specs = ledstrings.get_specs(used_channels=2)
+        seq = supseq.SuperSequence('aa bb cc dd', ['aa bb', 'cc dd'])
+        seq.set_led_strings(specs)
+        chips = [el.led_strings[0] / 16 for el in seq]
+        self.assertEqual(sorted([el.led_strings[0] for el in seq]),
+                         [0, 1, 16, 17])
+        self.assertNotEqual(chips[0], chips[1])
+        self.assertNotEqual(chips[2], chips[3])
+        optimiser = ledstrings.LedStringOptimiser([2] * 4, [[0], [0], [1],
+                                                  [1]], specs)
+        naive = optimiser.get_sequential_assignment()
+        best = optimiser.optimise()
+        self.assertTrue(max(optimiser.get_dissipations(best)) <
+                        max(optimiser.get_dissipations(naive)))
+        self.assertRaises(BaseException, ledstrings.get_specs, volts=5)
+
+class FirmwareTable(unittest.TestCase):
+
+    '''
+    Test the compact clock table of the firmware.
+    '''
+
+    # "it is" + hour, with the second half of the day equal to the first
+    phrases = [[(0,), (1,), (2 + h,)] for h in range(12)]
+    times = [[h * 3600, (h + 12) * 3600] for h in range(12)]
+
+    def testEncoding(self):
+        '''Common word runs are shared and the 12h repetition folded'''
+        table = firmware.FirmwareTable(self.phrases, self.times)
+        self.assertEqual(table.step, 3600)
+        self.assertEqual((table.frames, len(table.index)), (24, 12))
+        self.assertTrue(table.direct)
+        self.assertTrue((0, 1) in table.runs)
+        tables = table.get_tables()
+        self.assertEqual(tables['frameIndex'][1], [])
+        self.assertTrue(table.get_worst_case_cycles() <
+                        firmware.get_legacy_cycles(
+                            [[c for w in p for c in w] for p in self.phrases]))
+        self.assertTrue('showFrame' in table.get_c_code())
+
+    def testDecoding(self):
+        '''Tables decode to the channels of each phrase'''
+        # Hours 0-5 and 12-17 show the same words, the others their own
+        times = [[h * 3600 for h in range(6)]] + \
+                [[h * 3600, (h + 12) * 3600] for h in range(6, 12)] + \
+                [[h * 3600 for h in range(12, 18)]]
+        table = firmware.FirmwareTable(self.phrases[:7] + self.phrases[:1],
+                                       times)
+        self.assertFalse(table.direct)
+        tables = dict([(k, v) for k, (t, v) in table.get_tables().items()])
+        for frame in range(24):
+            phrase = tables['frameIndex'][frame % len(table.index)]
+            channels = []
+            for p in range(*tables['phraseOffsets'][phrase:phrase+2]):
+                run = tables['phraseData'][p]
+                channels.extend(tables['runData'][slice(
+                                    *tables['runOffsets'][run:run+2])])
+            hour = frame % 12
+            self.assertEqual(channels, [0, 1, 2 + max(hour - 5, 0)])
+
+    def testVerification(self):
+        '''The emulated firmware is checked against the phrases'''
+        phrases = ['it is one', 'it is two', 'it is three']
+        seq = supseq.SuperSequence('it is one two three', phrases)
+        report = seq.set_led_strings()
+        self.assertTrue('All 3 frames' in report)
+        table = seq.firmware_table
+        frames = list(enumerate(phrases))
+        self.assertEqual(firmware.verify(table, seq, frames), [])
+        table.runs[-1] = (0,)  # break the last phrase
+        mismatches = firmware.verify(table, seq, frames)
+        self.assertEqual([m[:2] for m in mismatches], [(2, 'it is three')])
+        mismatches = firmware.verify(table, seq, [(0, 'it is four')])
+        self.assertEqual(mismatches[0][2], None)
+
+class LedDriver(unittest.TestCase):
+
+    '''
+    Test the led driver plugins.
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.device = os.path.join(self.directory, 'device')
+        manager = drivermanager.DriverManager(None)
+        self.driver = manager.get_driver_instance('TLC5940 daisy chain',
+                                                  self.device, 20,
+                                                  batch_size=4)
+
+    def tearDown(self):
+        self.driver.close()
+        shutil.rmtree(self.directory)
+
+    def testEncoding(self):
+        '''Grayscale data is shifted last chip and last channel first'''
+        self.driver.set_brightness(0.5)
+        data = self.driver.encode_frame(baseleddriver.get_mask([0, 16]))
+        self.assertEqual(len(data), 48)
+        self.assertEqual(map(ord, data[21:24]), [0, 0x08, 0x00])
+        self.assertEqual(map(ord, data[45:48]), [0, 0x08, 0x00])
+        self.assertEqual(data[:21].strip('\x00'), '')
+
+    def testDeviceErrors(self):
+        '''Frames pushed to a closed device and failed writes raise'''
+        for i in range(3):
+            self.driver.push_frame([i])
+        self.assertRaises(BaseException, self.driver.push_frame, [3])
+        self.driver.open()
+        self.driver.close()
+        self.driver.push_frame([0])
+        self.assertRaises(BaseException, self.driver.flush)
+        self.driver.open()
+        self.driver._Driver__file.close()  # the device went away
+        self.driver.flush()
+        self.assertRaises(ValueError, self.driver.wait)
+        self.driver.wait()
+
+    def testChainSize(self):
+        '''The chain is sized on the highest channel number'''
+        manager = drivermanager.DriverManager(None)
+        channels = range(8) + range(16, 24)
+        driver = manager.get_driver_instance('TLC5940 daisy chain',
+                                             self.device, channels)
+        self.assertEqual(driver.chips, 2)
+        data = driver.encode_frame(baseleddriver.get_mask([23]))
+        self.assertEqual(map(ord, data[12:15]), [0xff, 0xf0, 0])
+        driver = manager.get_driver_instance('TLC5940 daisy chain',
+                                             self.device, 16, chips=1)
+        self.assertRaises(BaseException, driver.encode_frame, 1 << 16)
+
+    def testStreaming(self):
+        '''Frames are written in batches, in order'''
+        self.driver.open()
+        for i in range(5):
+            self.driver.push_frame([i])
+        self.driver.wait()
+        self.assertEqual(os.path.getsize(self.device), 4 * 48)
+        stats = baseleddriver.benchmark(self.driver, 100)
+        self.driver.close()
+        self.assertEqual(os.path.getsize(self.device), 105 * 48)
+        self.assertEqual(stats['bytes'], 100 * 48)
+
+class PowerSimulation(unittest.TestCase):
+
+    '''
+    Test the whole-day simulation of the power needs.
+    '''
+
+    def setUp(self):
+        phrases = ['it is one', 'it is two', 'it is three']
+        self.seq = supseq.SuperSequence('it is one two three', phrases)
+        self.seq.set_led_strings()
+        self.specs = ledstrings.get_specs()
+        self.simulation = powersim.PowerSimulation(self.seq,
+                    powersim.get_table_frames(self.seq.firmware_table))
+
+    def testPeaks(self):
+        '''Peaks are those of the frame lighting the most leds'''
+        self.assertEqual(self.simulation.get_peak_leds(), (9, 2))
+        current, frame = self.simulation.get_peak_current()
+        self.assertAlmostEqual(current, 3 * self.specs['current'])
+        # Shorter strings drop less voltage: "it is one" is the hottest
+        (dissipation, frame), = self.simulation.get_chip_peaks()
+        self.assertAlmostEqual(dissipation, self.specs['base_dissipation'] +
+                sum([ledstrings.get_channel_dissipation(leds, self.specs)
+                     for leds in (2, 2, 3)]))
+
+    def testOutput(self):
+        '''The CSV has a row per frame, the report the worst chip'''
+        file_ = StringIO.StringIO()
+        self.simulation.write_csv(file_)
+        rows = file_.getvalue().splitlines()
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1].split(',')[:2], ['00:00', '7'])
+        self.assertTrue('chip 00' in self.simulation.get_report())
+        self.assertEqual(powersim.format_time(3600 * 13 + 60 * 5), '13:05')
+
+class Precedence(unittest.TestCase):
+
+    '''
+    Test the DAG of the ordering constraints between elements.
+    '''
+
+    def setUp(self):
+        phrases = ['I have one dog', 'I have two cats']
+        self.seq = supseq.SuperSequence('I have one two banana dog cats',
+                                        phrases)
+        self.model = precedence.PrecedenceModel(self.seq)
+
+    def testQueries(self):
+        '''Swaps and ranges agree with the sanity check'''
+        model = self.model
+        self.assertTrue(model.must_precede(0, 5))
+        self.assertFalse(model.must_precede(2, 3))
+        for i in range(len(self.seq)):
+            for j in range(i + 1, len(self.seq)):
+                t = copy.deepcopy(self.seq)
+                t[i], t[j] = t[j], t[i]
+                self.assertEqual(model.can_swap(i, j), t.sanity_check())
+            self.assertEqual(model.get_range(i),
+                             self.seq.get_feasible_range(i))
+        orderings = list(model.iter_orderings())
+        self.assertEqual(orderings[0], tuple(range(len(self.seq))))
+        self.assertEqual(len(orderings), len(set(orderings)))
+        self.assertEqual(len(list(model.iter_orderings(limit=3))), 3)
+
+    def testUpdates(self):
+        '''The model follows the changes of the sequence'''
+        cats = self.seq[-1]
+        self.seq.shift_element(4, 'right')  # banana
+        self.assertEqual(self.model.get_range(cats), (4, 6))
+        self.seq.pop(6)
+        self.seq.insert_element(0, 'cats')
+        self.assertEqual(self.model.get_range(0), (0, 6))
+        self.model.detach()
+        self.seq.pop(0)
+        self.assertEqual(len(self.model.after), 7)
+
+    def testIncrementalUpdates(self):
+        '''Pops and merges give the bitsets of a model built from scratch'''
+        phrases = ['it is seven past one', 'it is even', 'it is often ten',
+                   'it is ten to seven', 'it is one past ten']
+        seq = supseq.SuperSequence('it is one seven even often past ten to '
+                                   'one seven ten past', phrases)
+        model = precedence.PrecedenceModel(seq)
+        changes = [lambda: seq.merge_elements(seq[3], seq[4]),  # seven, even
+                   lambda: seq.pop(3),  # the merged "seven"
+                   lambda: seq.pop(0)]  # no phrase can be displayed
+        for change in changes:
+            change()
+            fresh = precedence.PrecedenceModel(seq)
+            fresh.detach()
+            self.assertEqual(model.after, fresh.after)
+            self.assertEqual(model.before, fresh.before)
+        self.assertEqual(len(seq), 10)
+
+class Annealing(unittest.TestCase):
+
+    '''
+    Test the simulated annealing of a sequence.
+    '''
+
+    def setUp(self):
+        phrases = ['it is one', 'it is two', 'it is ten']
+        self.seq = supseq.SuperSequence('it one is one two ten ten', phrases)
+
+    def testAnneal(self):
+        '''Annealing shortens the sequence, keeping it sane'''
+        cost = annealing.get_cost(self.seq)
+        best, curve = annealing.anneal(self.seq, time_limit=0.5, chains=2,
+                                       processes=1)
+        self.assertTrue(best.sanity_check())
+        self.assertEqual(annealing.get_cost(best), curve[-1][1])
+        self.assertEqual(curve[-1][1], cost - 6)
+        self.assertEqual(curve, annealing.merge_curves([curve]))
+        self.assertTrue('Improvement: 6 chars' in
+                        annealing.get_curve_report(curve))
+        # The original sequence is left untouched
+        self.assertEqual(annealing.get_cost(self.seq), cost)
+        # Chains stop as soon as they reach the target
+        best, curve = annealing.anneal(self.seq, time_limit=10.0, chains=1,
+                                       target=cost)
+        self.assertEqual(curve, [(0.0, cost)])
+
+    def testMergeCurves(self):
+        '''Merged curves keep only the improvements of the best chain'''
+        curves = [[(0.0, 10), (0.5, 8)], [(0.0, 10), (0.2, 9), (0.7, 7)]]
+        self.assertEqual(annealing.merge_curves(curves),
+                         [(0.0, 10), (0.2, 9), (0.5, 8), (0.7, 7)])
+
+class LowerBound(unittest.TestCase):
+
+    '''
+    Test the lower bounds on the supersequence and the board.
+    '''
+
+    def testBounds(self):
+        '''Bounds account for repeated, contained and swapped words'''
+        # "one" twice, "even" inside "seven"
+        bound = lowerbound.LowerBound(phrasepool.PhrasePool(
+                ['one past seven', 'one to one', 'even']))
+        self.assertEqual((bound.elements, bound.chars), (5, 17))
+        seq = supseq.SuperSequence('one past to seven one', bound.pool)
+        self.assertEqual(annealing.get_cost(seq), bound.chars)
+        # "dog", "or" and "cats" are displayed in both orders: one pair
+        # with no common words, the longest extra element being "dog"
+        bound = lowerbound.LowerBound(phrasepool.PhrasePool(
+                ['my dog or cats', 'my cats or dog']))
+        self.assertEqual(len(bound.conflicts), 1)
+        self.assertEqual(bound.chars, 2 + 3 + 2 + 4 + 3)
+        self.assertEqual(bound.get_gap(bound.chars * 2), 100.0)
+
+    def testPanelSize(self):
+        '''Panels are the squarest ones hosting the chars'''
+        self.assertEqual(lowerbound.get_panel_size(16), (4, 4, 0))
+        self.assertEqual(lowerbound.get_panel_size(17), (5, 4, 3))
+        self.assertEqual(lowerbound.get_panel_size(21), (5, 5, 4))
+
 if __name__ == "__main__":
     unittest.main()
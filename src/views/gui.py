@@ -108,6 +108,7 @@ class Gui(gobject.GObject):
         # INIT VALUES AND STATUS!
         self.hours = 0
         self.minutes = 0
+        self.seconds = 0
         self.keep_sync = False
         self.__set_safe_mode(True)
 
@@ -172,8 +173,10 @@ class Gui(gobject.GObject):
         # Clock modules
         self.__populate_clock_modules_combo()
         # Clock resolution
-        self.resolution_entries = [1, 2, 3, 5, 10, 15, 20, 30 ,60]
-        preset = 0 if res == None else self.resolution_entries.index(res)
+        self.resolution_entries = ['1s', '5s', '15s', '30s',
+                                   1, 2, 3, 5, 10, 15, 20, 30 ,60]
+        res = 1 if res == None else res
+        preset = self.resolution_entries.index(res)
         self.__populate_combo(self.sttng_accuracy_combo,
                               self.resolution_entries, preset)
         # Clock approximation method
@@ -211,12 +214,12 @@ class Gui(gobject.GObject):
         if self.keep_sync == False:
             return False  #Remove this callback from the gtk main loop
         current_time = self.logic.get_current_time()
-        if (self.hours, self.minutes) != current_time:
-            self.hours, self.minutes = current_time
+        if (self.hours, self.minutes, self.seconds) != current_time:
+            self.hours, self.minutes, self.seconds = current_time
             self.hours_box.set_text(str(self.hours))
             self.minutes_box.set_text(str(self.minutes))
             self.update_text()
-            return True  #Keep the the callback in the main loop
+        return True  #Keep the the callback in the main loop
 
     def __show_vclock_elements(self, show):
         '''
@@ -255,7 +258,7 @@ class Gui(gobject.GObject):
                 menuitem.set_sensitive(True)
             self.__show_vclock_elements(False)
             self.update_text(reset=True)
-        elif self.logic.project.supersequence != None:
+        elif self.logic.project.has_supersequence():
             self.__show_vclock_elements(True)
 
     def __supersequence_heuristics_show_dialogue(self):
@@ -295,7 +298,7 @@ class Gui(gobject.GObject):
         # Safe mode?
         self.__set_safe_mode((True, False)[widget.is_populated()])
         # Make sense to display clockface editor and virtual clock?
-        if widget.supersequence == None:
+        if not widget.has_supersequence():
             self.__show_vclock_elements(False)
         # Always hide the dump window (it's a scratch pad, we really don't
         # know what's in it...
@@ -340,6 +343,7 @@ class Gui(gobject.GObject):
         if self.logic.project.is_unsaved():
             self.unsaved_changes_dialogue.show()
             return True
+        self.logic.project.stop_autosave()
         gtk.main_quit()
 
     def on_keep_in_sync_toggled(self, widget, data=None):
@@ -365,7 +369,9 @@ class Gui(gobject.GObject):
         Update the time phrase of the main window.
         '''
         if not reset:
-            phrase = self.logic.clock.get_time_phrase(self.hours, self.minutes)
+            time = (self.hours, self.minutes, self.seconds)
+            phrase = self.logic.clock.get_time_phrase(*time)
+            self.logic.update_vclock_time(*time)
         else:
             phrase = 'Chasy'
         self.output_text.set_text(phrase)
@@ -432,6 +438,8 @@ class Gui(gobject.GObject):
                                   self.update_clockface_stats)
         self.cface_editor_window.show()
         self.logic.generate_vclock(self.vclock_cface)
+        self.logic.update_vclock_time(self.hours, self.minutes,
+                                      self.seconds)
         self.logic.vclock.update()
 
 
@@ -461,6 +469,7 @@ class Gui(gobject.GObject):
         # trigger this method. But logic.cface is not yet set at this time,
         # hence the need for the exception handling.
         try:
+            self.logic.cface.history.checkpoint()
             self.logic.cface.adjust_display_params(int(widget.get_text()))
             self.logic.cface.display()
         except AttributeError:
@@ -532,7 +541,8 @@ class Gui(gobject.GObject):
             tmp = self.vclock_cface.allocation
             self.logic.vclock.refresh_params(max_pixel_dimension=min(tmp.width,
                                                                      tmp.height))
-            self.logic.vclock.update()
+            area = data.area
+            self.logic.vclock.expose((area.x, area.y, area.width, area.height))
         except AttributeError:
             pass
 